@@ -1,10 +1,20 @@
+import csv
 import json
-from flask import Flask, abort, request, jsonify, Blueprint, current_app
-from shared_models import Article, Checklist, DecisionGroup, GroupMembers, PlatformArticle, PlatformChecklist, PlatformChecklistQuestion, Review, User, db, ChecklistDecision, ChecklistAnswer, ChecklistQuestion
+from flask import Flask, Response, abort, request, jsonify, Blueprint, current_app
+from shared_models import Checklist, ChecklistStats, DecisionGroup, GroupMembers, PlatformChecklist, PlatformChecklistQuestion, Review, User, UserDecisionStats, db, ChecklistDecision, ChecklistAnswer, ChecklistQuestion
 from datetime import datetime as dt
 from sqlalchemy import func
 from flask_login import current_user,login_required
-from sqlalchemy import text  # 添加这行导入
+from answer_tally import question_types, rebuild_answer_tallies, record_answer_tallies, tally_summary, validate_answers
+from article_references import backfill_article_references, empty_references, get_resolver, insert_answers, insert_review_references, load_references
+from reference_counter import count_references, record_reference_increments
+from compactor import tombstone_checklists
+from decision_stats import rebuild_decision_stats, record_answers, record_checklists_deleted, record_decision_created, record_decision_deleted, record_review
+from group_events import group_events
+from group_membership import add_members, batched, invite_batch, iter_invite_records
+from pagination import keyset_page
+from utils import conditional_get, json_limits
+from question_graph import backfill_manifests, content_hash, copy_on_write, diff_checklist_versions, load_version_questions, persist_question_graph, shared_question_ids
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
@@ -20,17 +30,17 @@ def get_checklists():
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 10, type=int)
 
-    # 查询主版本清单并统计每个清单的决定数量
+    # 查询主版本清单，决定数量直接读取统计表
     query = db.session.query(
         Checklist.id,
         Checklist.name,
         Checklist.description,
         Checklist.share_status,
         Checklist.version,
-        func.count(ChecklistDecision.id).label('decision_count')  # 统计决定数量
-    ).outerjoin(ChecklistDecision, ChecklistDecision.checklist_id == Checklist.id)  # 使用外连接避免漏掉没有决定的清单
+        func.coalesce(ChecklistStats.decision_count, 0).label('decision_count')
+    ).outerjoin(ChecklistStats, ChecklistStats.checklist_id == Checklist.id)  # 使用外连接避免漏掉没有决定的清单
     query = query.filter(Checklist.parent_id == None, Checklist.user_id == current_user.id)
-    query = query.group_by(Checklist.id).order_by(Checklist.created_at.desc())
+    query = query.order_by(Checklist.created_at.desc())
     
     # 分页处理
     paginated_checklists = query.paginate(page=page, per_page=page_size, error_out=False)
@@ -56,9 +66,9 @@ def get_checklists():
             Checklist.version,
             Checklist.description,
             Checklist.share_status,
-            func.count(ChecklistDecision.id).label('decision_count')  # 统计子版本的决定数量
-        ).outerjoin(ChecklistDecision, ChecklistDecision.checklist_id == Checklist.id)
-        child_checklists = child_checklists.filter(Checklist.parent_id == checklist.id).group_by(Checklist.id).all()
+            func.coalesce(ChecklistStats.decision_count, 0).label('decision_count')  # 子版本的决定数量
+        ).outerjoin(ChecklistStats, ChecklistStats.checklist_id == Checklist.id)
+        child_checklists = child_checklists.filter(Checklist.parent_id == checklist.id).all()
 
         # 将子版本添加到主版本中
         for child in child_checklists:
@@ -194,91 +204,21 @@ def handle_clone_checklist():
         return jsonify({"error": f"Cloning failed: {str(e)}"}), 500
 
 def clone_questions(checklist_id, platform_questions):
-    # 准备批量插入数据
-    questions_to_create = []
-    id_mapping = {}  # 原始ID -> 新ID索引
-    parent_mapping = {}  # 新ID索引 -> 原始父ID
-    follow_up_mapping = {}  # 原始问题ID -> follow_up_questions
-
-    # 收集问题数据和关系
+    # 以原始问题ID作为节点 key，父关系和 follow_up 关系在插入前即映射为新ID
+    nodes = []
     for question in platform_questions:
-        # 记录原始问题ID对应的索引位置
-        orig_id = question.id
-        idx = len(questions_to_create)
-        id_mapping[orig_id] = idx
-        
-        # 记录父关系（如果有）
-        if question.parent_id:
-            parent_mapping[idx] = question.parent_id
-        
-        # 记录follow_up关系（如果有）
-        if question.follow_up_questions:
-            follow_up_mapping[orig_id] = question.follow_up_questions
-        
-        # 准备问题数据
-        question_data = {
-            'checklist_id': checklist_id,
+        nodes.append({
+            'key': question.id,
+            'parent_key': question.parent_id,
+            'follow_ups': question.follow_up_questions or {},
             'type': question.type,
             'question': question.question,
             'description': question.description,
             'options': question.options.copy() if question.options else None
-        }
-        questions_to_create.append(question_data)
-    
-    # 批量插入问题
-    db.session.bulk_insert_mappings(ChecklistQuestion, questions_to_create)
-    db.session.flush()
-    
-    # 获取批量生成的ID（MySQL版本）
-    result = db.session.execute(text("SELECT LAST_INSERT_ID()"))
-    first_id = result.scalar()
-    
-    # 计算所有生成的ID
-    question_ids = [first_id + i for i in range(len(questions_to_create))]
-    
+        })
+
     # 构建真实ID映射 {原始ID: 新ID}
-    real_id_mapping = {}
-    for orig_id, idx in id_mapping.items():
-        real_id_mapping[orig_id] = question_ids[idx]
-    
-    # 批量更新父关系
-    parent_updates = []
-    for idx, parent_orig_id in parent_mapping.items():
-        if parent_orig_id in real_id_mapping:
-            parent_updates.append({
-                'id': question_ids[idx],
-                'parent_id': real_id_mapping[parent_orig_id]
-            })
-    
-    if parent_updates:
-        db.session.bulk_update_mappings(ChecklistQuestion, parent_updates)
-    
-    # 批量更新follow-up关系
-    follow_up_updates = []
-    for orig_id, follow_dict in follow_up_mapping.items():
-        if orig_id not in real_id_mapping:
-            continue
-            
-        new_question_id = real_id_mapping[orig_id]
-        processed_follow_ups = {}
-        
-        for opt_index, child_ids in follow_dict.items():
-            # 映射每个子问题的ID
-            new_child_ids = [real_id_mapping[child_id] for child_id in child_ids 
-                           if child_id in real_id_mapping]
-            if new_child_ids:
-                processed_follow_ups[opt_index] = new_child_ids
-        
-        if processed_follow_ups:
-            follow_up_updates.append({
-                'id': new_question_id,
-                'follow_up_questions': processed_follow_ups
-            })
-    
-    if follow_up_updates:
-        db.session.bulk_update_mappings(ChecklistQuestion, follow_up_updates)
-    
-    return real_id_mapping
+    return persist_question_graph(checklist_id, nodes)
 
 @checklist_bp.route('/checklists/<int:checklist_id>/share', methods=['POST'])
 @login_required
@@ -317,8 +257,8 @@ def get_checklist_details(checklist_id):
     if not current_user.id==checklist.user_id:
         return jsonify({'error': 'You are not allowed to access this Checklist'}), 403
 
-    # 获取最新版本的 ChecklistQuestion
-    questions = ChecklistQuestion.query.filter_by(checklist_id=checklist_id).all()
+    # 获取该版本的 ChecklistQuestion
+    questions = load_version_questions(checklist_id)
     questions_data = [{'id': question.id,'type':question.type, 'question': question.question, 'description': question.description,'options': question.options,'follow_up_questions': question.follow_up_questions,'parent_id': question.parent_id} for question in questions]
 
 
@@ -357,7 +297,7 @@ def get_latest_checklist_details(checklist_id):
     latest_version = versions[0]  # 因为已按版本降序排序，第一个即为最新版本
 
     # 获取最新版本的 ChecklistQuestion
-    questions = ChecklistQuestion.query.filter_by(checklist_id=latest_version.id).all()
+    questions = load_version_questions(latest_version.id)
     questions_data = [{'id': question.id,'type':question.type, 'question': question.question, 'description': question.description,'options': question.options,'follow_up_questions': question.follow_up_questions,'parent_id': question.parent_id} for question in questions]
 
     # 版本信息数据
@@ -373,7 +313,33 @@ def get_latest_checklist_details(checklist_id):
         'versions': versions_data
     }), 200
 
+@checklist_bp.route('/checklists/<int:from_id>/diff/<int:to_id>', methods=['GET'])
+@login_required
+def get_checklist_version_diff(from_id, to_id):
+    """
+    返回同一清单两个版本之间的结构差异：新增、删除、修改的问题，以及选项关联和父问题的变化。
+    新增的问题和关联使用 to 版本的问题ID，删除的使用 from 版本的问题ID。
+    """
+    versions = {checklist.id: checklist for checklist in Checklist.query.filter(Checklist.id.in_([from_id, to_id])).all()}
+    from_checklist, to_checklist = versions.get(from_id), versions.get(to_id)
+    if from_checklist is None or to_checklist is None:
+        return jsonify({'error': 'Checklist not found'}), 404
+    if from_checklist.user_id != current_user.id or to_checklist.user_id != current_user.id:
+        return jsonify({'error': 'You are not allowed to access this Checklist'}), 403
+    # 只允许比较同一清单的不同版本
+    if (from_checklist.parent_id or from_checklist.id) != (to_checklist.parent_id or to_checklist.id):
+        return jsonify({'error': 'Checklists are not versions of the same checklist'}), 400
+
+    diff = diff_checklist_versions(from_checklist, to_checklist)
+
+    return jsonify({
+        'from': {'id': from_checklist.id, 'version': from_checklist.version},
+        'to': {'id': to_checklist.id, 'version': to_checklist.version},
+        **diff
+    }), 200
+
 @checklist_bp.route('/platform_checklists/<int:checklist_id>', methods=['GET'])
+@conditional_get()
 def get_platform_checklist_details(checklist_id):
     """
     获取指定 Checklist 的详细信息。
@@ -439,6 +405,7 @@ def get_latest_platform_checklist_details(checklist_id):
     
 @checklist_bp.route('/save_checklist_answers', methods=['POST'])
 @login_required
+@json_limits(max_bytes=512 * 1024, max_depth=8, max_array_length=200)
 def save_checklist_answers():
     """
     做决定
@@ -449,8 +416,18 @@ def save_checklist_answers():
     decision_name = data.get('decision_name')
     description = data.get('description')
     final_decision = data.get('final_decision')
-    answers = data.get('answers')
+    answers = data.get('answers') or []
+
+    # 先校验全部回答，避免校验失败时留下半份决策
+    if db.session.query(Checklist.id).filter(Checklist.id == checklist_id).first() is None:
+        return jsonify({'error': 'Checklist not found'}), 404
+    types = question_types(checklist_id)
+    error = validate_answers(answers, types)
+    if error:
+        return jsonify({'error': error}), 400
+
     try:
+        # 决策、回答和引用计数在同一个事务中写入
         checklist_decision = ChecklistDecision(
             checklist_id=checklist_id,
             user_id=current_user.id,
@@ -459,43 +436,19 @@ def save_checklist_answers():
             final_decision=final_decision
         )
         db.session.add(checklist_decision)
-        db.session.commit()
+        db.session.flush()  # 获取决策ID但不提交
 
-        for answer in answers:
-            question_id = answer.get('question_id')
-            answer_text = answer.get('answer')
-            referenced_articles = answer.get('referenced_articles', [])
-            referenced_platform_articles = answer.get('referenced_platform_articles', [])
-            if not question_id or not answer_text:
-                return jsonify({'error': 'Invalid answer data'}), 400
+        # 多行 INSERT 写入全部回答及其引用关系，并更新计票
+        insert_answers(checklist_decision.id, current_user.id, answers)
+        record_answer_tallies(checklist_decision, current_user.id, answers, types)
+        record_decision_created(checklist_decision, len(answers))
+
+        # 汇总引用次数，提交后由写回缓冲批量更新
+        record_reference_increments(
+            count_references(answers, 'referenced_articles'),
+            count_references(answers, 'referenced_platform_articles')
+        )
 
-            answer_record = ChecklistAnswer(
-                checklist_decision_id=checklist_decision.id,
-                user_id=current_user.id,
-                question_id=question_id,
-                answer=answer_text,
-                referenced_articles=','.join(map(str, referenced_articles)),
-                referenced_platform_articles=','.join(map(str, referenced_platform_articles))
-            )
-            db.session.add(answer_record)
-            # 增加引用文章的引用计数
-            # 批量原子更新引用计数
-            if referenced_articles:
-                db.session.query(Article).filter(
-                    Article.id.in_(referenced_articles)
-                ).update(
-                    {"reference_count": Article.reference_count + 1},
-                    synchronize_session=False
-                )
-
-            if referenced_platform_articles:
-                db.session.query(PlatformArticle).filter(
-                    PlatformArticle.id.in_(referenced_platform_articles)
-                ).update(
-                    {"reference_count": PlatformArticle.reference_count + 1},
-                    synchronize_session=False
-                )       
-        
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -503,70 +456,103 @@ def save_checklist_answers():
         return jsonify({"error": f"save checklist answers failed: {str(e)}"}), 500
     return jsonify({'message': 'Checklist answers saved successfully'}), 200
 
+def decision_listing(query, serialize, items_key):
+    """
+    决策列表分页：请求带 cursor 参数时按 (created_at, id) 键集分页，返回 next_cursor；
+    否则保持原有的页码分页。
+    """
+    page_size = request.args.get('page_size', 10, type=int)
+    if 'cursor' in request.args:
+        try:
+            rows, next_cursor = keyset_page(query, ChecklistDecision.created_at, ChecklistDecision.id,
+                                            request.args.get('cursor'), page_size)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({items_key: [serialize(row) for row in rows], 'next_cursor': next_cursor}), 200
+
+    page = request.args.get('page', 1, type=int)
+    paginated = query.order_by(ChecklistDecision.created_at.desc(), ChecklistDecision.id.desc()).paginate(page=page, per_page=page_size, error_out=False)
+    return jsonify({
+        items_key: [serialize(row) for row in paginated.items],
+        'total_pages': paginated.pages,
+        'current_page': paginated.page,
+        'total_items': paginated.total
+    }), 200
+
 @checklist_bp.route('/checklist_answers', methods=['GET'])
 @login_required
 def get_user_checklist_answers():
-    page = request.args.get('page', 1, type=int)
-    page_size = request.args.get('page_size', 10, type=int)
-    checklist_decisions = ChecklistDecision.query.filter_by(user_id=current_user.id).order_by(ChecklistDecision.created_at.desc()).paginate(page=page, per_page=page_size, error_out=False)
-    user_answers = []
-    for decision in checklist_decisions:
-        checklist = Checklist.query.get(decision.checklist_id)
-        user_answers.append({
-            'decision_id': decision.id,
-            'decision_name': decision.decision_name,
-            'version': checklist.version,
-            'created_at': decision.created_at,
-            'final_decision': decision.final_decision
-        })
-    return jsonify({'checklistDecisions':user_answers,
-                    'total_pages': checklist_decisions.pages,
-        'current_page': checklist_decisions.page,
-        'total_items': checklist_decisions.total}), 200
+    # 清单版本随决策一次 JOIN 取回
+    query = db.session.query(
+        ChecklistDecision.id,
+        ChecklistDecision.decision_name,
+        ChecklistDecision.created_at,
+        ChecklistDecision.final_decision,
+        Checklist.version
+    ).join(
+        Checklist, Checklist.id == ChecklistDecision.checklist_id
+    ).filter(ChecklistDecision.user_id == current_user.id)
+
+    return decision_listing(query, lambda decision: {
+        'decision_id': decision.id,
+        'decision_name': decision.decision_name,
+        'version': decision.version,
+        'created_at': decision.created_at,
+        'final_decision': decision.final_decision
+    }, 'checklistDecisions')
 
 @checklist_bp.route('/invited_checklist_decisions', methods=['GET'])
 @login_required
 def get_invited_checklist_decisions():
-    page = request.args.get('page', 1, type=int)
-    page_size = request.args.get('page_size', 10, type=int)
-    
-    # Query for checklist decisions where current user is an invitee in a decision group
-    invited_decisions = ChecklistDecision.query.join(
+    # Query for checklist decisions where current user is an invitee in a decision group,
+    # fetching checklist version and owner username in the same statement
+    query = db.session.query(
+        ChecklistDecision.id,
+        ChecklistDecision.decision_name,
+        ChecklistDecision.description,
+        ChecklistDecision.created_at,
+        ChecklistDecision.user_id,
+        Checklist.version,
+        User.username.label('owner_username')
+    ).join(
         DecisionGroup,
         DecisionGroup.checklist_decision_id == ChecklistDecision.id
     ).join(
         GroupMembers,
         GroupMembers.group_id == DecisionGroup.id
     ).join(
-        User,  # Add join with User table for owner info
+        User,
         ChecklistDecision.user_id == User.id
+    ).join(
+        Checklist,
+        Checklist.id == ChecklistDecision.checklist_id
     ).filter(
         GroupMembers.user_id == current_user.id,
         GroupMembers.role == 'invitee'
-    ).order_by(
-        ChecklistDecision.created_at.desc()
-    ).paginate(page=page, per_page=page_size, error_out=False)
-    
-    invited_list = []
-    for decision in invited_decisions:
-        checklist = Checklist.query.get(decision.checklist_id)
-        invited_list.append({
-            'decision_id': decision.id,
-            'decision_name': decision.decision_name,
-            'description': decision.description,
-            'created_at': decision.created_at,
-            'version': checklist.version if checklist else None,
-            'owner_id': decision.user_id,
-            'owner_username': decision.user.username
-        })
-    
+    )
+
+    return decision_listing(query, lambda decision: {
+        'decision_id': decision.id,
+        'decision_name': decision.decision_name,
+        'description': decision.description,
+        'created_at': decision.created_at,
+        'version': decision.version,
+        'owner_id': decision.user_id,
+        'owner_username': decision.owner_username
+    }, 'invitedChecklistDecisions')
+
+@checklist_bp.route('/checklist_answers/stats', methods=['GET'])
+@login_required
+def get_user_decision_stats():
+    """当前用户的决策统计（仪表盘），直接读取统计表"""
+    stats = UserDecisionStats.query.get(current_user.id)
     return jsonify({
-        'invitedChecklistDecisions': invited_list,
-        'total_pages': invited_decisions.pages,
-        'current_page': invited_decisions.page,
-        'total_items': invited_decisions.total
+        'decision_count': stats.decision_count if stats else 0,
+        'answer_count': stats.answer_count if stats else 0,
+        'review_count': stats.review_count if stats else 0,
+        'last_activity_at': stats.last_activity_at if stats else None
     }), 200
-    
+
 @checklist_bp.route('/checklist_answers/details/<int:decision_id>', methods=['GET'])
 @login_required
 def get_checklist_decision_details(decision_id):
@@ -574,9 +560,13 @@ def get_checklist_decision_details(decision_id):
     decision = ChecklistDecision.query.get_or_404(decision_id)
     if decision.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized access'}), 403
+    # 清单已删除但决策尚未被压缩任务清理时按不存在处理
+    version = db.session.query(Checklist.version).filter(Checklist.id == decision.checklist_id).scalar()
+    if version is None:
+        return jsonify({'error': 'Checklist not found'}), 404
 
     # 获取所有问题，并构造字典
-    questions = ChecklistQuestion.query.filter_by(checklist_id=decision.checklist_id).all()
+    questions = load_version_questions(decision.checklist_id)
     questions_dict = {question.id: question for question in questions}
 
     # 获取决策组信息
@@ -588,38 +578,27 @@ def get_checklist_decision_details(decision_id):
 
     # 获取所有回答，包括每个回答的用户和引用文章信息
     answers = ChecklistAnswer.query.filter_by(checklist_decision_id=decision.id).all()
+    # 一次 JOIN 取回全部回答的引用文章，一次 IN 查询取回全部回答者
+    references = load_references(decision.id, 'answer')
+    usernames = get_resolver().usernames(answer.user_id for answer in answers)
 
     for answer in answers:
-        print(f"Fetching user for user_id: {answer.user_id}")  # 调试用
-        referenced_article_ids = answer.referenced_articles.split(',') if answer.referenced_articles else []
-        referenced_platform_article_ids = answer.referenced_platform_articles.split(',') if answer.referenced_platform_articles else []
-        # 查询引用文章（如果存在）
-        referenced_articles_data = []
-        if referenced_article_ids:
-            referenced_articles = Article.query.filter(Article.id.in_(referenced_article_ids)).all()
-            referenced_articles_data = [{'id': article.id, 'title': article.title} for article in referenced_articles]
-
-        referenced_platform_articles_data = []
-        if referenced_platform_article_ids:
-            referenced_platform_articles = PlatformArticle.query.filter(PlatformArticle.id.in_(referenced_platform_article_ids)).all()
-            referenced_platform_articles_data = [{'id': article.id, 'title': article.title} for article in referenced_platform_articles]
-        # 获取回答者信息
-        user = User.query.get(answer.user_id)
+        answer_references = references.get(answer.id, empty_references())
 
         # 按问题 ID 聚合不同用户的回答
         answers_data[answer.question_id].append({
             'user_id': answer.user_id,
-            'username': user.username,
+            'username': usernames.get(answer.user_id),
             'answer': answer.answer,
-            'referenced_articles': referenced_articles_data,
-            'referenced_platform_articles':referenced_platform_articles_data
+            'referenced_articles': answer_references['referenced_articles'],
+            'referenced_platform_articles': answer_references['referenced_platform_articles']
         })
 
     # 构建决策详情返回数据
     decision_details = {
         'decision_name': decision.decision_name,
         'description':decision.description,
-        'version': Checklist.query.get(decision.checklist_id).version,
+        'version': version,
         'created_at': decision.created_at,
         'final_decision': decision.final_decision,
         'answers': [{'question': questions_dict[q_id].question,'type':questions_dict[q_id].type,'options':questions_dict[q_id].options, 'responses': responses} for q_id, responses in answers_data.items()],
@@ -657,7 +636,7 @@ def get_invited_checklist_decision_details(decision_id):
     decision = ChecklistDecision.query.get_or_404(decision_id)
     
     # Get all questions for the checklist
-    questions = ChecklistQuestion.query.filter_by(checklist_id=decision.checklist_id).all()
+    questions = load_version_questions(decision.checklist_id)
     questions_dict = {question.id: question for question in questions}
 
     # Initialize answer structure
@@ -668,27 +647,17 @@ def get_invited_checklist_decision_details(decision_id):
         checklist_decision_id=decision.id,
         user_id=current_user.id
     ).all()
+    # Fetch referenced article titles for all answers in one JOIN
+    references = load_references(decision.id, 'answer', [answer.id for answer in answers])
 
     for answer in answers:
-        # Process referenced articles
-        referenced_article_ids = answer.referenced_articles.split(',') if answer.referenced_articles else []
-        referenced_platform_article_ids = answer.referenced_platform_articles.split(',') if answer.referenced_platform_articles else []
-        
-        referenced_articles_data = []
-        if referenced_article_ids:
-            referenced_articles = Article.query.filter(Article.id.in_(referenced_article_ids)).all()
-            referenced_articles_data = [{'id': article.id, 'title': article.title} for article in referenced_articles]
-
-        referenced_platform_articles_data = []
-        if referenced_platform_article_ids:
-            referenced_platform_articles = PlatformArticle.query.filter(PlatformArticle.id.in_(referenced_platform_article_ids)).all()
-            referenced_platform_articles_data = [{'id': article.id, 'title': article.title} for article in referenced_platform_articles]
+        answer_references = references.get(answer.id, empty_references())
 
         # Store the answer data
         answers_data[answer.question_id] = {
             'answer': answer.answer,
-            'referenced_articles': referenced_articles_data,
-            'referenced_platform_articles': referenced_platform_articles_data
+            'referenced_articles': answer_references['referenced_articles'],
+            'referenced_platform_articles': answer_references['referenced_platform_articles']
         }
 
     # Build response
@@ -696,7 +665,7 @@ def get_invited_checklist_decision_details(decision_id):
         'decision_name': decision.decision_name,
         'description': decision.description,
         'owner_id': decision.user_id,
-        'owner_username': decision.user.username,
+        'owner_username': get_resolver().usernames([decision.user_id]).get(decision.user_id),
         'answers': [{
             'question': questions_dict[q_id].question,
             'type': questions_dict[q_id].type,
@@ -716,15 +685,9 @@ def delete_checklist_decision(id):
     if decision.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized access'}), 403
     try:
-        # 删除与 decision 相关联的 review 记录
-        Review.query.filter_by(decision_id=id).delete()
-
-        # 删除与 decision 相关联的 checklist answers 记录
-        ChecklistAnswer.query.filter_by(checklist_decision_id=id).delete()
-
-        # 删除 checklist decision 本身
-        db.session.delete(decision)
-        
+        # 软删除，decision 及其引用关系、review、answers 和决策组由后台压缩任务物理删除
+        record_decision_deleted(decision)
+        decision.soft_delete()
         db.session.commit()
         return jsonify({'message': 'Decision, associated reviews, and answers deleted successfully'}), 200
     except Exception as e:
@@ -751,6 +714,7 @@ def validate_question_count(questions, max_count=100):
 
 @checklist_bp.route('/checklists', methods=['POST'])
 @login_required
+@json_limits(max_bytes=1024 * 1024, max_depth=32, max_array_length=100)  # 与 validate_question_count 的 100 个问题一致
 def create_checklist():
     data = request.get_json()
     name = data.get('name')
@@ -808,93 +772,46 @@ def create_checklist():
         current_app.logger.error(f"Checklist creation failed: {str(e)}", exc_info=True)
         return jsonify({"error": f"Checklist creation failed: {str(e)}"}), 500
 
-def process_questions(checklist_id, questions):
+def process_questions(checklist_id, questions, base_checklist_id=None):
     if not questions:
         return {}
 
-    # 准备批量插入数据
-    questions_to_create = []
-    id_mapping = {}  # tempId -> index
-    parent_mapping = {}  # index -> parentTempId
-    follow_up_data = {}  # tempId -> followUpQuestions
-
+    # 构建问题图节点，没有 tempId 的问题使用内部 key，不参与ID映射
+    nodes = []
+    temp_ids = set()
     for idx, item in enumerate(questions):
-        question_data = {
-            'checklist_id': checklist_id,
+        key = str(item['tempId']) if 'tempId' in item else ('#', idx)
+        if 'tempId' in item:
+            temp_ids.add(key)
+
+        follow_ups = {}
+        if item.get('type') == 'choice' and 'followUpQuestions' in item:
+            for opt_index, follow_ids in item['followUpQuestions'].items():
+                if isinstance(follow_ids, list):
+                    follow_ups[opt_index] = [str(id) for id in follow_ids]
+                else:
+                    follow_ups[opt_index] = [str(follow_ids)]
+
+        nodes.append({
+            'key': key,
+            'parent_key': str(item['parentTempId']) if 'parentTempId' in item else None,
+            'follow_ups': follow_ups,
             'type': item.get('type', 'text'),
             'question': item.get('question', ''),
             'description': item.get('description', ''),
             'options': item.get('options') if item.get('type') == 'choice' else None
-        }
-        questions_to_create.append(question_data)
-        
-        if 'tempId' in item:
-            id_mapping[str(item['tempId'])] = idx
-        
-        if 'parentTempId' in item:
-            parent_mapping[idx] = str(item['parentTempId'])
-        
-        if item.get('type') == 'choice' and 'followUpQuestions' in item:
-            follow_up_data[str(item['tempId'])] = item['followUpQuestions']
-    
-    # 批量插入问题
-    db.session.bulk_insert_mappings(ChecklistQuestion, questions_to_create)
-    db.session.flush()
-    
-    # 获取批量生成的ID
-    first_id = db.session.execute(
-        text("SELECT LAST_INSERT_ID() ")
-    ).scalar()
-    question_ids = [first_id + i for i in range(len(questions_to_create))]
-    
-    # 构建真实ID映射
-    real_id_mapping = {}
-    for temp_id, idx in id_mapping.items():
-        real_id_mapping[temp_id] = question_ids[idx]
-    
-    # 更新父关系
-    parent_updates = []
-    for idx, parent_temp_id in parent_mapping.items():
-        if parent_temp_id in real_id_mapping:
-            parent_updates.append({
-                'id': question_ids[idx],
-                'parent_id': real_id_mapping[parent_temp_id]
-            })
-    
-    if parent_updates:
-        db.session.bulk_update_mappings(ChecklistQuestion, parent_updates)
-    
-    # 更新follow-up关系
-    follow_up_updates = []
-    for temp_id, follow_dict in follow_up_data.items():
-        if temp_id not in real_id_mapping:
-            continue
-            
-        question_id = real_id_mapping[temp_id]
-        processed_follow_ups = {}
-        
-        for opt_index, follow_ids in follow_dict.items():
-            if isinstance(follow_ids, list):
-                real_ids = [real_id_mapping[str(id)] for id in follow_ids if str(id) in real_id_mapping]
-                if real_ids:
-                    processed_follow_ups[opt_index] = real_ids
-            elif follow_ids in real_id_mapping:
-                processed_follow_ups[opt_index] = [real_id_mapping[follow_ids]]
-        
-        if processed_follow_ups:
-            follow_up_updates.append({
-                'id': question_id,
-                'follow_up_questions': processed_follow_ups
-            })
-    
-    if follow_up_updates:
-        db.session.bulk_update_mappings(ChecklistQuestion, follow_up_updates)
-    
-    return real_id_mapping
+        })
+
+    # 与基础版本内容相同的问题直接复用，不再重复写入
+    key_to_id = persist_question_graph(checklist_id, nodes, base_checklist_id)
+
+    # 构建真实ID映射 {tempId: 新ID}
+    return {key: question_id for key, question_id in key_to_id.items() if key in temp_ids}
         
 @checklist_bp.route('/checklists/<int:id>', methods=['PUT'])
 @login_required
 @limiter_current_user.limit("10 per minute")  # 每个用户每分钟最多10次更新
+@json_limits(max_bytes=1024 * 1024, max_depth=32, max_array_length=100)
 def update_checklist(id):
     data = request.get_json()
     questions = data.get('questions', [])
@@ -937,7 +854,7 @@ def update_checklist(id):
         if questions:
             try:
                 with db.session.begin_nested():
-                    id_mapping = process_questions(new_checklist.id, questions)
+                    id_mapping = process_questions(new_checklist.id, questions, latest_checklist.id)
             except Exception as e:
                 current_app.logger.error(f"Question processing failed: {str(e)}", exc_info=True)
                 # 回滚问题创建，但保留检查表主体
@@ -961,6 +878,7 @@ def update_checklist(id):
 @checklist_bp.route('/checklists/<int:id>/edit', methods=['PATCH'])
 @login_required
 @limiter_current_user.limit("5 per minute")  # 每个用户每分钟最多10次更新
+@json_limits(max_bytes=1024 * 1024, max_depth=32, max_array_length=100)
 def edit_checklist(id):
     data = request.get_json()
     
@@ -987,6 +905,8 @@ def edit_checklist(id):
             questions = data.get('questions', [])
             if questions:
                 update_existing_questions(checklist.id, questions)
+                # 问题变化不一定修改清单行，显式刷新版本时间戳使问题图缓存失效
+                checklist.updated_at = dt.utcnow()
             
             db.session.add(checklist)
         
@@ -1017,27 +937,50 @@ def update_existing_questions(checklist_id, questions_data):
     if not question_updates:
         return
     
-    # 获取所有需要更新的问题
+    # 获取本版本中需要更新的问题
+    version_question_ids = {question.id for question in load_version_questions(checklist_id)}
     existing_questions = ChecklistQuestion.query.filter(
-        ChecklistQuestion.checklist_id == checklist_id,
-        ChecklistQuestion.id.in_(question_updates.keys())
+        ChecklistQuestion.id.in_([question_id for question_id in question_updates if question_id in version_question_ids])
     ).all()
+    # 被其他版本共享的问题行不能原地修改
+    shared_ids = shared_question_ids(checklist_id, [question.id for question in existing_questions])
+    replacements = {}
     
     # 逐个更新问题
     for question in existing_questions:
         update_data = question_updates.get(question.id)
         if update_data:
-            question.question = update_data['question'] or question.question
-            question.description = update_data['description'] or question.description
+            new_question = update_data['question'] or question.question
+            new_description = update_data['description'] or question.description
+            new_options = question.options
             
             # 只更新选项内容，不改变选项结构
             if question.type == 'choice' and update_data['options']:
                 # 确保选项数量不变，只更新文本
                 if len(update_data['options']) == len(question.options or []):
-                    question.options = update_data['options']
-            
+                    new_options = update_data['options']
+
+            if (new_question, new_description, new_options) == (question.question, question.description, question.options):
+                continue
+
+            if question.id in shared_ids:
+                # 写时复制：为本版本创建新问题行
+                replacements[question.id] = {
+                    'type': question.type,
+                    'question': new_question,
+                    'description': new_description,
+                    'options': new_options
+                }
+                continue
+
+            question.question = new_question
+            question.description = new_description
+            question.options = new_options
+            question.content_hash = content_hash(question.type, new_question, new_description, new_options)
             db.session.add(question)
 
+    copy_on_write(checklist_id, replacements)
+
                 
 @checklist_bp.route('/reviews', methods=['POST'])
 @login_required
@@ -1045,38 +988,29 @@ def create_review():
     data = request.get_json()
     decision_id = data.get('decision_id')
     content = data.get('content')
-    referenced_articles = data.get('referenced_articles', [])
-    referenced_platform_articles = data.get('referenced_platform_articles', [])
 
     if not decision_id or not content:
         return jsonify({'error': 'Invalid review data'}), 400
+    decision = ChecklistDecision.query.get(decision_id)
+    if not decision:
+        return jsonify({'error': 'Decision not found'}), 404
 
     try:
         # 创建Review记录
         review = Review(
             decision_id=decision_id,
-            content=content,
-            referenced_articles=','.join(map(str, referenced_articles)),
-            referenced_platform_articles=','.join(map(str, referenced_platform_articles))
+            content=content
         )
         db.session.add(review)
-
-        # 原子更新引用计数（方案1）
-        if referenced_articles:
-            db.session.query(Article).filter(
-                Article.id.in_(referenced_articles)
-            ).update(
-                {'reference_count': Article.reference_count + 1},
-                synchronize_session=False
-            )
-        
-        if referenced_platform_articles:
-            db.session.query(PlatformArticle).filter(
-                PlatformArticle.id.in_(referenced_platform_articles)
-            ).update(
-                {'reference_count': PlatformArticle.reference_count + 1},
-                synchronize_session=False
-            )
+        db.session.flush()  # 获取复盘ID用于写入引用关系
+        insert_review_references(review, data)
+        record_review(decision)
+
+        # 登记引用计数增量，提交后由写回缓冲批量更新
+        record_reference_increments(
+            count_references([data], 'referenced_articles'),
+            count_references([data], 'referenced_platform_articles')
+        )
 
         db.session.commit()
         return jsonify({'message': 'Review created successfully', 'review_id': review.id}), 201
@@ -1090,29 +1024,16 @@ def create_review():
 def get_reviews(decision_id):
     reviews = Review.query.filter_by(decision_id=decision_id).all()
     reviews_data = []
+    # 一次 JOIN 取回全部复盘的引用文章
+    references = load_references(decision_id, 'review')
 
     for review in reviews:
-        # 获取引用的文章 ID 列表
-        referenced_article_ids = []
-        if review.referenced_articles:
-            referenced_article_ids = [int(id) for id in review.referenced_articles.split(',') if id.isdigit()]
-        referenced_platform_article_ids = []
-        if review.referenced_platform_articles:
-            referenced_platform_article_ids = [int(id) for id in review.referenced_platform_articles.split(',') if id.isdigit()]
-
-
-        # 查询引用的文章
-        referenced_articles = Article.query.filter(Article.id.in_(referenced_article_ids)).all() if referenced_article_ids else []
-        referenced_platform_articles = PlatformArticle.query.filter(PlatformArticle.id.in_(referenced_platform_article_ids)).all()  if referenced_platform_article_ids else []
-
-        # 构造引用文章的 ID 和标题
-        referenced_articles_data = [{'id': article.id, 'title': article.title} for article in referenced_articles]
-        referenced_platform_articles_data = [{'id': article.id, 'title': article.title} for article in referenced_platform_articles]
+        review_references = references.get(review.id, empty_references())
 
         reviews_data.append({
             'content': review.content,
-            'referenced_articles': referenced_articles_data,
-            'referenced_platform_articles':referenced_platform_articles_data,
+            'referenced_articles': review_references['referenced_articles'],
+            'referenced_platform_articles': review_references['referenced_platform_articles'],
             'created_at': review.created_at
         })
 
@@ -1123,6 +1044,7 @@ def get_reviews(decision_id):
 def delete_checklist_with_children(checklist_id):
     """
     删除父版本及其所有子版本，以及关联的 ChecklistQuestion、ChecklistAnswer、ChecklistDecision 和 Review 数据。
+    请求内只写入删除标记，关联数据由后台压缩任务物理删除。
     """
     checklist = Checklist.query.get_or_404(checklist_id)
     
@@ -1132,18 +1054,10 @@ def delete_checklist_with_children(checklist_id):
     if checklist.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized access'}), 403    
     try:
-        # 先找到所有子版本(不包含父版本)
-        child_versions = Checklist.query.filter_by(parent_id=checklist_id).all()
-        
-        # 先删除所有子版本及其关联数据
-        for child in child_versions:
-            delete_related_data(child.id)
-            db.session.delete(child)
-        
-        # 再删除父版本及其关联数据
-        delete_related_data(checklist_id)
-        db.session.delete(checklist)
-
+        # 父版本及其所有子版本
+        checklist_ids = [checklist_id] + [child.id for child in db.session.query(Checklist.id).filter_by(parent_id=checklist_id).all()]
+        record_checklists_deleted(checklist.user_id, checklist_ids)
+        tombstone_checklists(checklist_ids)
         db.session.commit()
         return jsonify({'message': 'Parent checklist and all related versions deleted successfully.'}), 200
 
@@ -1158,16 +1072,17 @@ def delete_checklist_with_children(checklist_id):
 def delete_single_checklist(checklist_id):
     """
     仅删除指定的 checklist 子版本及其相关的 ChecklistQuestion、ChecklistAnswer、ChecklistDecision 和 Review 数据。
+    请求内只写入删除标记，关联数据由后台压缩任务物理删除。
     """
     checklist = Checklist.query.get_or_404(checklist_id)
     if checklist.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized access'}), 403
+    # 父版本还有子版本时不能单独删除，否则子版本会失去归属
+    if checklist.parent_id is None and Checklist.query.filter_by(parent_id=checklist.id).first():
+        return jsonify({'error': 'This checklist has child versions, use delete-with-children instead.'}), 400
     try:
-        # 删除关联数据
-        delete_related_data(checklist.id)
-
-        # 删除当前 Checklist
-        db.session.delete(checklist)
+        record_checklists_deleted(checklist.user_id, [checklist.id])
+        tombstone_checklists([checklist.id])
         db.session.commit()
         return jsonify({'message': 'Checklist deleted successfully.'}), 200
 
@@ -1176,20 +1091,6 @@ def delete_single_checklist(checklist_id):
         return jsonify({'error': str(e)}), 500
 
 
-def delete_related_data(checklist_id):
-    """
-    删除与指定 checklist 相关的所有 ChecklistQuestion、ChecklistAnswer、ChecklistDecision 和 Review 数据。
-    """
-    # 删除 ChecklistQuestion
-    ChecklistQuestion.query.filter_by(checklist_id=checklist_id).delete()
-
-    # 删除 ChecklistDecision 和相关的 Review
-    decisions = ChecklistDecision.query.filter_by(checklist_id=checklist_id).all()
-    for decision in decisions:
-        Review.query.filter_by(decision_id=decision.id).delete()
-        ChecklistAnswer.query.filter_by(checklist_decision_id=decision.id).delete()
-        db.session.delete(decision)
-
 @checklist_bp.route('/decision_groups', methods=['POST'])
 @login_required
 def create_decision_group():
@@ -1199,6 +1100,13 @@ def create_decision_group():
 
     if not name or not checklist_decision_id:
         return jsonify({'error': 'Name, and checklist_decision_id are required'}), 400
+    # 可选：创建时一并邀请成员，格式和上限同批量邀请接口，在写入任何数据之前检查
+    members = data.get('members') or []
+    max_members = current_app.config.get('GROUP_INVITE_MAX_MEMBERS', 10000)
+    if not isinstance(members, list):
+        return jsonify({'error': 'members must be a list'}), 400
+    if len(members) > max_members:
+        return jsonify({'error': f'Too many members, at most {max_members} per request'}), 413
 
     decision_group = DecisionGroup(
         name=name,
@@ -1209,14 +1117,82 @@ def create_decision_group():
     db.session.flush()
 
     # 创建者作为 inviter 加入
-    db.session.add(GroupMembers(
-        group_id=decision_group.id,
-        user_id=current_user.id,
-        role='inviter'  # 明确标记创建者身份
-    ))
+    add_members(decision_group.id, [current_user.id], role='inviter')  # 明确标记创建者身份
     db.session.commit()
 
-    return jsonify({'message': 'Decision group created successfully', 'group_id': decision_group.id}), 201
+    response = {'message': 'Decision group created successfully', 'group_id': decision_group.id}
+    if members:
+        # 与批量邀请相同，按 GROUP_INVITE_BATCH_SIZE 分批写入并提交；决策组已创建，失败时返回已处理部分
+        response['members'] = []
+        try:
+            for batch in batched(members, current_app.config.get('GROUP_INVITE_BATCH_SIZE', 500)):
+                batch_results, _ = invite_batch(decision_group.id, batch)
+                response['members'].extend(batch_results)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Decision group invite failed: {str(e)}", exc_info=True)
+            response['error'] = f'Failed to invite members: {str(e)}'
+
+    return jsonify(response), 201
+
+@checklist_bp.route('/decision_groups/<int:group_id>/members/bulk', methods=['POST'])
+@login_required
+def bulk_invite_decision_group_members(group_id):
+    """
+    批量邀请成员，返回每个成员的处理结果（added / already_member / not_found / invalid）。
+    - application/json: {"members": [{"user_id": 1}, {"username": "..."}, {"email": "..."}]}
+    - text/csv: 表头包含 user_id、username 或 email 之一
+    - application/x-ndjson: 每行一个 JSON 对象
+    CSV 和 NDJSON 按批流式读取，每批一条 INSERT IGNORE 并单独提交；
+    超过 GROUP_INVITE_MAX_MEMBERS 行时 JSON 请求直接返回 413，流式上传在达到上限时停止，
+    返回已处理部分的结果并标记 truncated。
+    """
+    decision_group = DecisionGroup.query.get_or_404(group_id)
+    if decision_group.owner_id != current_user.id:
+        return jsonify({'error': 'Unauthorized access'}), 403
+
+    batch_size = current_app.config.get('GROUP_INVITE_BATCH_SIZE', 500)
+    max_members = current_app.config.get('GROUP_INVITE_MAX_MEMBERS', 10000)
+    if request.mimetype in ('text/csv', 'application/x-ndjson'):
+        records = iter_invite_records(request.stream, request.mimetype)
+    else:
+        data = request.get_json(silent=True) or {}
+        records = data.get('members')
+        if not isinstance(records, list):
+            return jsonify({'error': 'members must be a list'}), 400
+        if len(records) > max_members:
+            return jsonify({'error': f'Too many members, at most {max_members} per request'}), 413
+
+    results = []
+    summary = {'added': 0, 'already_member': 0, 'not_found': 0, 'invalid': 0}
+    truncated = False
+    try:
+        for batch in batched(records, batch_size):
+            if len(results) + len(batch) > max_members:
+                # 之前的批次已经提交，只处理到上限为止，返回部分结果
+                batch = batch[:max_members - len(results)]
+                truncated = True
+            batch_results, joined = invite_batch(group_id, batch) if batch else ([], [])
+            results.extend(batch_results)
+            for result in batch_results:
+                summary[result['status']] += 1
+            for user_id, username in joined:
+                group_events.publish([group_id], 'member_joined', {'user_id': user_id, 'username': username})
+            if truncated:
+                break
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'error': f'Invalid upload: {str(e)}', 'summary': summary, 'results': results}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk invite failed: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e), 'summary': summary, 'results': results}), 500
+
+    response = {'summary': summary, 'results': results}
+    if truncated:
+        response['truncated'] = True
+        response['message'] = f'Only the first {max_members} members were processed'
+    return jsonify(response), 200
 
 @checklist_bp.route('/decision_groups/<int:group_id>/members', methods=['GET'])
 def get_decision_group_members(group_id):
@@ -1239,39 +1215,54 @@ def join_decision_group(group_id):
     decision_group = DecisionGroup.query.get_or_404(group_id)
     if not decision_group:
         return jsonify({'message': 'this decision group is not exists'}), 400
-    # 2. 检查用户是否已是成员（避免重复加入）
-    existing_member = db.session.query(
-        GroupMembers.query.filter_by(
-            group_id=group_id,
-            user_id=current_user.id
-        ).exists()
-    ).scalar()
-    
-    if existing_member:
-        return jsonify({'message': 'User is already a member of this group'}), 200
-
-    # 3. 添加用户到组，并明确标记为被邀请者（invitee）
+    # 2. 添加用户到组，并明确标记为被邀请者（invitee）
+    #    INSERT IGNORE 一条语句完成，已是成员时不重复加入（并发加入也不会报主键冲突）
     try:
-        # 方式1：直接操作关联表（推荐）
-        db.session.add(GroupMembers(
-            group_id=group_id,
-            user_id=current_user.id,
-            role='invitee'  # 明确角色
-        ))
-        
+        added = add_members(group_id, [current_user.id], role='invitee')
         db.session.commit()
+        if not added:
+            return jsonify({'message': 'User is already a member of this group'}), 200
+
+        group_events.publish([group_id], 'member_joined', {'user_id': current_user.id, 'username': current_user.username})
         return jsonify({'message': 'User joined as invitee successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
    
+@checklist_bp.route('/decision_groups/<int:group_id>/events', methods=['GET'])
+@login_required
+def stream_decision_group_events(group_id):
+    """
+    决策组进度推送（Server-Sent Events）：member_joined、member_answered、tally_changed，
+    替代轮询回答列表和成员列表。
+    """
+    decision_group = DecisionGroup.query.get_or_404(group_id)
+    is_member = db.session.query(
+        GroupMembers.query.filter_by(group_id=group_id, user_id=current_user.id).exists()
+    ).scalar()
+    if decision_group.owner_id != current_user.id and not is_member:
+        return jsonify({'error': 'Unauthorized access'}), 403
+
+    subscription = group_events.subscribe(group_id)
+    if subscription is None:
+        return jsonify({'error': 'Too many event subscribers, retry later'}), 503, {'Retry-After': '30'}
+    response = Response(group_events.stream(subscription), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 关闭 nginx 缓冲，事件立即送达
+    })
+    # 连接在开始读取响应前断开时生成器不会执行，这里保证取消订阅
+    response.call_on_close(lambda: group_events.unsubscribe(subscription))
+    return response
+
 @checklist_bp.route('/decision_groups/<int:group_id>/details', methods=['GET'])
 @login_required
 def get_decision_group_details(group_id):
     # 获取决策组详情
     decision_group = DecisionGroup.query.get_or_404(group_id)
     decision = ChecklistDecision.query.get(decision_group.checklist_decision_id)
+    if not decision:
+        return jsonify({'error': 'Decision not found'}), 404
     inviter = decision_group.owner  # 假设owner是创建者
 
     # 构造响应数据
@@ -1293,7 +1284,7 @@ def get_checklist_questions(decision_id):
         return jsonify({"error": "Decision not found"}), 404
 
     # 获取 checklist_id 对应的问题
-    questions = ChecklistQuestion.query.filter_by(checklist_id=decision.checklist_id).all()
+    questions = load_version_questions(decision.checklist_id)
 
     # 格式化问题数据
     question_data = [
@@ -1314,6 +1305,7 @@ def get_checklist_questions(decision_id):
 
 @checklist_bp.route('/checklist_answers/decision/<int:decision_id>', methods=['POST'])
 @login_required
+@json_limits(max_bytes=512 * 1024, max_depth=8, max_array_length=200)
 def answer_checklist_for_group(decision_id):
     # 1. 获取决策信息
     decision = ChecklistDecision.query.get(decision_id)
@@ -1335,38 +1327,34 @@ def answer_checklist_for_group(decision_id):
     
     data = request.get_json()
     answers = data.get('answers')
-    # 5. 验证数据完整性
+    # 5. 验证数据完整性：问题必须属于该决策的清单版本，否则会写入无效的计票
     if not answers:
         return jsonify({'error': 'No answers provided'}), 400
-    for answer_data in answers:
-        referenced_articles=answer_data.get('referenced_articles', [])
-        referenced_platform_articles=answer_data.get('referenced_platform_articles', [])
-        answer = ChecklistAnswer(
-            checklist_decision_id=decision_id,
-            question_id=answer_data['question_id'],
-            user_id=current_user.id,  # 当前用户
-            answer=answer_data['answer'],
-            referenced_articles=','.join(map(str, referenced_articles)),
-            referenced_platform_articles=','.join(map(str, referenced_platform_articles))
+    types = question_types(decision.checklist_id)
+    error = validate_answers(answers, types)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        # 多行 INSERT 写入当前用户的回答及其引用关系，并在同一事务中更新计票
+        insert_answers(decision_id, current_user.id, answers)
+        record_answer_tallies(decision, current_user.id, answers, types)
+        record_answers(decision, len(answers))
+        # 登记引用计数增量，提交后由写回缓冲批量更新
+        record_reference_increments(
+            count_references(answers, 'referenced_articles'),
+            count_references(answers, 'referenced_platform_articles')
         )
-        # 原子更新引用计数
-        if referenced_articles:
-            db.session.query(Article).filter(
-                Article.id.in_(referenced_articles)
-            ).update(
-                {'reference_count': Article.reference_count + 1},
-                synchronize_session=False
-            )
-        
-        if referenced_platform_articles:
-            db.session.query(PlatformArticle).filter(
-                PlatformArticle.id.in_(referenced_platform_articles)
-            ).update(
-                {'reference_count': PlatformArticle.reference_count + 1},
-                synchronize_session=False
-            )
-        db.session.add(answer)
-    db.session.commit()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"answer_checklist_for_group failed: {str(e)}", exc_info=True)
+        return jsonify({"error": f"submit answers failed: {str(e)}"}), 500
+
+    # 提交后向决策组推送回答进度和最新计票
+    group_ids = [group.id for group in db.session.query(DecisionGroup.id).filter_by(checklist_decision_id=decision_id).all()]
+    if group_ids:
+        group_events.publish(group_ids, 'member_answered', {'user_id': current_user.id, 'username': current_user.username})
+        group_events.publish(group_ids, 'tally_changed', tally_summary(decision))
     return jsonify({'message': 'Answers submitted successfully'}), 200
 
 @checklist_bp.route('/checklist_answers/group/decision/<int:decision_id>/responses', methods=['GET'])
@@ -1374,11 +1362,17 @@ def get_group_answers(decision_id):
     """
     获取指定决策组中所有成员对于某个决策的回答详情，包括问题内容和引用文章标题。
     """
+    decision = ChecklistDecision.query.get(decision_id)
+    if not decision:
+        return jsonify({'error': 'Decision not found'}), 404
+
     # 获取该决策的所有回答
     answers = ChecklistAnswer.query.filter_by(checklist_decision_id=decision_id).all()
+    # 一次 JOIN 取回全部回答的引用文章
+    references = load_references(decision_id, 'answer')
 
     # 获取该决策的所有问题，并生成字典映射 {question_id: question_text}
-    questions = ChecklistQuestion.query.filter_by(checklist_id=decision_id).all()
+    questions = load_version_questions(decision.checklist_id)
     questions_dict = {question.id: question.question for question in questions}
 
     grouped_answers = {}
@@ -1391,11 +1385,7 @@ def get_group_answers(decision_id):
         question_text = questions_dict.get(question_id, "Unknown question")
 
         # 获取引用的文章标题
-        referenced_article_ids = answer.referenced_articles.split(',') if answer.referenced_articles else []
-        referenced_articles_data = []
-        if referenced_article_ids:
-            referenced_articles = Article.query.filter(Article.id.in_(referenced_article_ids)).all()
-            referenced_articles_data = [{'id': article.id, 'title': article.title} for article in referenced_articles]
+        referenced_articles_data = references.get(answer.id, empty_references())['referenced_articles']
 
         # 构造该问题的回答数据
         if question_id not in grouped_answers:
@@ -1411,3 +1401,49 @@ def get_group_answers(decision_id):
         })
 
     return jsonify(grouped_answers), 200
+
+@checklist_bp.route('/checklist_answers/group/decision/<int:decision_id>/summary', methods=['GET'])
+@login_required
+def get_group_answer_summary(decision_id):
+    """
+    决策组回答汇总：每个问题的选项计票、回答率以及尚未回答的成员，读取预先维护的计票表。
+    """
+    decision = ChecklistDecision.query.get(decision_id)
+    if not decision:
+        return jsonify({'error': 'Decision not found'}), 404
+
+    # 只有决策所有者和决策组成员可以查看
+    is_member = db.session.query(GroupMembers.query.join(
+        DecisionGroup, DecisionGroup.id == GroupMembers.group_id
+    ).filter(
+        DecisionGroup.checklist_decision_id == decision_id,
+        GroupMembers.user_id == current_user.id
+    ).exists()).scalar()
+    if decision.user_id != current_user.id and not is_member:
+        return jsonify({'error': 'Unauthorized access'}), 403
+
+    return jsonify(tally_summary(decision)), 200
+
+@checklist_bp.cli.command('backfill-manifests')
+def backfill_manifests_command():
+    """为旧版本清单回填问题 manifest：flask checklist backfill-manifests"""
+    total = backfill_manifests()
+    print(f"Backfilled {total} checklists.")
+
+@checklist_bp.cli.command('backfill-article-references')
+def backfill_article_references_command():
+    """把逗号分隔的引用字段转换为 article_reference 行：flask checklist backfill-article-references"""
+    total = backfill_article_references()
+    print(f"Backfilled {total} article references.")
+
+@checklist_bp.cli.command('rebuild-answer-tallies')
+def rebuild_answer_tallies_command():
+    """从回答重新计算决策计票：flask checklist rebuild-answer-tallies"""
+    total = rebuild_answer_tallies()
+    print(f"Rebuilt answer tallies for {total} decisions.")
+
+@checklist_bp.cli.command('rebuild-decision-stats')
+def rebuild_decision_stats_command():
+    """从业务表重建决策统计：flask checklist rebuild-decision-stats"""
+    rebuild_decision_stats()
+    print("Rebuilt decision stats.")
@@ -94,7 +94,8 @@ def update_todo_status(id, todo):
 @login_required
 def delete_todo(id, todo):
     try:
-        db.session.delete(todo)
+        # 软删除，由后台压缩任务在低峰期物理删除
+        todo.soft_delete()
         db.session.commit()
         return jsonify({'message': 'Todo deleted successfully'}), 200
     except Exception as e:
@@ -6,6 +6,7 @@ from AHP import AHP
 import pytz
 from shared_models import AHPHistory, db  # 确保 AHP.py 文件在同一目录或 Python 路径中
 from flask_login import current_user, login_required
+from utils import json_limits
 
 ahp_bp = Blueprint('ahp', __name__)
 
@@ -29,6 +30,7 @@ def get_db_connection():
     return mysql.connector.connect(**db_config)
 
 @ahp_bp.route('/ahp_analysis', methods=['POST'])
+@json_limits(max_bytes=64 * 1024, max_depth=6, max_array_length=50)  # 判断矩阵阶数有限，超大请求直接拒绝
 def ahp_calculation():
     try:
         # 从请求体中解析 JSON 数据
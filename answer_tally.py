@@ -0,0 +1,174 @@
+from datetime import datetime as dt
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from question_graph import load_version_questions
+from shared_models import ChecklistAnswer, ChecklistDecision, DecisionAnswerTally, DecisionGroup, DecisionRespondent, GroupMembers, User, db
+
+# answer_key 最大长度（utf8mb4 下主键列不超过 191 字符）
+ANSWER_KEY_LENGTH = 191
+
+
+def answer_key(question_type, answer):
+    """选择题按答案取值计票，其他题型只统计回答人数"""
+    if question_type != 'choice':
+        return ''
+    return str(answer)[:ANSWER_KEY_LENGTH]
+
+
+def answer_question_id(answer):
+    """回答中的问题ID（整数或数字字符串），无效时返回 None"""
+    question_id = answer.get('question_id')
+    if isinstance(question_id, bool):
+        return None
+    if isinstance(question_id, int):
+        return question_id
+    if isinstance(question_id, str) and question_id.isdigit():
+        return int(question_id)
+    return None
+
+
+def validate_answers(answers, types):
+    """
+    在写入回答和计票之前校验客户端提交的回答：必须是对象数组，每个回答的问题属于该清单版本且答案非空。
+    :return: 错误信息，校验通过时返回 None
+    """
+    if not isinstance(answers, list):
+        return 'Invalid answer data'
+    for answer in answers:
+        if not isinstance(answer, dict) or not answer.get('answer'):
+            return 'Invalid answer data'
+        if answer_question_id(answer) not in types:
+            return f"Invalid question_id: {answer.get('question_id')}"
+    return None
+
+
+def tally_rows(decision_id, types, answers):
+    """把一次提交的回答汇总成计票行，同一 (question_id, answer_key) 合并计数；不属于该版本的问题不计票"""
+    counts = {}
+    for answer in answers:
+        question_id = answer_question_id(answer)
+        if question_id not in types:
+            continue
+        key = (question_id, answer_key(types[question_id], answer['answer']))
+        counts[key] = counts.get(key, 0) + 1
+    return [
+        {'decision_id': decision_id, 'question_id': question_id, 'answer_key': key, 'vote_count': count}
+        for (question_id, key), count in counts.items()
+    ]
+
+
+def question_types(checklist_id):
+    return {question.id: question.type for question in load_version_questions(checklist_id)}
+
+
+def record_answer_tallies(decision, user_id, answers, types=None):
+    """
+    在提交回答的同一事务中增量更新计票和回答人：
+    每张表一条 INSERT ... ON DUPLICATE KEY UPDATE，读汇总时不再扫描全部回答。
+    """
+    if types is None:
+        types = question_types(decision.checklist_id)
+    rows = tally_rows(decision.id, types, answers)
+    if rows:
+        tally = DecisionAnswerTally.__table__
+        stmt = mysql_insert(tally).values(rows)
+        db.session.execute(stmt.on_duplicate_key_update(vote_count=tally.c.vote_count + stmt.inserted.vote_count))
+
+    respondent = DecisionRespondent.__table__
+    stmt = mysql_insert(respondent).values(decision_id=decision.id, user_id=user_id, answered_at=dt.utcnow())
+    db.session.execute(stmt.on_duplicate_key_update(answered_at=stmt.inserted.answered_at))
+
+
+def group_members(decision_id):
+    """决策所属决策组的全部成员（去重）"""
+    return db.session.query(User.id, User.username).join(
+        GroupMembers, GroupMembers.user_id == User.id
+    ).join(
+        DecisionGroup, DecisionGroup.id == GroupMembers.group_id
+    ).filter(
+        DecisionGroup.checklist_decision_id == decision_id
+    ).distinct().all()
+
+
+def tally_summary(decision):
+    """
+    汇总决策组的回答情况：每个问题的选项计票、回答率以及尚未回答的成员。
+    读取量只与问题数和成员数有关，与回答数无关。
+    """
+    questions = load_version_questions(decision.checklist_id)
+    tallies = {}
+    for row in DecisionAnswerTally.query.filter_by(decision_id=decision.id).all():
+        tallies.setdefault(row.question_id, {})[row.answer_key] = row.vote_count
+
+    members = group_members(decision.id)
+    respondent_ids = {row.user_id for row in db.session.query(DecisionRespondent.user_id).filter_by(decision_id=decision.id).all()}
+    member_count = len(members)
+
+    def rate(count):
+        return round(count / member_count, 4) if member_count else 0
+
+    questions_data = []
+    for question in questions:
+        question_tallies = tallies.get(question.id, {})
+        response_count = sum(question_tallies.values())
+        question_data = {
+            'question_id': question.id,
+            'question': question.question,
+            'type': question.type,
+            'response_count': response_count,
+            'response_rate': rate(response_count)
+        }
+        if question.type == 'choice':
+            options = question.options or []
+            question_data['tallies'] = [
+                {'option': key, 'label': option_label(options, key), 'count': count}
+                for key, count in sorted(question_tallies.items(), key=lambda item: -item[1])
+            ]
+        questions_data.append(question_data)
+
+    return {
+        'decision_id': decision.id,
+        'member_count': member_count,
+        'respondent_count': len(respondent_ids),
+        'response_rate': rate(len([member for member in members if member.id in respondent_ids])),
+        'pending_members': [{'id': member.id, 'username': member.username} for member in members if member.id not in respondent_ids],
+        'questions': questions_data
+    }
+
+
+def option_label(options, key):
+    """答案保存的是选项下标时返回选项文本，否则答案本身就是选项文本"""
+    if key.isdigit() and int(key) < len(options):
+        return options[int(key)]
+    return key
+
+
+def rebuild_answer_tallies(batch_size=200):
+    """按决策主键分批，从回答重新计算计票和回答人（升级前的数据或计数出现偏差时使用）"""
+    last_id = 0
+    total = 0
+    while True:
+        decisions = ChecklistDecision.query.filter(
+            ChecklistDecision.id > last_id
+        ).order_by(ChecklistDecision.id).limit(batch_size).all()
+        if not decisions:
+            break
+
+        decision_ids = [decision.id for decision in decisions]
+        DecisionAnswerTally.query.filter(DecisionAnswerTally.decision_id.in_(decision_ids)).delete(synchronize_session=False)
+        DecisionRespondent.query.filter(DecisionRespondent.decision_id.in_(decision_ids)).delete(synchronize_session=False)
+
+        answers = {}
+        for answer in ChecklistAnswer.query.filter(ChecklistAnswer.checklist_decision_id.in_(decision_ids)).all():
+            answers.setdefault(answer.checklist_decision_id, []).append(answer)
+        for decision in decisions:
+            types = question_types(decision.checklist_id)
+            by_user = {}
+            for answer in answers.get(decision.id, []):
+                by_user.setdefault(answer.user_id, []).append({'question_id': answer.question_id, 'answer': answer.answer})
+            for user_id, user_answers in by_user.items():
+                record_answer_tallies(decision, user_id, user_answers, types)
+        db.session.commit()
+
+        total += len(decisions)
+        last_id = decision_ids[-1]
+    return total
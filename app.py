@@ -15,6 +15,11 @@ from inspirations import inspiration_bp
 from reflections import reflections_bp
 import pymysql
 from shared_models import User,FreezeRecord, db
+from reference_counter import reference_count_buffer
+from compactor import compactor
+from group_events import group_events
+from file_cache import file_cache
+from search_engine import search_engine
 from datetime import datetime as dt, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from cryptography.hazmat.primitives import serialization
@@ -72,6 +77,11 @@ login_manager.session_protection = "strong"
 
 app.config.from_pyfile('config.py')
 db.init_app(app)
+reference_count_buffer.init_app(app)
+compactor.init_app(app)
+group_events.init_app(app)
+file_cache.init_app(app)
+search_engine.init_app(app)
 app.register_blueprint(ahp_bp)
 app.register_blueprint(checklist_bp)
 app.register_blueprint(todolist_bp)
@@ -85,6 +95,23 @@ app.register_blueprint(inspiration_bp)
 app.register_blueprint(reflections_bp)
 
 
+def start_background_tasks():
+    """
+    启动后台线程（引用计数写回、软删除压缩、搜索索引维护）。
+    只在服务进程中调用：python app.py 或 gunicorn worker，flask 命令行进程不启动。
+    """
+    reference_count_buffer.start()
+    compactor.start()
+    search_engine.start()
+
+
+@app.cli.command('compact')
+def compact_command():
+    """立即物理删除软删除的行（不受低峰时段限制），可由定时任务执行：flask compact"""
+    compactor.compact(ignore_window=True)
+    print("Compaction finished.")
+
+
 # 加载 RSA 私钥
 def load_private_key():
     with open("private_key.pem", "rb") as key_file:
@@ -245,4 +272,7 @@ def profile():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+    # 调试模式下 reloader 的监控进程不处理请求，只在实际服务的子进程中启动
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     app.run(debug=True)
@@ -1,8 +1,16 @@
 from flask import Flask, request, jsonify, Blueprint
 from sqlalchemy import desc
+from sqlalchemy.orm import defer
 from shared_models import Article,PlatformArticle, db
+from article_content import article_list_version, article_version, backfill_article_summaries, content_response, make_summary
+from article_references import citing_decisions
+from article_search import search_articles
+from article_suggest import article_suggestions
+from article_tags import set_article_tags, sync_article_tags, tag_facets, tag_filter
+from search_engine import search_engine
 from datetime import datetime as dt
 from flask_login import current_user, login_required
+from utils import conditional_get
 
 article_bp = Blueprint('article', __name__)
 
@@ -16,33 +24,39 @@ def create_article():
         content=data['content'],
         author=data['author'],
         tags=data['tags'],
-        keywords=data['keywords']
+        keywords=data['keywords'],
+        summary=make_summary(data['content'])
     )
     new_article.created_at=dt.utcnow()
     new_article.updated_at=dt.utcnow()
     db.session.add(new_article)
+    db.session.flush()
+    set_article_tags('article', new_article.id, current_user.id, new_article.tags)
     db.session.commit()
     return jsonify({'message': 'Article created successfully', 'article': data}), 201
 
 @article_bp.route('/articles', methods=['GET'])
 @login_required
+@conditional_get(stamp=lambda: article_list_version(Article, current_user.id))
 def get_articles():
     search = request.args.get('search', '')
     tag = request.args.get('tag', '')
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 10, type=int)
 
-    query = Article.query
+    # 列表只返回摘要，不读取正文
+    query = Article.query.options(defer(Article.content)).filter(Article.user_id==current_user.id)
 
-    if search:
-        query = query.filter(
-            (Article.title.ilike(f"%{search}%")) |
-            (Article.keywords.ilike(f"%{search}%"))
-        )
     if tag:
-        query = query.filter(Article.tags == tag)
+        query = query.filter(tag_filter(Article, 'article', tag, current_user.id))
+    if search:
+        # 全文索引检索，按相关度与引用次数排序
+        query = search_articles(query, Article, search, owner=current_user.id)
+    else:
+        query = query.order_by(desc(Article.reference_count), desc(Article.created_at))
+    facets = tag_facets(query, Article, 'article', current_user.id, search, tag)
 
-    paginated_articles = query.filter(Article.user_id==current_user.id).order_by(desc(Article.reference_count), desc(Article.created_at)).paginate(page=page, per_page=page_size, error_out=False)
+    paginated_articles = query.paginate(page=page, per_page=page_size, error_out=False)
     articles = paginated_articles.items
 
     results = [
@@ -52,6 +66,7 @@ def get_articles():
             'author': article.author,
             'tags': article.tags,
             'keywords': article.keywords,
+            'summary': article.summary,
             'created_at': article.created_at,
             'updated_at': article.updated_at,
             'reference_count': article.reference_count
@@ -62,27 +77,44 @@ def get_articles():
         'articles': results,
         'total_pages': paginated_articles.pages,
         'current_page': paginated_articles.page,
-        'total_items': paginated_articles.total
+        'total_items': paginated_articles.total,
+        'tag_facets': facets
     }), 200
 
+@article_bp.route('/articles/suggest', methods=['GET'])
+@login_required
+def suggest_articles():
+    """输入联想：标题、标签或关键词以 prefix 开头的文章，按引用次数取前 limit 个"""
+    prefix = request.args.get('prefix', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    return jsonify({'suggestions': article_suggestions.suggest(Article, current_user.id, prefix, limit)}), 200
+
+@article_bp.route('/platform_articles/suggest', methods=['GET'])
+def suggest_platform_articles():
+    prefix = request.args.get('prefix', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    return jsonify({'suggestions': article_suggestions.suggest(PlatformArticle, None, prefix, limit)}), 200
+
 @article_bp.route('/platform_articles', methods=['GET'])
+@conditional_get(stamp=lambda: article_list_version(PlatformArticle))
 def get_platform_articles():
     search = request.args.get('search', '')
     tag = request.args.get('tag', '')
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 10, type=int)
 
-    query = PlatformArticle.query
+    query = PlatformArticle.query.options(defer(PlatformArticle.content))
 
-    if search:
-        query = query.filter(
-            (PlatformArticle.title.ilike(f"%{search}%")) |
-            (PlatformArticle.keywords.ilike(f"%{search}%"))
-        )
     if tag:
-        query = query.filter(PlatformArticle.tags == tag)
+        query = query.filter(tag_filter(PlatformArticle, 'platform_article', tag))
+    if search:
+        # 全文索引检索，按相关度与引用次数排序
+        query = search_articles(query, PlatformArticle, search)
+    else:
+        query = query.order_by(desc(PlatformArticle.reference_count), desc(PlatformArticle.created_at))
+    facets = tag_facets(query, PlatformArticle, 'platform_article', None, search, tag)
 
-    paginated_articles = query.order_by(desc(PlatformArticle.reference_count), desc(PlatformArticle.created_at)).paginate(page=page, per_page=page_size, error_out=False)
+    paginated_articles = query.paginate(page=page, per_page=page_size, error_out=False)
     articles = paginated_articles.items
 
     results = [
@@ -92,6 +124,7 @@ def get_platform_articles():
             'author': article.author,
             'tags': article.tags,
             'keywords': article.keywords,
+            'summary': article.summary,
             'created_at': article.created_at,
             'updated_at': article.updated_at,
             'reference_count': article.reference_count
@@ -102,50 +135,71 @@ def get_platform_articles():
         'articles': results,
         'total_pages': paginated_articles.pages,
         'current_page': paginated_articles.page,
-        'total_items': paginated_articles.total
+        'total_items': paginated_articles.total,
+        'tag_facets': facets
     }), 200
 
 @article_bp.route('/articles/<int:id>', methods=['GET'])
 @login_required
+@conditional_get(stamp=lambda id: article_version(Article, id))
 def get_article(id):
-    #print(f"Current User: {current_user}, Is Authenticated: {current_user.is_authenticated}")
-    article = Article.query.get(id)
+    # content=0 时不读取正文，正文通过 /articles/<id>/content 分段获取
+    include_content = request.args.get('content', '1') != '0'
+    query = Article.query if include_content else Article.query.options(defer(Article.content))
+    article = query.get(id)
     if not article:
         return jsonify({'error': 'Article not found'}), 404
 
-    
     result = {
         'id': article.id,
         'title': article.title,
-        'content': article.content,
         'author': article.author,
         'tags': article.tags,
         'keywords': article.keywords,
+        'summary': article.summary,
         'created_at': article.created_at,
         'updated_at': article.updated_at,
         'reference_count': article.reference_count
     }
+    if include_content:
+        result['content'] = article.content
     return jsonify(result), 200
 
+@article_bp.route('/articles/<int:id>/content', methods=['GET'])
+@login_required
+@conditional_get(stamp=lambda id: article_version(Article, id))
+def get_article_content(id):
+    return content_response(Article, id)
+
 @article_bp.route('/platform_articles/<int:id>', methods=['GET'])
+@conditional_get(stamp=lambda id: article_version(PlatformArticle, id))
 def get_platform_article(id):
-    article = PlatformArticle.query.get(id)
+    include_content = request.args.get('content', '1') != '0'
+    query = PlatformArticle.query if include_content else PlatformArticle.query.options(defer(PlatformArticle.content))
+    article = query.get(id)
     if not article:
         return jsonify({'error': 'Article not found'}), 404
 
     result = {
         'id': article.id,
         'title': article.title,
-        'content': article.content,
         'author': article.author,
         'tags': article.tags,
         'keywords': article.keywords,
+        'summary': article.summary,
         'created_at': article.created_at,
         'updated_at': article.updated_at,
         'reference_count': article.reference_count
     }
+    if include_content:
+        result['content'] = article.content
     return jsonify(result), 200
 
+@article_bp.route('/platform_articles/<int:id>/content', methods=['GET'])
+@conditional_get(stamp=lambda id: article_version(PlatformArticle, id))
+def get_platform_article_content(id):
+    return content_response(PlatformArticle, id)
+
 @article_bp.route('/articles/<int:id>', methods=['PUT'])
 @login_required
 def update_article(id):
@@ -157,10 +211,12 @@ def update_article(id):
     data = request.get_json()
     article.title = data.get('title', article.title)
     article.content = data.get('content', article.content)
+    article.summary = make_summary(article.content)
     article.author = data.get('author', article.author)
     article.tags = data.get('tags')
     article.keywords = data.get('keywords', article.keywords)
     article.updated_at = dt.utcnow()
+    set_article_tags('article', article.id, article.user_id, article.tags)
 
     db.session.commit()
     return jsonify({'message': 'Article updated successfully'}), 200
@@ -173,6 +229,72 @@ def delete_article(id):
         return jsonify({'error': 'Article not found'}), 404
     if not article.user_id==current_user.id:
         return jsonify({'error': 'You are not allowed to access this Article'}), 403    
-    db.session.delete(article)
+    # 软删除，由后台压缩任务在低峰期物理删除
+    article.soft_delete()
+    set_article_tags('article', article.id, article.user_id, None)
     db.session.commit()
-    return jsonify({'message': 'Article deleted successfully'}), 200
\ No newline at end of file
+    return jsonify({'message': 'Article deleted successfully'}), 200
+
+def citations_response(article_type, article_id):
+    """分页返回当前用户引用了指定文章的决策"""
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', 10, type=int)
+
+    paginated_decisions = citing_decisions(article_type, article_id, current_user.id).paginate(page=page, per_page=page_size, error_out=False)
+    results = [
+        {
+            'id': decision.id,
+            'decision_name': decision.decision_name,
+            'checklist_id': decision.checklist_id,
+            'created_at': decision.created_at
+        } for decision in paginated_decisions.items
+    ]
+
+    return jsonify({
+        'decisions': results,
+        'total_pages': paginated_decisions.pages,
+        'current_page': paginated_decisions.page,
+        'total_items': paginated_decisions.total
+    }), 200
+
+@article_bp.route('/articles/<int:id>/citations', methods=['GET'])
+@login_required
+def get_article_citations(id):
+    article = Article.query.get(id)
+    if not article:
+        return jsonify({'error': 'Article not found'}), 404
+    if not article.user_id==current_user.id:
+        return jsonify({'error': 'You are not allowed to access this Article'}), 403
+    return citations_response('article', id)
+
+@article_bp.route('/platform_articles/<int:id>/citations', methods=['GET'])
+@login_required
+def get_platform_article_citations(id):
+    article = PlatformArticle.query.get(id)
+    if not article:
+        return jsonify({'error': 'Article not found'}), 404
+    return citations_response('platform_article', id)
+
+@article_bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """重建嵌入式搜索索引（SEARCH_BACKEND = 'embedded'，需先停止服务）：flask article rebuild-search-index"""
+    if not search_engine.enabled:
+        print("SEARCH_BACKEND is not 'embedded', nothing to rebuild.")
+        return
+    if not search_engine.open():
+        print("Search index is in use by another process, stop the server first.")
+        return
+    search_engine.rebuild()
+    print("Rebuilt search index.")
+
+@article_bp.cli.command('sync-article-tags')
+def sync_article_tags_command():
+    """按 tags 字段重建 article_tag（上线回填，之后由定时任务同步平台文章）：flask article sync-article-tags"""
+    total = sync_article_tags()
+    print(f"Synced {total} article tags.")
+
+@article_bp.cli.command('backfill-article-summaries')
+def backfill_article_summaries_command():
+    """为没有摘要的文章生成摘要：flask article backfill-article-summaries"""
+    total = backfill_article_summaries()
+    print(f"Backfilled {total} article summaries.")
@@ -0,0 +1,111 @@
+import html
+import re
+from flask import Response, current_app, jsonify, request
+from sqlalchemy import LargeBinary, cast, func
+from shared_models import Article, PlatformArticle, db
+
+SUMMARY_LENGTH = 200
+
+_IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)|<img\b[^>]*>', re.IGNORECASE)
+_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_TAG = re.compile(r'<[^>]+>')
+_MARKDOWN = re.compile(r'[#>*`~]+')
+_SPACE = re.compile(r'\s+')
+
+
+def make_summary(content, length=SUMMARY_LENGTH):
+    """生成摘要：去掉图片（包括内嵌的 base64 图片）、链接地址、HTML 标签和 Markdown 标记，取前 length 个字符"""
+    text = _IMAGE.sub(' ', content or '')
+    text = _LINK.sub(r'\1', text)
+    text = _TAG.sub(' ', text)
+    text = _MARKDOWN.sub('', html.unescape(text))
+    text = _SPACE.sub(' ', text).strip()
+    if len(text) <= length:
+        return text
+    return text[:length - 1] + '…'
+
+
+def article_version(model, article_id):
+    """条件 GET 的版本戳：只读取修改时间和引用次数"""
+    row = db.session.query(model.updated_at, model.reference_count).filter(model.id == article_id).first()
+    if row is None:
+        return None
+    return (row.updated_at, row.reference_count), row.updated_at
+
+
+def article_list_version(model, owner=None):
+    """
+    列表的版本戳：文章数、引用次数之和（列表按引用次数排序）和最后修改时间。
+    删除文章不会推进 MAX(updated_at)，列表不返回 Last-Modified，只用 ETag 判断（文章数变化即失效）。
+    """
+    query = db.session.query(func.count(model.id), func.sum(model.reference_count), func.max(model.updated_at))
+    if owner is not None:
+        query = query.filter(model.user_id == owner)
+    count, references, updated_at = query.one()
+    return (count, references, updated_at), None
+
+
+def read_content_bytes(model, article_id, start, size):
+    """
+    在数据库中截取正文 UTF-8 编码的 [start, start + size) 字节，只传输请求的范围。
+    MySQL 每次执行都会取出整个 TEXT 值再截取，一个请求只应调用一次，不能按块循环调用。
+    """
+    return db.session.query(
+        func.substring(cast(model.content, LargeBinary), start + 1, size)
+    ).filter(model.id == article_id).scalar() or b''
+
+
+def content_response(model, article_id):
+    """
+    返回文章正文，支持单个 HTTP Range（字节范围，按 UTF-8 编码计算）。
+    请求的范围用一次查询读出，再按 ARTICLE_CONTENT_BLOCK_SIZE 分块发送，内存占用不超过范围长度。
+    Range 边界可能落在多字节字符中间，客户端应拼接字节后再解码。
+    """
+    total = db.session.query(func.octet_length(model.content)).filter(model.id == article_id).scalar()
+    if total is None:
+        return jsonify({'error': 'Article not found'}), 404
+
+    start, stop, status = 0, total, 200
+    if request.range is not None and len(request.range.ranges) == 1:
+        byte_range = request.range.range_for_length(total)
+        if byte_range is None:
+            return Response(status=416, headers={'Content-Range': f'bytes */{total}'})
+        start, stop = byte_range
+        status = 206
+
+    block_size = current_app.config.get('ARTICLE_CONTENT_BLOCK_SIZE', 64 * 1024)
+    content = read_content_bytes(model, article_id, start, stop - start) if stop > start else b''
+
+    def generate():
+        view = memoryview(content)
+        for offset in range(0, len(content), block_size):
+            yield bytes(view[offset:offset + block_size])
+
+    response = Response(generate(), status=status, mimetype='text/plain')
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Length'] = str(len(content))
+    if status == 206:
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{total}'
+    return response
+
+
+def backfill_article_summaries(batch_size=100):
+    """为没有摘要的文章生成摘要（平台文章由其他系统维护，可定期执行同步）"""
+    total = 0
+    for model in (Article, PlatformArticle):
+        last_id = 0
+        while True:
+            batch = db.session.query(model.id, model.content).filter(
+                model.id > last_id,
+                model.summary.is_(None)
+            ).order_by(model.id).limit(batch_size).all()
+            if not batch:
+                break
+            for row in batch:
+                db.session.query(model).filter(model.id == row.id).update(
+                    {'summary': make_summary(row.content)}, synchronize_session=False
+                )
+            db.session.commit()
+            total += len(batch)
+            last_id = batch[-1].id
+    return total
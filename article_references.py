@@ -0,0 +1,173 @@
+from flask import g
+from sqlalchemy import and_, func, insert
+from question_graph import get_allocator
+from reference_counter import reference_ids
+from shared_models import Article, ArticleReference, ChecklistAnswer, ChecklistDecision, PlatformArticle, Review, User, db
+
+# 引用字段 -> article_reference.article_type
+REFERENCE_FIELDS = {
+    'referenced_articles': 'article',
+    'referenced_platform_articles': 'platform_article'
+}
+
+
+class ReferenceResolver:
+    """
+    请求级身份映射：同一请求内每个用户ID只查一次。
+    调用方先收集整个响应需要的ID，再一次 IN 查询补齐缺失项；
+    文章标题已由 load_references 随引用关系一次 JOIN 取回。
+    """
+
+    def __init__(self):
+        self._usernames = {}
+
+    def usernames(self, user_ids):
+        """:return: {用户ID: 用户名}，不存在的用户不在结果中"""
+        user_ids = set(user_ids)
+        missing = user_ids - self._usernames.keys()
+        if missing:
+            rows = db.session.query(User.id, User.username).filter(User.id.in_(missing)).all()
+            self._usernames.update(rows)
+            for user_id in missing - {row.id for row in rows}:
+                self._usernames[user_id] = None
+        return {user_id: self._usernames[user_id] for user_id in user_ids if self._usernames[user_id] is not None}
+
+
+def get_resolver():
+    """当前请求的 ReferenceResolver"""
+    if 'reference_resolver' not in g:
+        g.reference_resolver = ReferenceResolver()
+    return g.reference_resolver
+
+
+def reference_rows(decision_id, source_type, source_id, record):
+    """把一条回答或复盘中的引用ID列表转换为 article_reference 行"""
+    rows = []
+    for field, article_type in REFERENCE_FIELDS.items():
+        for article_id in sorted(reference_ids(record.get(field))):
+            rows.append({
+                'decision_id': decision_id,
+                'source_type': source_type,
+                'source_id': source_id,
+                'article_type': article_type,
+                'article_id': article_id
+            })
+    return rows
+
+
+def insert_answers(decision_id, user_id, answers):
+    """
+    一次多行 INSERT 写入回答，再一次多行 INSERT 写入全部引用关系。
+    回答ID由 hi/lo 分配器预先分配，因此 checklist_answer 的插入都应经过这里。
+    """
+    if not answers:
+        return []
+
+    answer_ids = get_allocator(ChecklistAnswer).allocate(len(answers))
+    answer_rows = []
+    references = []
+    for answer_id, answer in zip(answer_ids, answers):
+        answer_rows.append({
+            'id': answer_id,
+            'checklist_decision_id': decision_id,
+            'user_id': user_id,
+            'question_id': answer.get('question_id'),
+            'answer': answer.get('answer')
+        })
+        references.extend(reference_rows(decision_id, 'answer', answer_id, answer))
+
+    db.session.execute(insert(ChecklistAnswer.__table__).values(answer_rows))
+    if references:
+        db.session.execute(insert(ArticleReference.__table__).values(references))
+    return answer_ids
+
+
+def insert_review_references(review, record):
+    """写入复盘的引用关系，review 需已 flush 获得ID"""
+    references = reference_rows(review.decision_id, 'review', review.id, record)
+    if references:
+        db.session.execute(insert(ArticleReference.__table__).values(references))
+
+
+def load_references(decision_id, source_type, source_ids=None):
+    """
+    一次 JOIN 取回某个决策下回答或复盘引用的文章标题。
+    :return: {source_id: {'referenced_articles': [...], 'referenced_platform_articles': [...]}}
+    """
+    query = db.session.query(
+        ArticleReference.source_id,
+        ArticleReference.article_type,
+        ArticleReference.article_id,
+        func.coalesce(Article.title, PlatformArticle.title).label('title')
+    ).outerjoin(
+        Article, and_(ArticleReference.article_type == 'article', Article.id == ArticleReference.article_id)
+    ).outerjoin(
+        PlatformArticle, and_(ArticleReference.article_type == 'platform_article', PlatformArticle.id == ArticleReference.article_id)
+    ).filter(
+        ArticleReference.decision_id == decision_id,
+        ArticleReference.source_type == source_type
+    )
+    if source_ids is not None:
+        query = query.filter(ArticleReference.source_id.in_(source_ids))
+
+    references = {}
+    for row in query.all():
+        if row.title is None:
+            continue  # 引用的文章已被删除
+        field = 'referenced_articles' if row.article_type == 'article' else 'referenced_platform_articles'
+        source = references.setdefault(row.source_id, {'referenced_articles': [], 'referenced_platform_articles': []})
+        source[field].append({'id': row.article_id, 'title': row.title})
+    return references
+
+
+def empty_references():
+    return {'referenced_articles': [], 'referenced_platform_articles': []}
+
+
+def citing_decisions(article_type, article_id, user_id=None):
+    """引用了指定文章的决策（可按决策所有者过滤）"""
+    query = db.session.query(ChecklistDecision).join(
+        ArticleReference, ArticleReference.decision_id == ChecklistDecision.id
+    ).filter(
+        ArticleReference.article_type == article_type,
+        ArticleReference.article_id == article_id
+    )
+    if user_id is not None:
+        query = query.filter(ChecklistDecision.user_id == user_id)
+    return query.distinct().order_by(ChecklistDecision.created_at.desc())
+
+
+def backfill_article_references(batch_size=1000):
+    """
+    把旧的逗号分隔引用字段转换为 article_reference 行。
+    按主键分批流式读取，INSERT IGNORE 保证可以重复执行。
+    """
+    total = 0
+    sources = (
+        ('answer', ChecklistAnswer, ChecklistAnswer.checklist_decision_id),
+        ('review', Review, Review.decision_id)
+    )
+    for source_type, model, decision_column in sources:
+        last_id = 0
+        while True:
+            batch = db.session.query(
+                model.id, decision_column.label('decision_id'),
+                model.referenced_articles, model.referenced_platform_articles
+            ).filter(
+                model.id > last_id,
+                (model.referenced_articles != '') | (model.referenced_platform_articles != '')
+            ).order_by(model.id).limit(batch_size).all()
+            if not batch:
+                break
+
+            references = []
+            for row in batch:
+                record = {field: (getattr(row, field) or '').split(',') for field in REFERENCE_FIELDS}
+                references.extend(reference_rows(row.decision_id, source_type, row.id, record))
+            if references:
+                db.session.execute(insert(ArticleReference.__table__).prefix_with('IGNORE').values(references))
+            db.session.commit()
+
+            total += len(references)
+            last_id = batch[-1].id
+    return total
@@ -0,0 +1,45 @@
+import math
+from flask import current_app
+from sqlalchemy import desc, func
+from sqlalchemy.dialects.mysql import match
+from search_engine import filter_ranked, search_engine
+
+# 与 MySQL ngram_token_size 默认值一致，更短的关键词无法命中全文索引
+NGRAM_TOKEN_SIZE = 2
+
+
+def search_articles(query, model, search, owner=None):
+    """
+    文章搜索：使用 (title, keywords, content) 上的 ngram FULLTEXT 索引，
+    按 MATCH 相关度（InnoDB 的 BM25 类 TF-IDF 评分）与引用次数混合排序：
+        score = relevance * (1 + weight * LOG(1 + reference_count))
+    少于 NGRAM_TOKEN_SIZE 个字符的关键词退回标题、关键词的模糊匹配。
+    SEARCH_BACKEND 为 embedded 时改用嵌入式倒排索引的 BM25 得分，排序公式相同。
+    """
+    search = search.strip()
+    weight = current_app.config.get('ARTICLE_SEARCH_REFERENCE_WEIGHT', 0.2)
+    if search_engine.enabled:
+        hits = search_engine.search(model, search, owner)
+        if hits is None:
+            return like_search(query, model, search)
+        return rank_hits(query, model, dict(hits), weight)
+
+    if len(search) < NGRAM_TOKEN_SIZE:
+        return like_search(query, model, search)
+    relevance = match(model.title, model.keywords, model.content, against=search).in_natural_language_mode()
+    score = relevance * (1 + weight * func.log(1 + model.reference_count))
+    return query.filter(relevance).order_by(desc(score), desc(model.id))
+
+
+def like_search(query, model, search):
+    return query.filter(
+        (model.title.ilike(f"%{search}%")) |
+        (model.keywords.ilike(f"%{search}%"))
+    ).order_by(desc(model.reference_count), desc(model.created_at))
+
+
+def rank_hits(query, model, scores, weight):
+    """查出命中文章的引用次数，与索引得分混合后排序"""
+    rows = query.with_entities(model.id, model.reference_count).filter(model.id.in_(scores)).all() if scores else []
+    rows.sort(key=lambda row: (-scores[row.id] * (1 + weight * math.log(1 + row.reference_count)), -row.id))
+    return filter_ranked(query, model, [row.id for row in rows])
@@ -0,0 +1,160 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from cache_utils import LRUCache
+from shared_models import Article, PlatformArticle, db
+
+# 参与前缀匹配的字段变化时更新索引
+WATCHED_FIELDS = ('title', 'tags', 'keywords', 'user_id', 'deleted_at')
+
+_SEPARATOR = re.compile(r'[\s,，;；、/|]+')
+# 排在所有以 prefix 开头的字符串之后
+_PREFIX_END = '\U0010ffff'
+
+
+def suggestion_keys(title, tags, keywords):
+    """标题整体、标题中的各个词、各个标签和关键词（小写）都可以作为前缀匹配的起点"""
+    keys = set()
+    title = (title or '').strip().lower()
+    if title:
+        keys.add(title)
+    for text in (title, tags, keywords):
+        keys.update(part for part in _SEPARATOR.split((text or '').lower()) if part)
+    return keys
+
+
+class PrefixIndex:
+    """
+    有序数组前缀索引：(key, 文章ID) 升序排列，bisect 定位前缀区间，
+    再按引用次数取前 k 个。增删为数组内插入删除，适合单个用户规模的数据。
+    """
+
+    def __init__(self, rows):
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._docs = {}
+        entries = []
+        for row in rows:
+            keys = suggestion_keys(row.title, row.tags, row.keywords)
+            self._docs[row.id] = (row.title, row.tags, row.reference_count or 0, keys)
+            entries.extend((key, row.id) for key in keys)
+        entries.sort()
+        self._entries = entries
+
+    def add(self, article_id, title, tags, keywords, reference_count):
+        keys = suggestion_keys(title, tags, keywords)
+        with self._lock:
+            self._remove(article_id)
+            self._docs[article_id] = (title, tags, reference_count or 0, keys)
+            for key in keys:
+                insort(self._entries, (key, article_id))
+
+    def remove(self, article_id):
+        with self._lock:
+            self._remove(article_id)
+
+    def _remove(self, article_id):
+        doc = self._docs.pop(article_id, None)
+        if doc is None:
+            return
+        for key in doc[3]:
+            position = bisect_left(self._entries, (key, article_id))
+            if position < len(self._entries) and self._entries[position] == (key, article_id):
+                del self._entries[position]
+
+    def suggest(self, prefix, limit):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        with self._lock:
+            start = bisect_left(self._entries, (prefix,))
+            end = bisect_left(self._entries, (prefix + _PREFIX_END,), start)
+            matched = {article_id for _, article_id in self._entries[start:end]}
+            top = heapq.nlargest(limit, matched, key=lambda article_id: (self._docs[article_id][2], article_id))
+            return [{
+                'id': article_id,
+                'title': self._docs[article_id][0],
+                'tags': self._docs[article_id][1],
+                'reference_count': self._docs[article_id][2]
+            } for article_id in top]
+
+
+class ArticleSuggestions:
+    """
+    文章标题、标签、关键词的输入联想。
+    每个用户的文章一个索引、平台文章共用一个索引，首次查询时构建并放入 LRU 缓存；
+    文章增删改在事务提交后增量更新已构建的索引。引用次数由后台批量写回，
+    不经过 ORM 事件，索引超过 ARTICLE_SUGGEST_TTL 秒后重新构建以刷新排序。
+    """
+
+    def __init__(self):
+        self._indexes = LRUCache(max_size=1024)
+
+    def suggest(self, model, owner, prefix, limit):
+        return self._index(model, owner).suggest(prefix, limit)
+
+    def _index(self, model, owner):
+        key = (model.__tablename__, owner)
+        index = self._indexes.get(key)
+        ttl = current_app.config.get('ARTICLE_SUGGEST_TTL', 300)
+        if index is None or time.monotonic() - index.built_at > ttl:
+            query = db.session.query(model.id, model.title, model.tags, model.keywords, model.reference_count)
+            if owner is not None:
+                query = query.filter(model.user_id == owner)
+            index = PrefixIndex(query.all())
+            self._indexes.set(key, index)
+        return index
+
+    def apply(self, changes):
+        """:param changes: {(表名, 所有者ID, 文章ID): (标题, 标签, 关键词, 引用次数) 或 None（删除）}"""
+        for (table, owner, article_id), doc in changes.items():
+            index = self._indexes.get((table, owner))
+            if index is None:
+                continue  # 未构建的索引下次查询时从数据库加载
+            if doc is None:
+                index.remove(article_id)
+            else:
+                index.add(article_id, *doc)
+
+
+article_suggestions = ArticleSuggestions()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_suggestion_changes(session, flush_context):
+    changes = session.info.setdefault('pending_suggestion_changes', {})
+    for obj in session.deleted:
+        if isinstance(obj, (Article, PlatformArticle)):
+            changes[(obj.__tablename__, getattr(obj, 'user_id', None), obj.id)] = None
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, (Article, PlatformArticle)):
+            continue
+        state = inspect(obj)
+        if not any(field in state.attrs and state.attrs[field].history.has_changes() for field in WATCHED_FIELDS):
+            continue
+        owner = getattr(obj, 'user_id', None)
+        # 文章转移给其他用户时从原用户的索引中删除
+        if 'user_id' in state.attrs:
+            for previous_owner in state.attrs['user_id'].history.deleted:
+                changes[(obj.__tablename__, previous_owner, obj.id)] = None
+        if getattr(obj, 'deleted_at', None) is not None:
+            changes[(obj.__tablename__, owner, obj.id)] = None
+        else:
+            changes[(obj.__tablename__, owner, obj.id)] = (obj.title, obj.tags, obj.keywords, obj.reference_count)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed_suggestion_changes(session):
+    changes = session.info.pop('pending_suggestion_changes', None)
+    if changes:
+        article_suggestions.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_suggestion_changes(session):
+    session.info.pop('pending_suggestion_changes', None)
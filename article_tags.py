@@ -0,0 +1,139 @@
+import re
+import time
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+from cache_utils import LRUCache
+from shared_models import Article, ArticleTag, PlatformArticle, db
+
+TAG_SEPARATOR = re.compile(r'[,，;；、]+')
+TAG_MAX_LENGTH = 64
+FACET_LIMIT = 50
+
+# 标签统计缓存：(文章类型, 所有者ID, 搜索词, 标签) -> (计算时间, 统计结果)
+_facet_cache = LRUCache(max_size=1024)
+
+
+def parse_tags(text):
+    """拆分标签字段，去掉空白和重复（不区分大小写，与 MySQL 默认排序规则一致）"""
+    tags = {}
+    for tag in TAG_SEPARATOR.split(text or ''):
+        tag = tag.strip()[:TAG_MAX_LENGTH]
+        if tag:
+            tags.setdefault(tag.lower(), tag)
+    return list(tags.values())
+
+
+def set_article_tags(article_type, article_id, user_id, tags_text):
+    """在当前事务中重写文章的标签行，提交后清除该用户的标签统计缓存"""
+    table = ArticleTag.__table__
+    db.session.execute(delete(table).where(
+        table.c.article_type == article_type,
+        table.c.article_id == article_id
+    ))
+    tags = parse_tags(tags_text)
+    if tags:
+        db.session.execute(insert(table).values([
+            {'article_type': article_type, 'article_id': article_id, 'tag': tag, 'user_id': user_id or 0}
+            for tag in tags
+        ]))
+    db.session.info.setdefault('invalidated_tag_facets', set()).add((article_type, user_id or 0))
+
+
+def tag_filter(model, article_type, tag, owner=None):
+    """
+    按标签过滤文章。
+    用户文章走 article_tag 的 (article_type, user_id, tag) 索引；平台文章由其他系统写入，
+    article_tag 只在同步后更新，直接按分隔符边界匹配 tags 字段，结果不会滞后。
+    """
+    tag = tag.strip()[:TAG_MAX_LENGTH]
+    if article_type == 'platform_article':
+        # 与 parse_tags 一致：分隔符两侧允许空白，超长标签按截断后的前缀匹配
+        tail = r'[^,，;；、]*' if len(tag) == TAG_MAX_LENGTH else r'\s*([,，;；、]|$)'
+        return model.tags.regexp_match(r'(^|[,，;；、])\s*' + re.escape(tag) + tail)
+    return model.id.in_(select(ArticleTag.article_id).where(
+        ArticleTag.article_type == article_type,
+        ArticleTag.user_id == (owner or 0),
+        ArticleTag.tag == tag
+    ))
+
+
+def tag_facets(query, model, article_type, owner=None, search='', tag=''):
+    """
+    当前筛选条件下每个标签的文章数（按数量降序，最多 FACET_LIMIT 个）。
+    没有筛选条件时只读 article_tag 索引；有筛选条件时限制在查询结果的文章ID内。
+    结果按用户缓存，文章写入后失效，另有 ARTICLE_TAG_FACET_TTL 兜底。
+    平台文章由其他系统维护，标签行只在 sync_article_tags 后更新，统计最多滞后一个同步周期加 TTL。
+    """
+    key = (article_type, owner or 0, search, tag)
+    ttl = current_app.config.get('ARTICLE_TAG_FACET_TTL', 300)
+    cached = _facet_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] <= ttl:
+        return cached[1]
+
+    facet_query = db.session.query(ArticleTag.tag, func.count().label('count')).filter(
+        ArticleTag.article_type == article_type,
+        ArticleTag.user_id == (owner or 0)
+    )
+    if search or tag:
+        facet_query = facet_query.filter(ArticleTag.article_id.in_(
+            query.with_entities(model.id).order_by(None).scalar_subquery()
+        ))
+    facets = [
+        {'tag': row.tag, 'count': row.count}
+        for row in facet_query.group_by(ArticleTag.tag).order_by(func.count().desc(), ArticleTag.tag).limit(FACET_LIMIT).all()
+    ]
+    _facet_cache.set(key, (time.monotonic(), facets))
+    return facets
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_tag_facets(session):
+    for article_type, owner in session.info.pop('invalidated_tag_facets', ()):
+        _facet_cache.discard(lambda key: key[0] == article_type and key[1] == owner)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _keep_tag_facets(session):
+    session.info.pop('invalidated_tag_facets', None)
+
+
+def sync_article_tags(batch_size=1000):
+    """
+    按 tags 字段重建 article_tag，可以重复执行。
+    按主键分批加锁读取，每批在一个事务中删除该主键区间内的标签行再写入，已删除文章和已移除标签的行一并清除；
+    锁住文章行后与同时保存文章的请求串行，不会用旧的 tags 覆盖新写入的标签行。
+    平台文章由其他系统维护，需由定时任务定期执行：flask article sync-article-tags
+    """
+    total = 0
+    table = ArticleTag.__table__
+    for article_type, model in (('article', Article), ('platform_article', PlatformArticle)):
+        owner_column = model.user_id if model is Article else None
+        last_id = 0
+        while True:
+            columns = [model.id, model.tags] + ([owner_column] if owner_column is not None else [])
+            batch = db.session.query(*columns).filter(
+                model.id > last_id
+            ).order_by(model.id).limit(batch_size).with_for_update().all()
+            # 最后一批之后的区间没有文章，删除其中残留的标签行
+            upper = batch[-1].id if batch else None
+            range_filter = [table.c.article_type == article_type, table.c.article_id > last_id]
+            if upper is not None:
+                range_filter.append(table.c.article_id <= upper)
+            db.session.execute(delete(table).where(*range_filter))
+
+            rows = [
+                {'article_type': article_type, 'article_id': row.id, 'tag': tag,
+                 'user_id': row.user_id if owner_column is not None else 0}
+                for row in batch for tag in parse_tags(row.tags)
+            ]
+            if rows:
+                db.session.execute(insert(table).values(rows))
+            db.session.commit()
+
+            if not batch:
+                break
+            total += len(rows)
+            last_id = upper
+    _facet_cache.clear()
+    return total
@@ -0,0 +1,177 @@
+import atexit
+import threading
+import time
+from datetime import datetime as dt, timedelta
+from sqlalchemy import and_, delete, select, tuple_
+from question_graph import delete_version_questions
+from shared_models import Article, ArticleReference, ArticleTag, Checklist, ChecklistAnswer, ChecklistDecision, ChecklistStats, DecisionAnswerTally, DecisionGroup, DecisionRespondent, DecisionStats, GroupMembers, ReferenceCountFlush, Review, TodoItem, db
+
+
+def delete_in_chunks(model, condition, chunk_size, pause=0):
+    """
+    按主键分块删除满足条件的行，每块单独提交以缩短持锁时间，块之间暂停 pause 秒。
+    先查出一块主键再按主键删除，避免 MySQL 不允许在子查询中引用被删除表的限制。
+    """
+    primary_key = list(model.__table__.primary_key.columns)
+    total = 0
+    while True:
+        keys = db.session.execute(
+            select(*primary_key).where(condition).limit(chunk_size).execution_options(include_deleted=True)
+        ).all()
+        if not keys:
+            return total
+        if len(primary_key) == 1:
+            key_filter = primary_key[0].in_([key[0] for key in keys])
+        else:
+            key_filter = tuple_(*primary_key).in_([tuple(key) for key in keys])
+        db.session.execute(delete(model.__table__).where(key_filter))
+        db.session.commit()
+        total += len(keys)
+        time.sleep(pause)
+
+
+def purge_decisions(decision_ids, chunk_size, pause=0):
+    """
+    集合删除决策及其引用关系、复盘、回答、计票和决策组。
+    :param decision_ids: 决策ID列表或子查询（select）
+    """
+    groups = select(DecisionGroup.id).where(DecisionGroup.checklist_decision_id.in_(decision_ids))
+    delete_in_chunks(ArticleReference, ArticleReference.decision_id.in_(decision_ids), chunk_size, pause)
+    delete_in_chunks(Review, Review.decision_id.in_(decision_ids), chunk_size, pause)
+    delete_in_chunks(ChecklistAnswer, ChecklistAnswer.checklist_decision_id.in_(decision_ids), chunk_size, pause)
+    delete_in_chunks(DecisionAnswerTally, DecisionAnswerTally.decision_id.in_(decision_ids), chunk_size, pause)
+    delete_in_chunks(DecisionRespondent, DecisionRespondent.decision_id.in_(decision_ids), chunk_size, pause)
+    delete_in_chunks(DecisionStats, DecisionStats.decision_id.in_(decision_ids), chunk_size, pause)
+    delete_in_chunks(GroupMembers, GroupMembers.group_id.in_(groups), chunk_size, pause)
+    delete_in_chunks(DecisionGroup, DecisionGroup.checklist_decision_id.in_(decision_ids), chunk_size, pause)
+    delete_in_chunks(ChecklistDecision, ChecklistDecision.id.in_(decision_ids), chunk_size, pause)
+
+
+def purge_checklists(checklist_ids, chunk_size, pause=0):
+    """物理删除清单版本及其全部决策数据，子版本先于父版本删除"""
+    purge_decisions(
+        select(ChecklistDecision.id).where(ChecklistDecision.checklist_id.in_(checklist_ids)),
+        chunk_size, pause
+    )
+    ordered_ids = [row.id for row in db.session.query(Checklist.id).filter(
+        Checklist.id.in_(checklist_ids)
+    ).order_by(Checklist.parent_id.is_(None), Checklist.id.desc()).execution_options(include_deleted=True).all()]
+    for checklist_id in ordered_ids:
+        delete_version_questions(checklist_id)
+        db.session.execute(delete(ChecklistStats.__table__).where(ChecklistStats.__table__.c.checklist_id == checklist_id))
+        db.session.execute(delete(Checklist.__table__).where(Checklist.__table__.c.id == checklist_id))
+        db.session.commit()
+        time.sleep(pause)
+
+
+def purge_articles(article_ids, chunk_size, pause=0):
+    """物理删除文章及指向它们的引用关系和标签"""
+    delete_in_chunks(ArticleReference, and_(
+        ArticleReference.article_type == 'article',
+        ArticleReference.article_id.in_(article_ids)
+    ), chunk_size, pause)
+    delete_in_chunks(ArticleTag, and_(
+        ArticleTag.article_type == 'article',
+        ArticleTag.article_id.in_(article_ids)
+    ), chunk_size, pause)
+    delete_in_chunks(Article, Article.id.in_(article_ids), chunk_size, pause)
+
+
+def purge_todos(todo_ids, chunk_size, pause=0):
+    delete_in_chunks(TodoItem, TodoItem.id.in_(todo_ids), chunk_size, pause)
+
+
+def tombstone_checklists(checklist_ids):
+    """
+    标记清单版本已删除，只更新清单行。
+    其决策由软删除过滤按所属清单隐藏（见 SoftDeleteMixin），随清单一起由压缩任务分块物理删除。
+    """
+    Checklist.query.filter(Checklist.id.in_(checklist_ids)).update(
+        {'deleted_at': dt.utcnow()}, synchronize_session=False
+    )
+
+
+class Compactor:
+    """
+    后台压缩任务：只在低峰时段运行，按批物理删除软删除的行，批之间暂停以限制对在线请求的影响。
+    清单的决策数据随清单一起删除，因此清单排在决策之前处理。
+    """
+
+    PURGERS = (
+        (Checklist, purge_checklists),
+        (ChecklistDecision, purge_decisions),
+        (Article, purge_articles),
+        (TodoItem, purge_todos),
+    )
+
+    def __init__(self):
+        self.app = None
+        self.batch_size = 200
+        self.pause = 0.2
+        self.interval = 600
+        self.window = (2, 6)
+        self.flush_marker_retention = timedelta(days=7)
+        self._stopped = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('COMPACTION_BATCH_SIZE', 200)
+        self.pause = app.config.get('COMPACTION_PAUSE', 0.2)
+        self.interval = app.config.get('COMPACTION_INTERVAL', 600)
+        self.window = app.config.get('COMPACTION_WINDOW', (2, 6))
+        self.flush_marker_retention = timedelta(days=app.config.get('REFERENCE_COUNT_FLUSH_RETENTION_DAYS', 7))
+
+    def start(self):
+        """开启 COMPACTION_ENABLED 时启动后台压缩线程，只在服务进程中调用"""
+        if not self.app.config.get('COMPACTION_ENABLED'):
+            return
+        threading.Thread(target=self._run, daemon=True).start()
+        atexit.register(self._stopped.set)
+
+    def in_window(self, now=None):
+        """当前是否处于低峰时段 [start, end)（服务器本地时间，支持跨零点）"""
+        hour = (now or dt.now()).hour
+        start, end = self.window
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def compact(self, ignore_window=False):
+        """按模型依次清理软删除的行，离开低峰时段或停止时中断，下个周期继续"""
+        for model, purge in self.PURGERS:
+            while (ignore_window or self.in_window()) and not self._stopped.is_set():
+                ids = [row.id for row in db.session.query(model.id).filter(
+                    model.deleted_at.isnot(None)
+                ).order_by(model.id).limit(self.batch_size).execution_options(include_deleted=True).all()]
+                if not ids:
+                    break
+                purge(ids, self.batch_size, self.pause)
+        if ignore_window or self.in_window():
+            self.prune_flush_markers()
+
+    def prune_flush_markers(self):
+        """
+        删除过期的引用计数写回标记。标记只用于写回后、删除日志段前崩溃时去重，
+        遗留日志段在几个写回周期内就会被接管，保留期远大于此即可
+        """
+        delete_in_chunks(
+            ReferenceCountFlush,
+            ReferenceCountFlush.applied_at < dt.utcnow() - self.flush_marker_retention,
+            self.batch_size, self.pause
+        )
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            if not self.in_window():
+                continue
+            with self.app.app_context():
+                try:
+                    self.compact()
+                except Exception as e:
+                    self.app.logger.error(f"Soft delete compaction failed: {str(e)}", exc_info=True)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+
+compactor = Compactor()
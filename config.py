@@ -7,3 +7,59 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 # Flask 应用的其他配置
 DEBUG = True  # 启用调试模式
 SECRET_KEY = 'decision_aid'  # 用于会话和表单加密
+
+# 文章引用计数写回（write-behind）：增量先写本地日志，后台定期批量更新数据库
+# 写回线程只在服务进程中启动（见 app.start_background_tasks），flask 命令行进程退出时写回一次
+REFERENCE_COUNT_WRITE_BEHIND = False
+REFERENCE_COUNT_FLUSH_INTERVAL = 5  # 写回间隔（秒）
+REFERENCE_COUNT_JOURNAL_DIR = 'journal/reference_count'  # 本地日志目录
+REFERENCE_COUNT_FLUSH_RETENTION_DAYS = 7  # 写回标记（reference_count_flush）保留天数，由压缩任务清理
+
+# 软删除压缩：低峰时段分批物理删除已标记删除的清单、决策、文章和待办
+# 多进程部署时只在一个服务进程开启，或关闭后用定时任务执行 flask compact
+COMPACTION_ENABLED = False
+COMPACTION_WINDOW = (2, 6)  # 低峰时段 [开始小时, 结束小时)，服务器本地时间
+COMPACTION_BATCH_SIZE = 200  # 每个事务删除的行数
+COMPACTION_PAUSE = 0.2  # 批次之间暂停（秒）
+COMPACTION_INTERVAL = 600  # 检查间隔（秒）
+
+# 决策组事件推送（SSE）
+GROUP_EVENT_BROKER = 'group_events.LocalBroker'  # 进程内发布订阅，多进程部署时替换为跨进程实现
+GROUP_EVENT_HEARTBEAT = 15  # 心跳间隔（秒）
+GROUP_EVENT_QUEUE_SIZE = 100  # 每个连接最多缓存的事件数
+GROUP_EVENT_MAX_SUBSCRIBERS = 1000  # 每个进程最多同时保持的事件连接数（线程模式下每个连接占用一个线程）
+
+# 决策组批量邀请
+GROUP_INVITE_BATCH_SIZE = 500  # 每条 INSERT 写入的成员数
+GROUP_INVITE_MAX_MEMBERS = 10000  # 单次请求最多邀请人数
+
+# 文章全文搜索：相关度与引用次数混合排序的权重
+ARTICLE_SEARCH_REFERENCE_WEIGHT = 0.2
+
+# 搜索后端：'mysql' 使用 MySQL 全文索引；'embedded' 使用进程内倒排索引（单进程部署，不依赖 MySQL 配置）
+SEARCH_BACKEND = 'mysql'
+SEARCH_INDEX_DIR = 'index/search'  # 嵌入式索引目录
+SEARCH_FLUSH_INTERVAL = 30  # 内存段刷盘间隔（秒）
+SEARCH_MERGE_FACTOR = 8  # 磁盘段超过该数量时合并
+SEARCH_MAX_RESULTS = 1000  # 每次搜索最多返回的结果数
+
+# 文章输入联想：内存前缀索引的重建间隔（秒），用于刷新按引用次数的排序
+ARTICLE_SUGGEST_TTL = 300
+
+# 文章标签统计缓存有效期（秒），文章写入时立即失效
+ARTICLE_TAG_FACET_TTL = 300
+
+# 文章正文分块发送的块大小（字节），正文或请求的范围用一次查询读出
+ARTICLE_CONTENT_BLOCK_SIZE = 64 * 1024
+
+# MinIO 对象的本地磁盘缓存（按进程限制容量）
+FILE_CACHE_ENABLED = True
+FILE_CACHE_DIR = 'cache/files'
+FILE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 缓存总大小上限
+FILE_CACHE_MAX_OBJECT_SIZE = 10 * 1024 * 1024  # 超过该大小的对象直接从 MinIO 流式发送
+FILE_CACHE_STAT_TTL = 30  # 对象元数据缓存时间（秒），期间命中缓存的请求不访问 MinIO；0 表示每次都查询
+
+# 预签名直传：上传下载由客户端直接访问 MinIO，应用只签发 URL 和登记对象（客户端需能访问 MinIO 地址）
+MINIO_PRESIGNED_URLS = False
+MINIO_PRESIGN_EXPIRES = 600  # 预签名 URL 有效期（秒）
+MINIO_PENDING_UPLOAD_GRACE = 3600  # 过期未完成的上传保留多久后由 flask minio expire-uploads 清理（秒）
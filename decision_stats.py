@@ -0,0 +1,119 @@
+from datetime import datetime as dt
+from sqlalchemy import bindparam, delete, func, insert, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from shared_models import Checklist, ChecklistAnswer, ChecklistDecision, ChecklistStats, DecisionStats, Review, UserDecisionStats, db
+
+
+def bump(model, key, touch=True, **deltas):
+    """
+    在当前事务中增减一行统计，行不存在时先插入：
+    INSERT ... ON DUPLICATE KEY UPDATE col = GREATEST(col + delta, 0)。
+    touch 为 True 时同时刷新最后活动时间。
+    """
+    table = model.__table__
+    now = dt.utcnow()
+    values = dict(key)
+    values.update({column: max(delta, 0) for column, delta in deltas.items()})
+    if touch:
+        values['last_activity_at'] = now
+
+    stmt = mysql_insert(table).values(values)
+    updates = {
+        column: func.greatest(table.c[column] + bindparam(f'delta_{column}', delta), 0)
+        for column, delta in deltas.items()
+    }
+    if touch:
+        updates['last_activity_at'] = stmt.inserted.last_activity_at
+    db.session.execute(stmt.on_duplicate_key_update(updates))
+
+
+def record_decision_created(decision, answer_count):
+    bump(ChecklistStats, {'checklist_id': decision.checklist_id}, decision_count=1)
+    bump(DecisionStats, {'decision_id': decision.id}, answer_count=answer_count)
+    bump(UserDecisionStats, {'user_id': decision.user_id}, decision_count=1, answer_count=answer_count)
+
+
+def record_answers(decision, answer_count):
+    """决策组成员提交回答：计入决策和决策所有者的统计"""
+    bump(DecisionStats, {'decision_id': decision.id}, answer_count=answer_count)
+    bump(UserDecisionStats, {'user_id': decision.user_id}, answer_count=answer_count)
+
+
+def record_review(decision):
+    bump(DecisionStats, {'decision_id': decision.id}, review_count=1)
+    bump(UserDecisionStats, {'user_id': decision.user_id}, review_count=1)
+
+
+def record_decision_deleted(decision):
+    answer_count, review_count = decision_counts([decision.id])
+    bump(ChecklistStats, {'checklist_id': decision.checklist_id}, touch=False, decision_count=-1)
+    bump(UserDecisionStats, {'user_id': decision.user_id}, touch=False,
+         decision_count=-1, answer_count=-answer_count, review_count=-review_count)
+
+
+def record_checklists_deleted(user_id, checklist_ids):
+    """清单版本删除后其决策不再可见，从用户统计中扣除（需在写入删除标记之前调用）"""
+    decision_ids = [row.id for row in db.session.query(ChecklistDecision.id).filter(
+        ChecklistDecision.checklist_id.in_(checklist_ids)
+    ).all()]
+    if not decision_ids:
+        return
+    answer_count, review_count = decision_counts(decision_ids)
+    bump(UserDecisionStats, {'user_id': user_id}, touch=False,
+         decision_count=-len(decision_ids), answer_count=-answer_count, review_count=-review_count)
+
+
+def decision_counts(decision_ids):
+    """从统计表读取一组决策的回答数和复盘数之和"""
+    row = db.session.query(
+        func.coalesce(func.sum(DecisionStats.answer_count), 0),
+        func.coalesce(func.sum(DecisionStats.review_count), 0)
+    ).filter(DecisionStats.decision_id.in_(decision_ids)).one()
+    return int(row[0]), int(row[1])
+
+
+def rebuild_decision_stats():
+    """
+    从业务表重新计算全部统计（修复计数偏差）。
+    每张统计表先清空再用一条 INSERT ... SELECT ... GROUP BY 重建，已删除的清单和决策不计入；
+    最后活动时间无法从业务表精确还原，按决策创建时间重建。
+    """
+    live_decisions = select(ChecklistDecision).join(
+        Checklist, Checklist.id == ChecklistDecision.checklist_id
+    ).where(
+        ChecklistDecision.deleted_at.is_(None), Checklist.deleted_at.is_(None)
+    ).subquery()
+    answers = select(
+        ChecklistAnswer.checklist_decision_id.label('decision_id'),
+        func.count().label('answer_count')
+    ).group_by(ChecklistAnswer.checklist_decision_id).subquery()
+    reviews = select(
+        Review.decision_id,
+        func.count().label('review_count')
+    ).group_by(Review.decision_id).subquery()
+    answer_count = func.coalesce(answers.c.answer_count, 0)
+    review_count = func.coalesce(reviews.c.review_count, 0)
+    last_activity = live_decisions.c.created_at
+
+    for model in (ChecklistStats, DecisionStats, UserDecisionStats):
+        db.session.execute(delete(model.__table__))
+
+    db.session.execute(insert(ChecklistStats.__table__).from_select(
+        ['checklist_id', 'decision_count', 'last_activity_at'],
+        select(live_decisions.c.checklist_id, func.count(), func.max(last_activity))
+        .group_by(live_decisions.c.checklist_id)
+    ))
+    db.session.execute(insert(DecisionStats.__table__).from_select(
+        ['decision_id', 'answer_count', 'review_count', 'last_activity_at'],
+        select(live_decisions.c.id, answer_count, review_count, last_activity)
+        .outerjoin(answers, answers.c.decision_id == live_decisions.c.id)
+        .outerjoin(reviews, reviews.c.decision_id == live_decisions.c.id)
+    ))
+    db.session.execute(insert(UserDecisionStats.__table__).from_select(
+        ['user_id', 'decision_count', 'answer_count', 'review_count', 'last_activity_at'],
+        select(live_decisions.c.user_id, func.count(), func.sum(answer_count), func.sum(review_count), func.max(last_activity))
+        .outerjoin(answers, answers.c.decision_id == live_decisions.c.id)
+        .outerjoin(reviews, reviews.c.decision_id == live_decisions.c.id)
+        .group_by(live_decisions.c.user_id)
+    ))
+    db.session.commit()
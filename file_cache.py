@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from cache_utils import LRUCache
+
+
+class FileCache:
+    """
+    MinIO 热点对象的本地磁盘缓存，按总字节数做 LRU 淘汰。
+    缓存键由对象路径和 ETag 组成：对象被覆盖后 ETag 变化，旧版本不会再命中并逐渐被淘汰。
+    同一对象并发未命中时只有一个请求从 MinIO 下载（single-flight），其余请求等待下载完成后直接读本地文件。
+    容量限制按进程计算；多个进程共用目录时，文件可能被其他进程淘汰，读取时发现缺失会重新下载。
+    对象的元数据（ETag、大小、类型、修改时间）在内存中缓存 FILE_CACHE_STAT_TTL 秒，
+    命中时不访问 MinIO；对象被覆盖或删除后最多在这段时间内仍返回旧版本。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.max_bytes = 512 * 1024 * 1024
+        self.max_object_size = 10 * 1024 * 1024
+        self.stat_ttl = 30
+        self._stats = LRUCache(max_size=4096)  # 对象路径 -> (获取时间, stat 结果)
+        self._entries = OrderedDict()  # 文件名 -> 字节数，按最近使用排序
+        self._pins = {}  # 文件名 -> 正在打开该文件的请求数，固定的文件不会被淘汰
+        self._inflight = {}  # 文件名 -> 下载完成事件
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.stat_hits = 0
+        self.stat_misses = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('FILE_CACHE_ENABLED', True)
+        self.directory = app.config.get('FILE_CACHE_DIR', 'cache/files')
+        self.max_bytes = app.config.get('FILE_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_object_size = app.config.get('FILE_CACHE_MAX_OBJECT_SIZE', self.max_object_size)
+        self.stat_ttl = app.config.get('FILE_CACHE_STAT_TTL', self.stat_ttl)
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """载入上次运行留下的缓存文件，按修改时间恢复 LRU 顺序"""
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)  # 下载了一半的文件
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        with self._lock:
+            for _, name, size in sorted(files):
+                self._entries[name] = size
+                self._size += size
+            self._evict()
+
+    def stat(self, object_path, fetch):
+        """取得对象元数据，缓存过期或未命中时调用 fetch() 向 MinIO 查询（对象不存在的结果不缓存）"""
+        if not self.enabled or self.stat_ttl <= 0:
+            return fetch()
+        cached = self._stats.get(object_path)
+        if cached is not None and time.monotonic() - cached[0] <= self.stat_ttl:
+            with self._lock:
+                self.stat_hits += 1
+            return cached[1]
+        with self._lock:
+            self.stat_misses += 1
+        value = fetch()
+        self._stats.set(object_path, (time.monotonic(), value))
+        return value
+
+    def forget(self, object_path):
+        """对象被写入或发现已删除时丢弃缓存的元数据"""
+        self._stats.discard(lambda key: key == object_path)
+
+    @staticmethod
+    def cache_name(object_path, etag):
+        return hashlib.sha256(f"{object_path}\0{etag}".encode('utf-8')).hexdigest()
+
+    @contextmanager
+    def open(self, object_path, etag, fetch):
+        """
+        取得对象的本地缓存路径，未命中时调用 fetch(本地文件对象) 从 MinIO 下载。
+        with 块内文件不会被淘汰，应在块内完成打开文件（send_file 会立即打开）。
+        """
+        name = self.cache_name(object_path, etag)
+        path = os.path.join(self.directory, name)
+        waited = False
+        while True:
+            with self._lock:
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                    self._pins[name] = self._pins.get(name, 0) + 1
+                    if waited:
+                        self.coalesced += 1
+                    else:
+                        self.hits += 1
+                    break
+                event = self._inflight.get(name)
+                if event is None:
+                    event = self._inflight[name] = threading.Event()
+                    self.misses += 1
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                # 等待正在进行的下载；下载失败时下一轮由本请求重新下载
+                event.wait()
+                waited = True
+                continue
+
+            try:
+                size = self._download(path, fetch)
+                with self._lock:
+                    self._entries[name] = size
+                    self._size += size
+                    self._pins[name] = self._pins.get(name, 0) + 1
+                    self._evict()
+            finally:
+                with self._lock:
+                    del self._inflight[name]
+                event.set()
+            break
+
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._pins[name] -= 1
+                if not self._pins[name]:
+                    del self._pins[name]
+                self._evict()
+
+    def discard(self, object_path, etag):
+        """缓存文件被其他进程删除时移除索引项"""
+        name = self.cache_name(object_path, etag)
+        with self._lock:
+            size = self._entries.pop(name, None)
+            if size is not None:
+                self._size -= size
+
+    def _download(self, path, fetch):
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                fetch(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return os.path.getsize(path)
+
+    def _evict(self):
+        """淘汰最久未使用且没有被固定的文件，直到总大小不超过上限（需持有锁）"""
+        for name in list(self._entries):
+            if self._size <= self.max_bytes:
+                return
+            if name in self._pins:
+                continue
+            size = self._entries.pop(name)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass  # 已被其他进程删除，或在 Windows 上仍被下载中的请求打开
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.coalesced) / requests if requests else None,
+                'stat_hits': self.stat_hits,
+                'stat_misses': self.stat_misses,
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes
+            }
+
+
+file_cache = FileCache()
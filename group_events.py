@@ -0,0 +1,122 @@
+import json
+import queue
+import threading
+from werkzeug.utils import import_string
+
+
+class Subscription:
+    """一个 SSE 连接的事件队列，队列满时丢弃新事件（tally_changed 每次携带完整计票，丢弃不影响最终状态）"""
+
+    def __init__(self, channel, max_size):
+        self.channel = channel
+        self._queue = queue.Queue(max_size)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            pass
+
+    def get(self, timeout):
+        """等待下一条事件，超时返回 None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalBroker:
+    """
+    进程内发布订阅：只能推送给同一进程内的订阅者。
+    多进程部署时可实现同样的 subscribe / unsubscribe / publish 接口（例如基于 Redis），
+    通过 GROUP_EVENT_BROKER 配置替换。
+    """
+
+    def __init__(self, app=None):
+        self.max_queue_size = app.config.get('GROUP_EVENT_QUEUE_SIZE', 100) if app else 100
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(channel, self.max_queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class GroupEvents:
+    """
+    决策组事件推送（Server-Sent Events）。
+    空闲连接只阻塞在自己的队列上，不查询数据库。按 gunicorn.conf.py 使用 gevent worker 运行时
+    标准库的 queue 和 threading 被替换为协程版本，每个连接只占一个 greenlet；
+    直接运行 python app.py（线程模式）时每个连接占用一个线程。
+    每个进程的连接数受 GROUP_EVENT_MAX_SUBSCRIBERS 限制，超出时拒绝新连接。
+    """
+
+    def __init__(self):
+        self.broker = LocalBroker()
+        self.heartbeat_interval = 15
+        self.max_subscribers = 1000
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        broker_class = app.config.get('GROUP_EVENT_BROKER', 'group_events.LocalBroker')
+        self.broker = import_string(broker_class)(app)
+        self.heartbeat_interval = app.config.get('GROUP_EVENT_HEARTBEAT', 15)
+        self.max_subscribers = app.config.get('GROUP_EVENT_MAX_SUBSCRIBERS', 1000)
+
+    def publish(self, group_ids, event, data):
+        """向决策组发布事件，应在数据库事务提交后调用"""
+        for group_id in group_ids:
+            self.broker.publish(group_id, {'event': event, 'data': data})
+
+    def subscribe(self, group_id):
+        """订阅决策组事件，本进程连接数已达上限时返回 None"""
+        with self._lock:
+            if len(self._active) >= self.max_subscribers:
+                return None
+            subscription = self.broker.subscribe(group_id)
+            self._active.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """取消订阅，可重复调用（响应关闭和生成器结束时都会调用）"""
+        with self._lock:
+            if subscription not in self._active:
+                return
+            self._active.discard(subscription)
+        self.broker.unsubscribe(subscription)
+
+    def stream(self, subscription):
+        """
+        SSE 响应体生成器。请求返回前先订阅，避免订阅前发生的事件丢失；
+        长时间没有事件时发送注释行作为心跳，及时发现已断开的连接。
+        """
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                message = subscription.get(self.heartbeat_interval)
+                if message is None:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+group_events = GroupEvents()
@@ -0,0 +1,124 @@
+import codecs
+import csv
+import json
+from sqlalchemy import insert
+from shared_models import DecisionGroup, GroupMembers, User, db
+
+# 成员标识字段：上传的每一行按其中一个字段查找用户
+MEMBER_FIELDS = ('user_id', 'username', 'email')
+
+
+def add_members(group_id, user_ids, role='invitee'):
+    """
+    一条 INSERT IGNORE 批量加入成员，已是成员的用户不会报错也不会改变角色。
+    先锁定决策组行，同一决策组的并发邀请在各自事务提交前依次执行；已有成员用加锁读取查询，
+    读到其他事务已提交的最新数据而不是事务开始时的快照，因此同一用户只会被一个请求报告为新加入。
+    :return: 本次新加入的用户ID列表
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return []
+    db.session.query(DecisionGroup.id).filter(DecisionGroup.id == group_id).with_for_update().first()
+    existing = {row.user_id for row in db.session.query(GroupMembers.user_id).filter(
+        GroupMembers.group_id == group_id,
+        GroupMembers.user_id.in_(user_ids)
+    ).with_for_update().all()}
+    added = [user_id for user_id in user_ids if user_id not in existing]
+    if added:
+        db.session.execute(insert(GroupMembers.__table__).prefix_with('IGNORE').values([
+            {'group_id': group_id, 'user_id': user_id, 'role': role} for user_id in added
+        ]))
+    return added
+
+
+def member_entry(record):
+    """从一行邀请数据中取出 (字段, 值)，没有可用字段时返回 None"""
+    if not isinstance(record, dict):
+        return None
+    for field in MEMBER_FIELDS:
+        value = record.get(field)
+        if value is None or str(value).strip() == '':
+            continue
+        value = str(value).strip()
+        if field == 'user_id':
+            if not value.isdigit():
+                return None
+            return field, int(value)
+        # 用户名、邮箱按 MySQL 默认排序规则不区分大小写匹配
+        return field, value.lower()
+    return None
+
+
+def resolve_entries(entries):
+    """按字段各一次 IN 查询把 (字段, 值) 解析为用户，返回 {(字段, 值): (用户ID, 用户名)}"""
+    values = {}
+    for field, value in entries:
+        values.setdefault(field, set()).add(value)
+    resolved = {}
+    for field, field_values in values.items():
+        column = getattr(User, 'id' if field == 'user_id' else field)
+        for user in db.session.query(User.id, User.username, User.email).filter(column.in_(field_values)).all():
+            key_value = user.id if field == 'user_id' else getattr(user, field).lower()
+            resolved[(field, key_value)] = (user.id, user.username)
+    return resolved
+
+
+def invite_batch(group_id, records):
+    """
+    处理一批邀请：解析用户、一条 INSERT IGNORE 写入成员并提交。
+    :return: (每个成员的处理结果列表, 新加入成员列表 [(用户ID, 用户名)])
+    """
+    entries = [member_entry(record) for record in records]
+    resolved = resolve_entries([entry for entry in entries if entry])
+    added = set(add_members(group_id, [resolved[entry][0] for entry in entries if entry in resolved]))
+    db.session.commit()
+
+    results = []
+    joined = []
+    for record, entry in zip(records, entries):
+        if entry is None:
+            results.append({'input': str(record)[:100], 'status': 'invalid'})
+            continue
+        field, value = entry
+        if entry not in resolved:
+            results.append({field: value, 'status': 'not_found'})
+            continue
+        user_id, username = resolved[entry]
+        if user_id in added:
+            added.discard(user_id)  # 同一用户在一批中出现多次时只算一次加入
+            joined.append((user_id, username))
+            results.append({field: value, 'user_id': user_id, 'status': 'added'})
+        else:
+            results.append({field: value, 'user_id': user_id, 'status': 'already_member'})
+    return results, joined
+
+
+def iter_invite_records(stream, content_type):
+    """
+    逐行读取上传的邀请列表，不把整个文件读入内存。
+    text/csv 需要表头包含 user_id、username 或 email 之一；application/x-ndjson 每行一个 JSON 对象。
+    """
+    # 单行最多读取 64KB，超长的行会被拆开并按无效数据处理
+    lines = codecs.iterdecode(iter(lambda: stream.readline(65536), b''), 'utf-8-sig')
+    if content_type == 'text/csv':
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line
+
+
+def batched(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,30 @@
+# gunicorn.conf.py
+# 生产环境启动：gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# 默认 gevent worker：启动时替换标准库的 socket、threading、queue 等为协程版本，
+# 空闲的 SSE 连接（决策组事件推送）只占一个 greenlet，单个进程可以保持数千个连接。
+# 所有请求和后台线程共用一个事件循环，CPU 密集的操作（嵌入式搜索索引合并、大结果集序列化）
+# 和 fsync 期间其他连接都会停顿；启用 SEARCH_BACKEND = 'embedded' 或
+# REFERENCE_COUNT_WRITE_BEHIND 时可改用线程 worker：GUNICORN_WORKER_CLASS=gthread，
+# 此时每个 SSE 连接占用一个线程，连接数受 GUNICORN_THREADS 和 GROUP_EVENT_MAX_SUBSCRIBERS 限制
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+threads = int(os.environ.get('GUNICORN_THREADS', 64))
+
+# 决策组事件默认使用进程内发布订阅（GROUP_EVENT_BROKER），多个 worker 之间收不到彼此的事件，
+# 也不能把 SSE 单独交给另一组进程；配置跨进程的 broker 之前保持 1 个 worker
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+
+# worker 心跳超时：gevent 和 gthread worker 由事件循环上报心跳，长连接不会因此被中断；
+# 事件循环被阻塞超过该时间时 master 重启 worker
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+
+
+def post_worker_init(worker):
+    """应用加载后在每个 worker 中启动后台线程（引用计数写回、软删除压缩、搜索索引维护）"""
+    from app import start_background_tasks
+    start_background_tasks()
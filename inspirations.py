@@ -4,6 +4,8 @@ from shared_models import Inspiration,Reflection, db
 from datetime import datetime as dt
 from flask_login import current_user, login_required
 from sqlalchemy import func
+from search_engine import filter_ranked, search_engine
+from utils import conditional_get
 inspiration_bp = Blueprint('inspiration', __name__)
 
 @inspiration_bp.route('/api/inspirations/random', methods=['GET'])
@@ -30,21 +32,31 @@ def get_random_inspirations():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def inspiration_list_version():
+    """列表的版本戳；删除不会推进 MAX(updated_at)，不返回 Last-Modified，只用 ETag 判断"""
+    count, updated_at = db.session.query(func.count(Inspiration.id), func.max(Inspiration.updated_at)).one()
+    return (count, updated_at), None
+
 @inspiration_bp.route('/api/inspirations', methods=['GET'])
+@conditional_get(stamp=inspiration_list_version)
 def get_inspirations():
     """获取启发内容列表（分页）"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 2, type=int)
     search = request.args.get('search')
     query = Inspiration.query
-    if search:
-        query = query.filter(db.or_(
-                Inspiration.content.ilike(f"%{search}%"),
-                Inspiration.description.ilike(f"%{search}%")
-            ))
-    pagination = query.order_by(
-        Inspiration.updated_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    # 启用嵌入式搜索时按相关度排序
+    ids = search_engine.search_ids(Inspiration, search) if search else None
+    if ids is not None:
+        query = filter_ranked(query, Inspiration, ids)
+    else:
+        if search:
+            query = query.filter(db.or_(
+                    Inspiration.content.ilike(f"%{search}%"),
+                    Inspiration.description.ilike(f"%{search}%")
+                ))
+        query = query.order_by(Inspiration.updated_at.desc())
+    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     
     inspirations = [{
         'id': item.id,
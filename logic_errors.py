@@ -5,10 +5,12 @@ from sqlalchemy import desc
 from shared_models import AnalysisContent, AnalysisData, Article, LogicError,PlatformArticle, db
 from datetime import datetime as dt
 from flask_login import current_user
+from utils import conditional_get, json_limits
 
 logic_errors_bp = Blueprint('logic_errors', __name__)
 
 @logic_errors_bp.route('/api/logic-errors', methods=['GET'])
+@conditional_get()
 def get_logic_errors():
     logic_errors = LogicError.query.all()
     return jsonify([
@@ -22,6 +24,7 @@ def get_logic_errors():
     ])
 
 @logic_errors_bp.route('/api/save_fact_opinion_analysis', methods=['POST'])
+@json_limits(max_bytes=1024 * 1024, max_depth=8, max_array_length=500)
 def save_fact_opinion_analysis():
     data = request.get_json()
     content=data.get('content')
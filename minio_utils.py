@@ -1,7 +1,17 @@
+import hashlib
 import threading
-from flask import Blueprint, request, jsonify
+import uuid
+from datetime import datetime as dt, timedelta
+from flask import Blueprint, Response, current_app, redirect, request, jsonify, send_file
+from flask_login import current_user, login_required
 from minio import Minio
+from minio.commonconfig import CopySource
+from minio.datatypes import PostPolicy
 from minio.error import S3Error
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData, Preamble
+from file_cache import file_cache
+from shared_models import StoredObject, db
 import os
 import re
 import time
@@ -9,15 +19,17 @@ from urllib.parse import quote
 
 minio_bp = Blueprint('minio', __name__)
 minio_client = None
+MINIO_ENDPOINT = 'localhost:9000'  # MinIO 的地址（预签名直传时客户端也直接访问该地址）
+MINIO_SECURE = False  # 如果使用的是 HTTP 而不是 HTTPS
 # 配置 MinIO 客户端
 def initialize_minio():
     global minio_client
     try:
         minio_client = Minio(
-            'localhost:9000',  # MinIO 的地址
+            MINIO_ENDPOINT,
             access_key='minioadmin',  # MinIO 的访问密钥
             secret_key='minioadmin',  # MinIO 的私密密钥
-            secure=False  # 如果使用的是 HTTP 而不是 HTTPS
+            secure=MINIO_SECURE
         )
     except S3Error as e:
         minio_client = None
@@ -42,47 +54,98 @@ else:
 
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
+UPLOAD_PART_SIZE = 5 * 1024 * 1024  # MinIO 分片上传的最小分片大小
+UPLOAD_READ_SIZE = 64 * 1024  # 每次从请求体读取的字节数
+MULTIPART_OVERHEAD = 64 * 1024  # multipart 边界、分片头和普通字段的余量
+MAX_FIELD_SIZE = 1024  # 普通表单字段（type）的最大长度
+STAGING_PREFIX = 'staging/'  # type 字段在文件之后才到达时的暂存路径
+
+
+class FileTooLarge(Exception):
+    pass
+
+
 @minio_bp.before_request
 def check_file_size():
-    if request.method == 'POST':
-        # 处理单文件上传
-        if 'file' in request.files:
-            file = request.files['file']
-            file.seek(0, 2)  # 移动到文件末尾
-            size = file.tell()
-            file.seek(0)  # 重置文件指针
-            if size > MAX_FILE_SIZE:
-                return jsonify({'error': f'单个文件大小不能超过 {MAX_FILE_SIZE//(1024*1024)}MB'}), 400
-        
-        # 处理多文件上传 (字段名为 files[])
-        elif 'files[]' in request.files:
-            for file in request.files.getlist('files[]'):
-                file.seek(0, 2)
-                size = file.tell()
-                file.seek(0)
-                if size > MAX_FILE_SIZE:
-                    return jsonify({
-                        'error': f'文件 {file.filename} 大小超过限制 ({MAX_FILE_SIZE//(1024*1024)}MB)'
-                    }), 400
-        
-        # 处理自定义多文件字段名
-        else:
-            for file_field in request.files:
-                for file in request.files.getlist(file_field):
-                    file.seek(0, 2)
-                    size = file.tell()
-                    file.seek(0)
-                    if size > MAX_FILE_SIZE:
-                        return jsonify({
-                            'error': f'文件 {file.filename} 大小超过限制 ({MAX_FILE_SIZE//(1024*1024)}MB)'
-                        }), 400
-        
-def mixed_filename(original_filename):
+    # 只检查声明的请求体大小，不触发表单解析；没有 Content-Length 的分块上传在读取时限制
+    if request.method == 'POST' and request.content_length is not None \
+            and request.content_length > MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+        return jsonify({'error': f'单个文件大小不能超过 {MAX_FILE_SIZE//(1024*1024)}MB'}), 400
+
+
+def multipart_events(stream, boundary):
+    """
+    增量解析 multipart/form-data 请求体，依次产生 Field / File / Data 事件。
+    每次只读取 UPLOAD_READ_SIZE 字节，不写临时文件也不缓存整个请求体。
+    """
+    decoder = MultipartDecoder(boundary, max_form_memory_size=UPLOAD_READ_SIZE * 16)
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            decoder.receive_data(stream.read(UPLOAD_READ_SIZE) or None)
+        elif isinstance(event, Epilogue):
+            return
+        elif not isinstance(event, Preamble):
+            yield event
+
+
+def read_field(events):
+    """读取普通字段的值"""
+    value = bytearray()
+    for event in events:
+        value.extend(event.data)
+        if len(value) > MAX_FIELD_SIZE:
+            raise ValueError('Form field too large')
+        if not event.more_data:
+            break
+    return value.decode('utf-8')
+
+
+def skip_part(events):
+    for event in events:
+        if not event.more_data:
+            break
+
+
+class PartReader:
+    """
+    把当前文件分片的 Data 事件包装成 put_object 需要的 read()，
+    读取的同时计算 sha256，累计超过 max_size 时抛出 FileTooLarge（put_object 会中止分片上传）。
+    """
+
+    def __init__(self, events, max_size):
+        self._events = events
+        self._buffer = bytearray()
+        self._more = True
+        self.max_size = max_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        # 返回空字节表示读完，因此缓冲为空时一直读到有数据或分片结束
+        while self._more and (not self._buffer or size is None or size < 0):
+            event = next(self._events)
+            if not isinstance(event, Data):
+                raise ValueError('Unexpected multipart event')
+            self._more = event.more_data
+            self.size += len(event.data)
+            if self.size > self.max_size:
+                raise FileTooLarge()
+            self.sha256.update(event.data)
+            self._buffer.extend(event.data)
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def mixed_filename(original_filename, unique=None):
+    """对象文件名：唯一前缀（默认为当前秒级时间戳）加原文件名的前10个安全字符（包括中文）"""
     base, ext = os.path.splitext(original_filename)
-    # 保留前10个安全字符（包括中文）
     safe_base = re.sub(r'[^\w\u4e00-\u9fa5]', '', base)[:10] 
-    timestamp = int(time.time())
-    return f"{timestamp}_{safe_base}{ext}"
+    prefix = unique or int(time.time())
+    return f"{prefix}_{safe_base}{ext}"
 
 ALLOWED_EXTENSIONS = {
     'avatar': {'jpg', 'jpeg', 'png'},
@@ -93,70 +156,349 @@ ALLOWED_EXTENSIONS = {
     'review': {'jpg', 'jpeg', 'png'}
 }
 
+# 允许上传的业务类型和对应路径
+UPLOAD_TYPES = {
+    'avatar': 'avatar/',
+    'article': 'article/',
+    'feedback': 'feedback/',
+    'inspiration': 'inspiration/',
+    'reflection': 'reflection/',
+    'review': 'review/'
+}
+
 def allowed_file(filename, business_type):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS.get(business_type, set())
            
 @minio_bp.route('/upload', methods=['POST'])
 def upload_file():
-    # 获取业务类型参数
-    business_type = request.form.get('type')
-    
-    # 定义允许的业务类型和对应路径
-    ALLOWED_TYPES = {
-        'avatar': 'avatar/',
-        'article': 'article/',
-        'feedback': 'feedback/',
-        'inspiration': 'inspiration/',
-        'reflection': 'reflection/',
-        'review': 'review/'
-    }
-    
-    # 验证业务类型
-    if not business_type or business_type not in ALLOWED_TYPES:
+    """
+    流式上传：边解析请求体边按 UPLOAD_PART_SIZE 分片上传到 MinIO，同时计算 sha256。
+    type 可以放在查询参数或文件之前的表单字段中；在文件之后才到达时先上传到暂存路径，
+    校验通过后在 MinIO 内复制到正式路径（暂存路径可配置存储桶生命周期规则清理）。
+    """
+    def invalid_type_response():
         return jsonify({
             'error': 'Invalid or missing type parameter',
-            'allowed_types': list(ALLOWED_TYPES.keys())
+            'allowed_types': list(UPLOAD_TYPES.keys())
         }), 400
 
-    if 'file' not in request.files:
+    def invalid_file_response(business_type):
+        return jsonify({
+            'error': 'Invalid file type',
+            'allowed_file_types': list(ALLOWED_EXTENSIONS.get(business_type))
+        }), 400
+
+    mimetype, options = parse_options_header(request.headers.get('Content-Type', ''))
+    if mimetype != 'multipart/form-data' or not options.get('boundary'):
         return jsonify({'error': 'No file part'}), 400
 
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+    business_type = request.args.get('type')
+    if business_type is not None and business_type not in UPLOAD_TYPES:
+        return invalid_type_response()
+
+    events = multipart_events(request.stream, options['boundary'].encode('latin-1'))
+    uploaded = None
+    try:
+        for event in events:
+            if isinstance(event, Field) and event.name == 'type':
+                value = read_field(events)
+                if business_type is None:
+                    if value not in UPLOAD_TYPES:
+                        return invalid_type_response()
+                    business_type = value
+                continue
+            if not isinstance(event, File) or event.name != 'file' or uploaded is not None:
+                skip_part(events)
+                continue
+
+            if event.filename == '':
+                return jsonify({'error': 'No selected file'}), 400
+            if business_type is not None and not allowed_file(event.filename, business_type):
+                return invalid_file_response(business_type)
+            if business_type is not None:
+                object_name = UPLOAD_TYPES[business_type] + mixed_filename(event.filename)
+            else:
+                object_name = STAGING_PREFIX + uuid.uuid4().hex
+
+            reader = PartReader(events, MAX_FILE_SIZE)
+            minio_client.put_object(
+                BUCKET_NAME,
+                object_name,
+                reader,
+                -1,
+                content_type=event.headers.get('Content-Type', 'application/octet-stream'),
+                part_size=UPLOAD_PART_SIZE
+            )
+            uploaded = (event.filename, object_name, reader)
+    except FileTooLarge:
+        return jsonify({'error': f'单个文件大小不能超过 {MAX_FILE_SIZE//(1024*1024)}MB'}), 400
+    except ValueError as err:
+        return jsonify({'error': f'Invalid multipart body: {err}'}), 400
+    except S3Error as err:
+        return jsonify({'error': str(err)}), 500
+
+    if uploaded is None:
+        return jsonify({'error': 'No file part'}), 400
+    original_filename, filename, reader = uploaded
+
+    try:
+        if filename.startswith(STAGING_PREFIX):
+            staging_name = filename
+            if business_type is None:
+                minio_client.remove_object(BUCKET_NAME, staging_name)
+                return invalid_type_response()
+            if not allowed_file(original_filename, business_type):
+                minio_client.remove_object(BUCKET_NAME, staging_name)
+                return invalid_file_response(business_type)
+            filename = UPLOAD_TYPES[business_type] + mixed_filename(original_filename)
+            minio_client.copy_object(BUCKET_NAME, filename, CopySource(BUCKET_NAME, staging_name))
+            minio_client.remove_object(BUCKET_NAME, staging_name)
+    except S3Error as err:
+        return jsonify({'error': str(err)}), 500
+    file_cache.forget(filename)
+
+    file_url = f'http://localhost:5000/files/{filename}'
+    return jsonify({
+        'url': file_url,
+        'filename': filename,
+        'size': reader.size,
+        'sha256': reader.sha256.hexdigest()
+    }), 200
 
-    if not allowed_file(file.filename,business_type):
+def presigned_enabled():
+    return current_app.config.get('MINIO_PRESIGNED_URLS', False)
+
+
+def presign_expires():
+    return timedelta(seconds=current_app.config.get('MINIO_PRESIGN_EXPIRES', 600))
+
+
+@minio_bp.route('/upload/presign', methods=['POST'])
+def presign_upload():
+    """
+    签发预签名 POST 表单，客户端直接把文件上传到 MinIO，应用服务器不经手文件内容。
+    POST 策略限定对象路径为本次的暂存路径、文件大小为 1 到声明的字节数，超出时由 MinIO 拒绝上传；
+    客户端把 fields 中的字段和最后一个 file 字段以 multipart/form-data 提交到 upload_url。
+    完成回调再次校验后在 MinIO 内复制到正式路径，之后即使再用该表单上传也不会影响已登记的对象。
+    """
+    if not presigned_enabled():
+        return jsonify({'error': 'Presigned uploads are disabled'}), 400
+
+    data = request.get_json(silent=True) or {}
+    business_type = data.get('type')
+    original_filename = data.get('filename') or ''
+    declared_size = data.get('size')
+    if business_type not in UPLOAD_TYPES:
+        return jsonify({
+            'error': 'Invalid or missing type parameter',
+            'allowed_types': list(UPLOAD_TYPES.keys())
+        }), 400
+    if not allowed_file(original_filename, business_type):
         return jsonify({
             'error': 'Invalid file type',
-            'allowed_file_types': ALLOWED_EXTENSIONS.get(business_type)
+            'allowed_file_types': list(ALLOWED_EXTENSIONS.get(business_type))
         }), 400
-    # 将文件名安全化并添加业务路径前缀
-    filename = ALLOWED_TYPES[business_type] + mixed_filename(file.filename)
+    if not isinstance(declared_size, int) or isinstance(declared_size, bool) or declared_size <= 0:
+        return jsonify({'error': 'Invalid or missing size parameter'}), 400
+    if declared_size > MAX_FILE_SIZE:
+        return jsonify({'error': f'单个文件大小不能超过 {MAX_FILE_SIZE//(1024*1024)}MB'}), 400
 
+    upload_id = uuid.uuid4().hex
+    expires = presign_expires()
+    stored = StoredObject(
+        id=upload_id,
+        user_id=current_user.id if current_user.is_authenticated else None,
+        business_type=business_type,
+        staging_name=STAGING_PREFIX + upload_id,
+        # 正式路径用上传ID保证唯一，同一秒内签发同名文件不会冲突
+        object_name=UPLOAD_TYPES[business_type] + mixed_filename(original_filename, upload_id),
+        original_filename=original_filename[:255],
+        declared_size=declared_size,
+        expires_at=dt.utcnow() + expires
+    )
+    policy = PostPolicy(BUCKET_NAME, stored.expires_at)
+    policy.add_equals_condition('key', stored.staging_name)
+    policy.add_content_length_range_condition(1, declared_size)
     try:
-        # 将文件保存到 MinIO
-        minio_client.put_object(
-            BUCKET_NAME,
-            filename,
-            file.stream,
-            os.fstat(file.fileno()).st_size,
-            content_type=file.content_type
-        )
+        fields = minio_client.presigned_post_policy(policy)
+    except (S3Error, ValueError) as err:
+        return jsonify({'error': str(err)}), 500
+    fields['key'] = stored.staging_name
+    try:
+        db.session.add(stored)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Presigned upload registration failed: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Failed to register upload'}), 500
 
-        # 生成可访问的 presigned URL
-        file_url = f'http://localhost:5000/files/{filename}'
+    return jsonify({
+        'id': upload_id,
+        'upload_url': f"{'https' if MINIO_SECURE else 'http'}://{MINIO_ENDPOINT}/{BUCKET_NAME}",
+        'method': 'POST',
+        'fields': fields,
+        'max_size': declared_size,
+        'expires_at': stored.expires_at.isoformat()
+    }), 200
 
-        return jsonify({'url': file_url,'filename':filename}), 200
 
-    except S3Error as err:
-        return jsonify({'error': str(err)}), 500
+@minio_bp.route('/upload/complete', methods=['POST'])
+def complete_upload():
+    """
+    预签名上传的完成回调：stat 暂存对象再次校验大小，通过后复制到正式路径并登记为 ready。
+    返回格式与 /upload 相同；重复回调返回已登记的结果。
+    """
+    if not presigned_enabled():
+        return jsonify({'error': 'Presigned uploads are disabled'}), 400
+
+    data = request.get_json(silent=True) or {}
+    stored = db.session.get(StoredObject, str(data.get('id') or ''))
+    user_id = current_user.id if current_user.is_authenticated else None
+    if stored is None or stored.user_id != user_id:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    if stored.status == 'pending':
+        try:
+            stat = minio_client.stat_object(BUCKET_NAME, stored.staging_name)
+        except S3Error:
+            return jsonify({'error': 'File has not been uploaded'}), 400
+
+        if stat.size > min(stored.declared_size, MAX_FILE_SIZE):
+            try:
+                minio_client.remove_object(BUCKET_NAME, stored.staging_name)
+            except S3Error:
+                pass  # 由 expire-uploads 清理
+            db.session.delete(stored)
+            db.session.commit()
+            return jsonify({'error': f'文件大小超过签发时声明的 {stored.declared_size} 字节'}), 400
+
+        try:
+            # 按 ETag 复制，避免复制到 stat 之后又被覆盖的内容
+            result = minio_client.copy_object(
+                BUCKET_NAME, stored.object_name,
+                CopySource(BUCKET_NAME, stored.staging_name, match_etag=stat.etag)
+            )
+            minio_client.remove_object(BUCKET_NAME, stored.staging_name)
+        except S3Error as err:
+            return jsonify({'error': str(err)}), 500
+
+        file_cache.forget(stored.object_name)
+        stored.status = 'ready'
+        stored.size = stat.size
+        stored.etag = result.etag
+        stored.completed_at = dt.utcnow()
+        db.session.commit()
+
+    return jsonify({
+        'url': f'http://localhost:5000/files/{stored.object_name}',
+        'filename': stored.object_name,
+        'size': stored.size
+    }), 200
+
+
+@minio_bp.cli.command('expire-uploads')
+def expire_uploads_command():
+    """清理过期未完成的预签名上传（暂存对象和登记行）：flask minio expire-uploads"""
+    grace = timedelta(seconds=current_app.config.get('MINIO_PENDING_UPLOAD_GRACE', 3600))
+    expired = StoredObject.query.filter(
+        StoredObject.status == 'pending',
+        StoredObject.expires_at < dt.utcnow() - grace
+    ).all()
+    for stored in expired:
+        try:
+            minio_client.remove_object(BUCKET_NAME, stored.staging_name)
+        except S3Error:
+            pass
+        db.session.delete(stored)
+    db.session.commit()
+    print(f"Expired {len(expired)} pending uploads.")
+
 
 def rfc5987_encode(filename):
     return "filename*=utf-8''{}".format(quote(filename, safe=''))
 
+FILE_CHUNK_SIZE = 64 * 1024  # 下载时每次从 MinIO 读取并发送的字节数
+
+
+def not_modified(etag, last_modified):
+    """If-None-Match / If-Modified-Since 是否与对象当前版本匹配（有 If-None-Match 时忽略 If-Modified-Since）"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is not None and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def if_range_matches(etag, last_modified):
+    """If-Range 与当前版本不一致时应忽略 Range 返回完整对象"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified is not None and last_modified.replace(microsecond=0) == if_range.date
+    return True
+
+
+def requested_range(size, etag, last_modified):
+    """
+    解析单个字节范围：返回 (起始, 结束) ；没有可用的 Range 时返回 None；
+    范围无法满足时返回 False
+    """
+    if request.range is None or len(request.range.ranges) != 1 or not if_range_matches(etag, last_modified):
+        return None
+    return request.range.range_for_length(size) or False
+
+
+def stream_object(object_path, offset=0, length=0):
+    """按块读取 MinIO 对象（length 为 0 时读到末尾），发送完毕或客户端断开时释放连接"""
+    response = minio_client.get_object(BUCKET_NAME, object_path, offset=offset, length=length)
+    try:
+        for chunk in response.stream(FILE_CHUNK_SIZE):
+            yield chunk
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def cached_file_response(object_path, filename, stat):
+    """
+    从本地磁盘缓存发送对象：未命中时下载到缓存，send_file 处理 Range 和条件请求，
+    WSGI 服务器提供 file_wrapper 时使用 sendfile 零拷贝发送。缓存文件被其他进程淘汰时返回 None。
+    """
+    def fetch(f):
+        for chunk in stream_object(object_path):
+            f.write(chunk)
+
+    try:
+        with file_cache.open(object_path, stat.etag, fetch) as path:
+            return send_file(
+                path,
+                mimetype=stat.content_type or 'application/octet-stream',
+                download_name=filename,
+                etag=stat.etag,
+                last_modified=stat.last_modified
+            )
+    except FileNotFoundError:
+        file_cache.discard(object_path, stat.etag)
+        return None
+
+
+@minio_bp.route('/file_cache/stats', methods=['GET'])
+@login_required
+def get_file_cache_stats():
+    """本地文件缓存的命中率等统计"""
+    return jsonify(file_cache.stats()), 200
+
+
 @minio_bp.route('/files/<business_type>/<filename>', methods=['GET'])
 def serve_file(business_type, filename):
+    """
+    流式下载：先 stat 对象取得大小、ETag 和修改时间，条件请求匹配时返回 304；
+    不超过 FILE_CACHE_MAX_OBJECT_SIZE 的对象经本地磁盘缓存发送，
+    其他对象把单个 Range 映射为 MinIO 的范围读取，不把对象读入内存。
+    开启 MINIO_PRESIGNED_URLS 时直接重定向到预签名 GET URL。
+    """
     # 定义允许的业务类型和对应路径
     ALLOWED_TYPES = {
         'avatar': 'avatar/',
@@ -176,11 +518,69 @@ def serve_file(business_type, filename):
     # 构建完整的存储路径
     object_path = ALLOWED_TYPES[business_type] + filename
     
+    if presigned_enabled():
+        # 重定向到短时有效的预签名 GET URL，由 MinIO 直接处理 Range 和条件请求
+        try:
+            url = minio_client.presigned_get_object(
+                BUCKET_NAME, object_path, expires=presign_expires(),
+                response_headers={'response-content-disposition': f'inline; {rfc5987_encode(filename)}'}
+            )
+        except S3Error as err:
+            return jsonify({'error': str(err)}), 500
+        response = redirect(url, code=302)
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+
     try:
-        response = minio_client.get_object(BUCKET_NAME, object_path)
-        return response.data, 200, {
-            'Content-Type': response.headers['Content-Type'],
-            'Content-Disposition': f'inline; filename={rfc5987_encode(filename)}'
-        }
+        # 元数据在本地缓存一段时间，缓存命中的对象不访问 MinIO
+        stat = file_cache.stat(object_path, lambda: minio_client.stat_object(BUCKET_NAME, object_path))
     except S3Error as err:
         return jsonify({'error': str(err)}), 404
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': f'inline; filename={rfc5987_encode(filename)}'
+    }
+    if not not_modified(stat.etag, stat.last_modified) and file_cache.enabled \
+            and stat.size <= file_cache.max_object_size:
+        try:
+            response = cached_file_response(object_path, filename, stat)
+        except S3Error as err:
+            file_cache.forget(object_path)
+            return jsonify({'error': str(err)}), 404
+        if response is not None:
+            response.headers['Accept-Ranges'] = 'bytes'
+            return response
+
+    if not_modified(stat.etag, stat.last_modified):
+        response = Response(status=304, headers=headers)
+    else:
+        byte_range = requested_range(stat.size, stat.etag, stat.last_modified)
+        if byte_range is False:
+            return Response(status=416, headers={'Content-Range': f'bytes */{stat.size}'})
+        start, stop = byte_range or (0, stat.size)
+        try:
+            # 先建立连接，对象在 stat 之后被删除时仍能返回 404
+            chunks = stream_object(object_path, start, stop - start)
+            first = next(chunks, b'')
+        except S3Error as err:
+            file_cache.forget(object_path)
+            return jsonify({'error': str(err)}), 404
+
+        def body():
+            yield first
+            yield from chunks
+
+        response = Response(
+            body(),
+            status=206 if byte_range else 200,
+            headers=headers,
+            content_type=stat.content_type or 'application/octet-stream',
+            direct_passthrough=True
+        )
+        response.content_length = stop - start
+        if byte_range:
+            response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{stat.size}'
+    response.set_etag(stat.etag)
+    response.last_modified = stat.last_modified
+    return response
@@ -0,0 +1,44 @@
+import base64
+from datetime import datetime as dt
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at, row_id):
+    """把 (created_at, id) 编码为不透明的游标字符串"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标，返回 (created_at, id)
+    :raises ValueError: 游标格式不正确
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.split('|')
+        return dt.fromisoformat(created_at), int(row_id)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def keyset_page(query, created_column, id_column, cursor, limit):
+    """
+    按 (created_at DESC, id DESC) 做键集分页：从游标位置向后取 limit 条，
+    不使用 OFFSET，翻到多深都只扫描一页索引。
+    :return: (rows, next_cursor)，没有更多数据时 next_cursor 为 None
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            created_column < created_at,
+            and_(created_column == created_at, id_column < row_id)
+        ))
+    # 多取一条判断是否还有下一页
+    rows = query.order_by(created_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
@@ -0,0 +1,452 @@
+import hashlib
+import json
+import threading
+from collections import namedtuple
+from sqlalchemy import bindparam, case, delete, exists, func, insert, select, text, update
+from cache_utils import LRUCache
+from shared_models import Checklist, ChecklistAnswer, ChecklistDecision, ChecklistQuestion, ChecklistVersionQuestion, db
+
+ID_BLOCK_SIZE = 200  # 每次向 id_sequence 申请的号段大小
+
+# 某个清单版本中的问题：内容来自共享的问题行，结构（父问题、选项关联）来自该版本的 manifest
+VersionQuestion = namedtuple('VersionQuestion', [
+    'id', 'checklist_id', 'type', 'question', 'description', 'options', 'follow_up_questions', 'parent_id'
+])
+
+
+class HiLoIdAllocator:
+    """
+    hi/lo 主键分配器。
+    每次从 id_sequence 表中原子地领取一段号段（hi），号段内的 id（lo）在进程内分配，
+    因此批量插入前就能确定每一行的最终 id，不再依赖 LAST_INSERT_ID() 的连续性假设。
+    目标表的所有插入都必须经过分配器，否则自增值可能落入已领取的号段：
+    批量插入显式分配 id，模型的主键默认值（shared_models.allocated_id）覆盖其他 ORM 和 Core 插入；
+    应用之外写入这些表时同样需要从 id_sequence 领取号段。
+    """
+
+    def __init__(self, sequence_name, table_name, block_size=ID_BLOCK_SIZE):
+        self.sequence_name = sequence_name
+        self.table_name = table_name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._block_end = 0  # 不含
+
+    def allocate(self, count):
+        """分配 count 个互不重复的 id"""
+        ids = []
+        with self._lock:
+            while len(ids) < count:
+                if self._next_id >= self._block_end:
+                    self._reserve_block(max(self.block_size, count - len(ids)))
+                take = min(count - len(ids), self._block_end - self._next_id)
+                ids.extend(range(self._next_id, self._next_id + take))
+                self._next_id += take
+        return ids
+
+    def _reserve_block(self, size):
+        # 使用独立连接的短事务领取号段，序列行锁不会持有到业务事务结束
+        with db.engine.begin() as conn:
+            # 首次使用时以目标表当前最大 id 作为起点
+            conn.execute(
+                text(f"INSERT IGNORE INTO id_sequence (name, next_val) "
+                     f"SELECT :name, COALESCE(MAX(id), 0) + 1 FROM {self.table_name}"),
+                {'name': self.sequence_name}
+            )
+            conn.execute(
+                text("UPDATE id_sequence SET next_val = next_val + :size WHERE name = :name"),
+                {'name': self.sequence_name, 'size': size}
+            )
+            block_end = conn.execute(
+                text("SELECT next_val FROM id_sequence WHERE name = :name"),
+                {'name': self.sequence_name}
+            ).scalar()
+        self._next_id = block_end - size
+        self._block_end = block_end
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_allocator(model):
+    """每个模型（表）共享一个进程级分配器"""
+    return _table_allocator(model.__table__.name)
+
+
+def allocate_id(table_name):
+    """为单行插入分配一个 id（模型主键的默认值）"""
+    return _table_allocator(table_name).allocate(1)[0]
+
+
+def _table_allocator(table_name):
+    with _allocators_lock:
+        if table_name not in _allocators:
+            _allocators[table_name] = HiLoIdAllocator(table_name, table_name)
+        return _allocators[table_name]
+
+
+def content_hash(type, question, description, options):
+    """问题内容的摘要，内容相同的问题在版本之间共享同一行"""
+    payload = json.dumps([type, question, description, options], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_version_questions(checklist_id):
+    """
+    读取某个清单版本的全部问题。
+    已建立 manifest 的版本通过一次索引查询取回；尚未回填 manifest 的旧版本按行内字段读取。
+    """
+    rows = db.session.query(ChecklistQuestion, ChecklistVersionQuestion).join(
+        ChecklistVersionQuestion, ChecklistVersionQuestion.question_id == ChecklistQuestion.id
+    ).filter(
+        ChecklistVersionQuestion.checklist_id == checklist_id
+    ).order_by(ChecklistVersionQuestion.position).all()
+
+    if rows:
+        return [VersionQuestion(q.id, checklist_id, q.type, q.question, q.description, q.options,
+                                m.follow_up_questions, m.parent_id) for q, m in rows]
+
+    legacy_questions = ChecklistQuestion.query.filter_by(checklist_id=checklist_id).all()
+    return [VersionQuestion(q.id, checklist_id, q.type, q.question, q.description, q.options,
+                            q.follow_up_questions, q.parent_id) for q in legacy_questions]
+
+
+def persist_question_graph(checklist_id, nodes, base_checklist_id=None):
+    """
+    写入一个清单版本的问题图。
+    与基础版本内容相同的问题直接复用原问题行，只有新增或修改的问题才写入新行；
+    问题结构写入该版本的 manifest。新问题行和 manifest 各一次多行 INSERT。
+
+    :param checklist_id: 所属清单版本 ID
+    :param nodes: 节点列表，每个节点包含 key、parent_key、follow_ups（{选项: [key, ...]}）
+                  以及 type、question、description、options 字段
+    :param base_checklist_id: 基础版本 ID，为空时全部新建
+    :return: {key: 问题ID}
+    """
+    if not nodes:
+        return {}
+
+    # 基础版本中可复用的问题行 {内容摘要: [问题ID]}
+    reusable = {}
+    if base_checklist_id:
+        for question in load_version_questions(base_checklist_id):
+            digest = content_hash(question.type, question.question, question.description, question.options)
+            reusable.setdefault(digest, []).append(question.id)
+
+    key_to_id = {}
+    new_nodes = []
+    for node in nodes:
+        digest = content_hash(node.get('type', 'text'), node.get('question', ''),
+                              node.get('description', ''), node.get('options'))
+        candidates = reusable.get(digest)
+        if candidates:
+            key_to_id[node['key']] = candidates.pop(0)
+        else:
+            new_nodes.append((node, digest))
+
+    if new_nodes:
+        new_ids = get_allocator(ChecklistQuestion).allocate(len(new_nodes))
+        question_rows = []
+        for (node, digest), new_id in zip(new_nodes, new_ids):
+            key_to_id[node['key']] = new_id
+            question_rows.append({
+                'id': new_id,
+                'checklist_id': checklist_id,
+                'type': node.get('type', 'text'),
+                'question': node.get('question', ''),
+                'description': node.get('description', ''),
+                'options': node.get('options'),
+                'content_hash': digest
+            })
+        db.session.execute(insert(ChecklistQuestion.__table__).values(question_rows))
+
+    manifest_rows = []
+    for position, node in enumerate(nodes):
+        follow_ups = {}
+        for opt_index, child_keys in (node.get('follow_ups') or {}).items():
+            child_ids = [key_to_id[key] for key in child_keys if key in key_to_id]
+            if child_ids:
+                follow_ups[opt_index] = child_ids
+
+        manifest_rows.append({
+            'checklist_id': checklist_id,
+            'question_id': key_to_id[node['key']],
+            'position': position,
+            'parent_id': key_to_id.get(node.get('parent_key')),
+            'follow_up_questions': follow_ups or None
+        })
+    db.session.execute(insert(ChecklistVersionQuestion.__table__).values(manifest_rows))
+
+    return key_to_id
+
+
+def shared_question_ids(checklist_id, question_ids):
+    """返回同时被其他版本引用的问题ID"""
+    if not question_ids:
+        return set()
+    rows = db.session.query(ChecklistVersionQuestion.question_id).filter(
+        ChecklistVersionQuestion.question_id.in_(question_ids),
+        ChecklistVersionQuestion.checklist_id != checklist_id
+    ).distinct().all()
+    return {row.question_id for row in rows}
+
+
+def copy_on_write(checklist_id, replacements):
+    """
+    为被共享的问题行创建新内容行，并把本版本的 manifest 和本版本决策下的回答改指向新行，
+    其他版本继续使用原问题行。
+
+    :param replacements: {原问题ID: {'type', 'question', 'description', 'options'}}
+    :return: {原问题ID: 新问题ID}
+    """
+    if not replacements:
+        return {}
+
+    ensure_manifest(checklist_id)
+    old_ids = list(replacements)
+    new_ids = get_allocator(ChecklistQuestion).allocate(len(old_ids))
+    id_map = dict(zip(old_ids, new_ids))
+
+    db.session.execute(insert(ChecklistQuestion.__table__).values([{
+        'id': id_map[old_id],
+        'checklist_id': checklist_id,
+        'type': fields['type'],
+        'question': fields['question'],
+        'description': fields['description'],
+        'options': fields['options'],
+        'content_hash': content_hash(fields['type'], fields['question'], fields['description'], fields['options'])
+    } for old_id, fields in replacements.items()]))
+
+    manifest = ChecklistVersionQuestion.__table__
+
+    # 版本内的选项关联
+    follow_up_rows = db.session.execute(
+        select(manifest.c.question_id, manifest.c.follow_up_questions).where(
+            manifest.c.checklist_id == checklist_id,
+            manifest.c.follow_up_questions.isnot(None)
+        )
+    ).all()
+    follow_up_updates = []
+    for row in follow_up_rows:
+        remapped = {opt: [id_map.get(child_id, child_id) for child_id in child_ids]
+                    for opt, child_ids in row.follow_up_questions.items()}
+        if remapped != row.follow_up_questions:
+            follow_up_updates.append({'b_question_id': row.question_id, 'b_follow_ups': remapped})
+    if follow_up_updates:
+        db.session.execute(
+            update(manifest).where(
+                manifest.c.checklist_id == checklist_id,
+                manifest.c.question_id == bindparam('b_question_id')
+            ).values(follow_up_questions=bindparam('b_follow_ups')),
+            follow_up_updates
+        )
+
+    # 版本内的父问题与问题行本身
+    db.session.execute(
+        update(manifest).where(
+            manifest.c.checklist_id == checklist_id,
+            manifest.c.parent_id.in_(old_ids)
+        ).values(parent_id=case(id_map, value=manifest.c.parent_id))
+    )
+    db.session.execute(
+        update(manifest).where(
+            manifest.c.checklist_id == checklist_id,
+            manifest.c.question_id.in_(old_ids)
+        ).values(question_id=case(id_map, value=manifest.c.question_id))
+    )
+
+    # 本版本决策下的回答
+    answers = ChecklistAnswer.__table__
+    decision_ids = select(ChecklistDecision.id).where(ChecklistDecision.checklist_id == checklist_id)
+    db.session.execute(
+        update(answers).where(
+            answers.c.question_id.in_(old_ids),
+            answers.c.checklist_decision_id.in_(decision_ids)
+        ).values(question_id=case(id_map, value=answers.c.question_id))
+    )
+
+    return id_map
+
+
+def ensure_manifest(checklist_id):
+    """旧版本清单在需要按版本区分问题行时，先由行内字段生成 manifest"""
+    if ChecklistVersionQuestion.query.filter_by(checklist_id=checklist_id).first():
+        return
+    legacy_questions = ChecklistQuestion.query.filter_by(checklist_id=checklist_id).all()
+    if legacy_questions:
+        db.session.execute(insert(ChecklistVersionQuestion.__table__).values([{
+            'checklist_id': checklist_id,
+            'question_id': q.id,
+            'position': q.id,  # 旧数据按插入顺序排列
+            'parent_id': q.parent_id,
+            'follow_up_questions': q.follow_up_questions
+        } for q in legacy_questions]))
+
+
+def delete_version_questions(checklist_id):
+    """删除版本的 manifest；仍被其他版本引用的问题行转移归属，其余问题行一并删除"""
+    manifest = ChecklistVersionQuestion.__table__
+    questions = ChecklistQuestion.__table__
+
+    db.session.execute(delete(manifest).where(manifest.c.checklist_id == checklist_id))
+
+    # 旧数据的行内父关系会阻碍删除和归属转移，先断开（manifest 版本不依赖行内结构）
+    db.session.execute(
+        update(questions).where(questions.c.checklist_id == checklist_id).values(parent_id=None)
+    )
+
+    referenced = exists().where(manifest.c.question_id == questions.c.id)
+    new_owner = select(func.min(manifest.c.checklist_id)).where(
+        manifest.c.question_id == questions.c.id
+    ).scalar_subquery()
+    db.session.execute(
+        update(questions).where(questions.c.checklist_id == checklist_id, referenced).values(checklist_id=new_owner)
+    )
+
+    db.session.execute(delete(questions).where(questions.c.checklist_id == checklist_id))
+
+
+def backfill_manifests(batch_size=200):
+    """为升级前创建的清单版本回填 manifest 与内容摘要，按清单主键分批处理"""
+    manifest = ChecklistVersionQuestion.__table__
+    last_id = 0
+    total = 0
+    while True:
+        checklist_ids = [row.id for row in db.session.query(Checklist.id).filter(
+            Checklist.id > last_id,
+            ~exists().where(manifest.c.checklist_id == Checklist.id)
+        ).order_by(Checklist.id).limit(batch_size).all()]
+        if not checklist_ids:
+            break
+
+        for checklist_id in checklist_ids:
+            ensure_manifest(checklist_id)
+        for q in ChecklistQuestion.query.filter(
+            ChecklistQuestion.checklist_id.in_(checklist_ids),
+            ChecklistQuestion.content_hash.is_(None)
+        ).all():
+            q.content_hash = content_hash(q.type, q.question, q.description, q.options)
+
+        db.session.commit()
+        total += len(checklist_ids)
+        last_id = checklist_ids[-1]
+    return total
+
+
+# 编译后的版本问题图与版本差异缓存，key 中带有版本的 updated_at，版本内容变化后自动失效
+_compiled_graphs = LRUCache(max_size=256)
+_version_diffs = LRUCache(max_size=512)
+
+
+def compile_question_graph(checklist):
+    """
+    把清单版本编译为便于比较的问题图（带缓存）：
+    questions 为 {问题ID: 内容}，order 为版本内顺序，parents 为 {问题ID: 父问题ID}，
+    edges 为 {(问题ID, 选项, 子问题ID)}。
+    """
+    def build():
+        questions = load_version_questions(checklist.id)
+        edges = set()
+        for question in questions:
+            for opt_index, child_ids in (question.follow_up_questions or {}).items():
+                for child_id in child_ids:
+                    edges.add((question.id, str(opt_index), child_id))
+        return {
+            'questions': {question.id: {
+                'id': question.id,
+                'type': question.type,
+                'question': question.question,
+                'description': question.description,
+                'options': question.options
+            } for question in questions},
+            'order': [question.id for question in questions],
+            'parents': {question.id: question.parent_id for question in questions},
+            'edges': edges
+        }
+
+    return _compiled_graphs.get_or_create((checklist.id, checklist.updated_at), build)
+
+
+def diff_checklist_versions(from_checklist, to_checklist):
+    """计算两个清单版本之间的结构差异（按版本对缓存）"""
+    key = (from_checklist.id, from_checklist.updated_at, to_checklist.id, to_checklist.updated_at)
+    return _version_diffs.get_or_create(
+        key, lambda: _diff_graphs(compile_question_graph(from_checklist), compile_question_graph(to_checklist))
+    )
+
+
+def _diff_graphs(old, new):
+    old_questions, new_questions = old['questions'], new['questions']
+
+    # 1. 内容未变的问题在版本间共享同一行，直接按ID对应
+    matched = {question_id: question_id for question_id in old_questions if question_id in new_questions}
+
+    # 2. 剩余问题按题目文本对应，其次按版本内位置对应，视为修改
+    old_rest = [question_id for question_id in old['order'] if question_id not in matched]
+    new_rest = [question_id for question_id in new['order'] if question_id not in matched.values()]
+    by_text = {}
+    for question_id in new_rest:
+        by_text.setdefault((new_questions[question_id]['type'], new_questions[question_id]['question']), []).append(question_id)
+    for question_id in list(old_rest):
+        candidates = by_text.get((old_questions[question_id]['type'], old_questions[question_id]['question']))
+        if candidates:
+            new_id = candidates.pop(0)
+            matched[question_id] = new_id
+            old_rest.remove(question_id)
+            new_rest.remove(new_id)
+    for question_id in list(old_rest):
+        position = old['order'].index(question_id)
+        if position < len(new['order']):
+            new_id = new['order'][position]
+            if new_id in new_rest and new_questions[new_id]['type'] == old_questions[question_id]['type']:
+                matched[question_id] = new_id
+                old_rest.remove(question_id)
+                new_rest.remove(new_id)
+
+    edited = []
+    for old_id, new_id in matched.items():
+        before, after = old_questions[old_id], new_questions[new_id]
+        changes = {field: {'from': before[field], 'to': after[field]}
+                   for field in ('type', 'question', 'description') if before[field] != after[field]}
+        old_options, new_options = before['options'] or [], after['options'] or []
+        if old_options != new_options:
+            changes['options'] = {
+                'from': old_options,
+                'to': new_options,
+                'added': [option for option in new_options if option not in old_options],
+                'removed': [option for option in old_options if option not in new_options]
+            }
+        if changes:
+            edited.append({'from_id': old_id, 'to_id': new_id, 'changes': changes})
+
+    # 3. 结构差异：把旧版本的ID映射到新版本后比较；新增的边使用新版本ID，删除的边使用旧版本ID
+    def translate(question_id):
+        return matched.get(question_id, ('removed', question_id))
+
+    translated_old_edges = {(translate(parent), option, translate(child)): (parent, option, child)
+                            for parent, option, child in old['edges']}
+    added_edges = new['edges'] - translated_old_edges.keys()
+    removed_edges = [translated_old_edges[edge] for edge in translated_old_edges.keys() - new['edges']]
+
+    parent_changes = []
+    for old_id, new_id in matched.items():
+        old_parent = old['parents'].get(old_id)
+        new_parent = new['parents'].get(new_id)
+        if (translate(old_parent) if old_parent else None) != new_parent:
+            parent_changes.append({'question_id': new_id, 'from': old_parent, 'to': new_parent})
+
+    def edge_data(edges):
+        return [{'question_id': parent, 'option': option, 'child_id': child}
+                for parent, option, child in sorted(edges)]
+
+    return {
+        'added': [new_questions[question_id] for question_id in new_rest],
+        'removed': [old_questions[question_id] for question_id in old_rest],
+        'edited': edited,
+        'follow_up_edges': {
+            'added': edge_data(added_edges),
+            'removed': edge_data(removed_edges)
+        },
+        'parent_changes': parent_changes
+    }
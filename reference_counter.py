@@ -0,0 +1,302 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import current_app
+from sqlalchemy import case, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from shared_models import Article, PlatformArticle, ReferenceCountFlush, db
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境
+    fcntl = None
+
+
+def reference_ids(ids):
+    """规范化前端传入的引用文章ID列表，同一条记录内重复引用只计一次"""
+    result = set()
+    for article_id in ids or []:
+        if isinstance(article_id, int) or str(article_id).isdigit():
+            result.add(int(article_id))
+    return result
+
+
+def count_references(records, field):
+    """按文章ID汇总多条记录的引用次数 {文章ID: 次数}"""
+    counts = Counter()
+    for record in records:
+        counts.update(reference_ids(record.get(field)))
+    return counts
+
+
+def apply_reference_increments(article_counts, platform_article_counts):
+    """
+    批量增加引用计数：每张表只执行一条 CASE UPDATE
+    UPDATE article SET reference_count = reference_count + CASE id WHEN .. THEN .. END WHERE id IN (..)
+    """
+    for model, counts in ((Article, article_counts), (PlatformArticle, platform_article_counts)):
+        if not counts:
+            continue
+        db.session.query(model).filter(
+            model.id.in_(list(counts))
+        ).update(
+            {'reference_count': model.reference_count + case(dict(counts), value=model.id, else_=0)},
+            synchronize_session=False
+        )
+
+
+def record_reference_increments(article_counts, platform_article_counts):
+    """
+    登记当前事务中的引用计数增量。
+    开启 REFERENCE_COUNT_WRITE_BEHIND 时增量暂存在 session 上，事务提交后才进入写回缓冲，回滚则丢弃；
+    否则直接在当前事务中批量更新。
+    """
+    if not current_app.config.get('REFERENCE_COUNT_WRITE_BEHIND'):
+        apply_reference_increments(article_counts, platform_article_counts)
+        return
+
+    pending = db.session.info.setdefault('pending_reference_counts', (Counter(), Counter()))
+    pending[0].update(article_counts)
+    pending[1].update(platform_article_counts)
+
+
+@event.listens_for(Session, 'after_commit')
+def _enqueue_committed_increments(session):
+    pending = session.info.pop('pending_reference_counts', None)
+    if pending and (pending[0] or pending[1]):
+        reference_count_buffer.add(*pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_increments(session):
+    session.info.pop('pending_reference_counts', None)
+
+
+class ReferenceCountBuffer:
+    """
+    引用计数写回缓冲。
+    已提交的增量先追加到本地日志段（fsync 后才返回），再在内存中按文章ID合并；
+    后台线程定期轮换日志段，并在一个事务里用每表一条 CASE UPDATE 写回数据库，
+    同时写入 reference_count_flush 标记，进程崩溃后重放日志段时不会重复计数。
+
+    每个进程持有一个以本进程标识命名的锁文件（<标识>.lock）的排他 flock，当前日志和已接管的日志段都带有该标识；
+    其他进程能拿到锁时说明所有者已退出，才接管它的日志。flock 随进程退出由内核释放，不依赖文件修改时间。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.journal_dir = None
+        self.flush_interval = 5
+        self._lock = threading.Lock()
+        self._journal = None
+        self._owner = None
+        self._owner_pid = None
+        self._owner_lock = None
+        self._stopped = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.journal_dir = app.config.get('REFERENCE_COUNT_JOURNAL_DIR', 'journal/reference_count')
+        self.flush_interval = app.config.get('REFERENCE_COUNT_FLUSH_INTERVAL', 5)
+        if not app.config.get('REFERENCE_COUNT_WRITE_BEHIND'):
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        # 没有写回线程的进程（如 flask 命令行）退出时也会写回本进程的增量
+        atexit.register(self.stop)
+
+    def start(self):
+        """启动定期写回线程，只在服务进程中调用"""
+        if self.app.config.get('REFERENCE_COUNT_WRITE_BEHIND'):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def add(self, article_counts, platform_article_counts):
+        entry = json.dumps({'a': dict(article_counts), 'p': dict(platform_article_counts)})
+        with self._lock:
+            self._ensure_owner()
+            if self._journal is None:
+                self._journal = open(self._current_path(), 'a', encoding='utf-8')
+            self._journal.write(entry + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def flush(self):
+        """轮换当前日志段并写回，同时接管崩溃进程遗留的日志段"""
+        with self._lock:
+            self._ensure_owner()
+            segment = None
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+                # 直接改名为本进程已接管的日志段，避免被其他进程当作遗留日志段
+                segment = os.path.join(self.journal_dir, f"{uuid.uuid4().hex}.segment.{self._owner}.claimed")
+                os.replace(self._current_path(), segment)
+
+        # 数据库写回不占用缓冲锁，不阻塞请求线程登记增量；按日志段内容写回，与已落盘的增量一致
+        if segment:
+            self._apply_segment(segment, self._read_segment(segment))
+
+        for path in self._orphaned_segments():
+            claimed = self._claim(path)
+            if claimed:
+                self._apply_segment(claimed, self._read_segment(claimed))
+
+    def stop(self):
+        self._stopped.set()
+        self._flush_safely()
+        # 日志已全部写回，删除锁文件后释放锁
+        if self._owner_lock is not None and self._owner_pid == os.getpid():
+            try:
+                os.remove(self._lock_path(self._owner))
+            except OSError:
+                pass
+            self._owner_lock.close()
+            self._owner_lock = None
+            self._owner_pid = None
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self._flush_safely()
+
+    def _flush_safely(self):
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f"Reference count flush failed: {str(e)}", exc_info=True)
+            finally:
+                db.session.remove()
+
+    def _apply_segment(self, path, counts):
+        segment_name = os.path.basename(path).split('.segment')[0]
+        try:
+            db.session.add(ReferenceCountFlush(segment=segment_name))
+            apply_reference_increments(*counts)
+            db.session.commit()
+        except IntegrityError:
+            # 标记已存在：该日志段在上次崩溃前已写回
+            db.session.rollback()
+        except Exception:
+            # 日志段保留在磁盘上，过期后作为遗留日志段重试
+            db.session.rollback()
+            raise
+        os.remove(path)
+
+    def _current_path(self):
+        """本进程的当前日志"""
+        return os.path.join(self.journal_dir, f"{self._owner}.current")
+
+    def _ensure_owner(self):
+        """
+        生成本进程标识并锁定锁文件。标识带有随机串：容器中进程号经常复用（如始终为 1），
+        只用进程号时重启后的进程会把崩溃进程的日志当作自己的。fork 出的子进程重新生成标识，
+        并关闭继承的锁文件和日志句柄，父进程退出后其日志可以被接管。
+        """
+        if self._owner_pid == os.getpid():
+            return
+        if self._owner_lock is not None:
+            self._owner_lock.close()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self._owner_lock = open(self._lock_path(self._owner), 'a')
+        if fcntl is not None:
+            fcntl.flock(self._owner_lock, fcntl.LOCK_EX)
+        self._owner_pid = os.getpid()
+
+    def _lock_path(self, owner):
+        return os.path.join(self.journal_dir, f"{owner}.lock")
+
+    def _owner_exited(self, owner, path):
+        """
+        日志所有者是否已退出：能拿到其锁文件的 flock 即已退出，拿到后删除锁文件。
+        没有锁文件的是升级前的日志。不支持 flock 的平台退回按修改时间判断（超过 10 个写回周期未更新）。
+        """
+        if fcntl is None:
+            try:
+                return os.path.getmtime(path) < time.time() - self.flush_interval * 10
+            except OSError:
+                return False
+        try:
+            lock = open(self._lock_path(owner), 'r')
+        except FileNotFoundError:
+            return True
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            # 所有者只有一个锁文件，接管其全部日志后不再需要
+            try:
+                os.remove(self._lock_path(owner))
+            except OSError:
+                pass
+        return True
+
+    def _claim(self, path):
+        """原子改名接管日志段，多个进程同时接管时只有一个成功"""
+        name = os.path.basename(path)
+        if name.endswith('.current'):
+            segment_name = uuid.uuid4().hex
+        else:
+            segment_name = name.split('.segment')[0]
+        claimed = os.path.join(self.journal_dir, f"{segment_name}.segment.{self._owner}.claimed")
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            return None
+        return claimed
+
+    def _orphaned_segments(self):
+        """
+        需要接管的日志段：未被接管的日志段，以及所有者已退出的当前日志和已接管日志段
+        （所有者在写回前崩溃）。同一所有者的多个文件只判断一次，没有日志的已退出进程只清理锁文件。
+        """
+        exited = {}
+        orphans = []
+        for name in os.listdir(self.journal_dir):
+            path = os.path.join(self.journal_dir, name)
+            if name.endswith('.segment'):
+                orphans.append(path)
+                continue
+            if name.endswith('.current'):
+                owner = name[:-len('.current')]
+            elif name.endswith('.claimed'):
+                owner = name.rsplit('.', 2)[-2]
+            elif name.endswith('.lock'):
+                owner = name[:-len('.lock')]
+            else:
+                continue
+            if owner == self._owner:
+                continue
+            if fcntl is None:
+                # 按每个文件的修改时间判断，锁文件不更新，不能代表所有者
+                if not name.endswith('.lock') and self._owner_exited(owner, path):
+                    orphans.append(path)
+                continue
+            if owner not in exited:
+                exited[owner] = self._owner_exited(owner, path)
+            if exited[owner] and not name.endswith('.lock'):
+                orphans.append(path)
+        return orphans
+
+    @staticmethod
+    def _read_segment(path):
+        article_counts, platform_article_counts = Counter(), Counter()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的最后一行
+                article_counts.update({int(k): v for k, v in entry.get('a', {}).items()})
+                platform_article_counts.update({int(k): v for k, v in entry.get('p', {}).items()})
+        return article_counts, platform_article_counts
+
+
+reference_count_buffer = ReferenceCountBuffer()
@@ -4,6 +4,7 @@ from shared_models import Inspiration,Reflection, db
 from datetime import datetime as dt
 from flask_login import current_user, login_required
 from sqlalchemy import func
+from search_engine import search_engine
 reflections_bp = Blueprint('reflections', __name__)
 
 @reflections_bp.route('/api/my-reflections', methods=['GET'])
@@ -35,8 +36,17 @@ def get_my_reflections():
              (Reflection.updated_at == subquery.c.max_updated_at))\
         .filter(Reflection.user_id == current_user.id)\
         
-    if search:
-        query = query.filter(Reflection.content.ilike(f'%{search}%'))
+    # 启用嵌入式搜索时用索引结果过滤，否则模糊匹配
+    ids = search_engine.search_ids(Reflection, search, owner=current_user.id) if search else None
+    if ids is not None:
+        search_filter = Reflection.id.in_(ids)
+    elif search:
+        search_filter = Reflection.content.ilike(f'%{search}%')
+    else:
+        search_filter = None
+
+    if search_filter is not None:
+        query = query.filter(search_filter)
     
     query.order_by(Reflection.updated_at.desc())
     # 分页
@@ -49,8 +59,8 @@ def get_my_reflections():
         Reflection.user_id == current_user.id
     )
     
-    if search:
-        count_query = count_query.filter(Reflection.content.ilike(f'%{search}%'))
+    if search_filter is not None:
+        count_query = count_query.filter(search_filter)
     
     total_inspirations = count_query.scalar()
     
@@ -1,5 +1,5 @@
 #!/bin/bash
 # 激活虚拟环境
 source venv/bin/activate
-# 运行 Python 服务
-python app.py
+# 运行 Python 服务（gevent worker，配置见 gunicorn.conf.py）
+gunicorn -c gunicorn.conf.py app:app
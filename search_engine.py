@@ -0,0 +1,600 @@
+import atexit
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from collections import Counter
+from sqlalchemy import event, false, func, inspect
+from sqlalchemy.orm import Session
+from shared_models import Article, Inspiration, PlatformArticle, Reflection, db
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境
+    fcntl = None
+
+# 建立索引的模型：(索引名, 文本字段, 所有者字段)
+INDEXED_MODELS = {
+    Article: ('article', ('title', 'keywords', 'content'), 'user_id'),
+    PlatformArticle: ('platform_article', ('title', 'keywords', 'content'), None),
+    Inspiration: ('inspiration', ('content', 'description'), None),
+    Reflection: ('reflection', ('content',), 'user_id'),
+}
+
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN = re.compile(f'([{_CJK}]+)|([^\\W_{_CJK}]+)')
+_SEGMENT_NAME = re.compile(r'(\d+)(m?)\.seg')
+
+# 段文件头：魔数、文档数、删除标记数、词项数、词典偏移
+SEGMENT_MAGIC = b'DASEG001'
+SEGMENT_HEADER = struct.Struct('<8sQQQQ')
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """
+    切分词项：连续的中日韩文字按相邻两字切分（bigram），单独一个字作为一个词项；
+    其他文字按单词切分并转为小写。
+    """
+    terms = []
+    for cjk, word in _TOKEN.findall((text or '').lower()):
+        if word:
+            terms.append(word)
+        elif len(cjk) == 1:
+            terms.append(cjk)
+        else:
+            terms.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return terms
+
+
+def query_terms(text):
+    """查询词项（去重）；查询中有单独一个中文字时 bigram 无法匹配，返回 None 由调用方退回模糊匹配"""
+    if any(len(cjk) == 1 for cjk, _ in _TOKEN.findall((text or '').lower())):
+        return None
+    return list(dict.fromkeys(tokenize(text))) or None
+
+
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, pos):
+    """:return: (值, 下一个位置)"""
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_postings(postings):
+    """按文档ID升序的 [(文档ID, 词频)] 编码为差值 + varint 字节序列"""
+    buffer = array('B')
+    last = 0
+    for doc_id, tf in postings:
+        write_varint(buffer, doc_id - last)
+        write_varint(buffer, tf)
+        last = doc_id
+    return buffer
+
+
+def decode_postings(data):
+    postings = []
+    pos = doc_id = 0
+    while pos < len(data):
+        delta, pos = read_varint(data, pos)
+        tf, pos = read_varint(data, pos)
+        doc_id += delta
+        postings.append((doc_id, tf))
+    return postings
+
+
+def write_segment(path, docs, deletes, postings):
+    """
+    写入不可变的段文件（先写临时文件再原子替换）。
+    布局：文件头 | 文档表 (ID 差值, 长度, 所有者) | 删除标记 (ID 差值) | 倒排列表 | 词典 (词项, 偏移, 长度)
+    :param docs: {文档ID: (词项数, 所有者ID)}
+    :param deletes: 删除标记，使更早的段中同ID的文档失效
+    :param postings: {词项: 按文档ID升序的 [(文档ID, 词频)]}
+    """
+    body = array('B')
+    last = 0
+    for doc_id in sorted(docs):
+        length, owner = docs[doc_id]
+        write_varint(body, doc_id - last)
+        write_varint(body, length)
+        write_varint(body, owner)
+        last = doc_id
+    last = 0
+    for doc_id in sorted(deletes):
+        write_varint(body, doc_id - last)
+        last = doc_id
+
+    dictionary = array('B')
+    for term in sorted(postings):
+        offset = SEGMENT_HEADER.size + len(body)
+        body.extend(encode_postings(postings[term]))
+        encoded = term.encode('utf-8')
+        write_varint(dictionary, len(encoded))
+        dictionary.frombytes(encoded)
+        write_varint(dictionary, offset)
+        write_varint(dictionary, SEGMENT_HEADER.size + len(body) - offset)
+
+    header = SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(docs), len(deletes), len(postings), SEGMENT_HEADER.size + len(body))
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        body.tofile(f)
+        dictionary.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class Segment:
+    """磁盘上的不可变索引段：文档表和词典在打开时载入内存，倒排列表通过 mmap 按需读取解码"""
+
+    def __init__(self, seq, path):
+        self.seq = seq
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, doc_count, delete_count, term_count, dictionary_offset = SEGMENT_HEADER.unpack_from(self._map, 0)
+        if magic != SEGMENT_MAGIC:
+            self.close()
+            raise ValueError(f"Invalid search index segment: {path}")
+
+        data = self._map
+        pos = SEGMENT_HEADER.size
+        self.docs = {}
+        doc_id = 0
+        for _ in range(doc_count):
+            delta, pos = read_varint(data, pos)
+            length, pos = read_varint(data, pos)
+            owner, pos = read_varint(data, pos)
+            doc_id += delta
+            self.docs[doc_id] = (length, owner)
+        self.deletes = set()
+        doc_id = 0
+        for _ in range(delete_count):
+            delta, pos = read_varint(data, pos)
+            doc_id += delta
+            self.deletes.add(doc_id)
+
+        self.terms = {}
+        pos = dictionary_offset
+        for _ in range(term_count):
+            size, pos = read_varint(data, pos)
+            term = data[pos:pos + size].decode('utf-8')
+            pos += size
+            offset, pos = read_varint(data, pos)
+            length, pos = read_varint(data, pos)
+            self.terms[term] = (offset, length)
+
+    def postings(self, term):
+        location = self.terms.get(term)
+        if location is None:
+            return []
+        offset, length = location
+        return decode_postings(self._map[offset:offset + length])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class MemSegment:
+    """内存中的可写索引段，刷盘后成为磁盘段"""
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.docs = {}
+        self.deletes = set()
+        self._terms = {}
+        self._doc_terms = {}
+
+    def add(self, doc_id, terms, owner):
+        self.remove(doc_id)
+        counts = Counter(terms)
+        self.docs[doc_id] = (len(terms), owner)
+        self._doc_terms[doc_id] = counts
+        for term, tf in counts.items():
+            self._terms.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id):
+        counts = self._doc_terms.pop(doc_id, None)
+        if counts is None:
+            return
+        del self.docs[doc_id]
+        for term in counts:
+            postings = self._terms[term]
+            del postings[doc_id]
+            if not postings:
+                del self._terms[term]
+
+    def postings(self, term):
+        return list(self._terms.get(term, {}).items())
+
+    def sorted_postings(self):
+        return {term: sorted(postings.items()) for term, postings in self._terms.items()}
+
+
+class InvertedIndex:
+    """
+    一个模型的倒排索引，由若干磁盘段和一个内存段组成。
+    同一文档可能出现在多个段中，_live 记录每个文档最新版本所在的段，查询时忽略其他段中的旧版本；
+    合并把全部磁盘段重写为一个只包含有效文档的段。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._segments = []
+        self._live = {}
+        self._total_length = 0
+        self._memtable = MemSegment(1)
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        files = {}
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_NAME.fullmatch(name)
+            if match:
+                files[name] = (int(match.group(1)), bool(match.group(2)))
+            elif name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))  # 写了一半的段
+
+        # 合并段包含 seq 不大于它的全部段，进程在删除输入段之前退出时在这里清理
+        merged_seq = max((seq for seq, merged in files.values() if merged), default=0)
+        segments = []
+        for name, (seq, merged) in files.items():
+            path = os.path.join(self.directory, name)
+            if seq < merged_seq or (seq == merged_seq and not merged):
+                os.remove(path)
+                continue
+            segments.append(Segment(seq, path))
+
+        with self._lock:
+            self._segments = sorted(segments, key=lambda segment: segment.seq)
+            for segment in self._segments:
+                for doc_id in segment.deletes:
+                    self._drop(doc_id)
+                for doc_id, (length, _) in segment.docs.items():
+                    self._drop(doc_id)
+                    self._live[doc_id] = segment
+                    self._total_length += length
+            self._memtable = MemSegment(self._segments[-1].seq + 1 if self._segments else 1)
+
+    def add(self, doc_id, text, owner=0):
+        terms = tokenize(text)
+        with self._lock:
+            self._drop(doc_id)
+            if not terms:
+                self._memtable.remove(doc_id)
+                self._memtable.deletes.add(doc_id)
+                return
+            self._memtable.add(doc_id, terms, owner)
+            self._live[doc_id] = self._memtable
+            self._total_length += len(terms)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._drop(doc_id)
+            self._memtable.remove(doc_id)
+            self._memtable.deletes.add(doc_id)
+
+    def retain(self, doc_ids):
+        """删除不在 doc_ids 中的文档（重建索引时清理数据库中已不存在的行）"""
+        with self._lock:
+            for doc_id in [doc_id for doc_id in self._live if doc_id not in doc_ids]:
+                self.remove(doc_id)
+
+    def _drop(self, doc_id):
+        segment = self._live.pop(doc_id, None)
+        if segment is not None:
+            self._total_length -= segment.docs[doc_id][0]
+
+    def is_empty(self):
+        with self._lock:
+            return not self._segments and not self._live
+
+    def search(self, terms, owner=None, limit=1000):
+        """
+        返回同时包含全部词项的文档 [(文档ID, BM25 得分)]，按得分降序。
+        IDF 按全部文档计算，owner 只过滤结果。
+        """
+        with self._lock:
+            total = len(self._live)
+            if not total:
+                return []
+            average_length = self._total_length / total
+            sources = self._segments + [self._memtable]
+            scores = {}
+            for position, term in enumerate(terms):
+                matched = {}
+                df = 0
+                for segment in sources:
+                    for doc_id, tf in segment.postings(term):
+                        if self._live.get(doc_id) is not segment:
+                            continue  # 旧版本
+                        df += 1
+                        length, doc_owner = segment.docs[doc_id]
+                        if (owner is None or doc_owner == owner) and (position == 0 or doc_id in scores):
+                            matched[doc_id] = (tf, length)
+                if not matched:
+                    return []
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                scores = {
+                    doc_id: scores.get(doc_id, 0) + idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+                    for doc_id, (tf, length) in matched.items()
+                }
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:limit]
+
+    def flush(self):
+        """把内存段写成磁盘段"""
+        with self._lock:
+            memtable = self._memtable
+            if not memtable.docs and not memtable.deletes:
+                return
+            path = os.path.join(self.directory, f'{memtable.seq:010d}.seg')
+            write_segment(path, memtable.docs, memtable.deletes, memtable.sorted_postings())
+            segment = Segment(memtable.seq, path)
+            for doc_id in memtable.docs:
+                self._live[doc_id] = segment
+            self._segments.append(segment)
+            self._memtable = MemSegment(memtable.seq + 1)
+
+    def merge(self, max_segments):
+        """
+        磁盘段超过 max_segments 个时合并全部磁盘段。
+        读取和写入新段不持有索引锁，期间的写入进入内存段，替换时只接管仍指向输入段的文档。
+        """
+        with self._merge_lock:
+            with self._lock:
+                inputs = list(self._segments)
+                if len(inputs) <= max(max_segments, 1):
+                    return
+                members = set(inputs)
+                owners = {doc_id: segment for doc_id, segment in self._live.items() if segment in members}
+
+            docs = {doc_id: segment.docs[doc_id] for doc_id, segment in owners.items()}
+            postings = {}
+            for segment in inputs:
+                for term in segment.terms:
+                    live = [(doc_id, tf) for doc_id, tf in segment.postings(term) if owners.get(doc_id) is segment]
+                    if live:
+                        postings.setdefault(term, []).extend(live)
+            for term_postings in postings.values():
+                term_postings.sort()
+
+            # 输入段之前没有更早的段，合并段不需要删除标记
+            path = os.path.join(self.directory, f'{inputs[-1].seq:010d}m.seg')
+            write_segment(path, docs, (), postings)
+            merged = Segment(inputs[-1].seq, path)
+
+            with self._lock:
+                for doc_id in merged.docs:
+                    if self._live.get(doc_id) in members:
+                        self._live[doc_id] = merged
+                self._segments = [merged] + self._segments[len(inputs):]
+                for segment in inputs:
+                    segment.close()
+                    os.remove(segment.path)
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+
+
+def document_text(obj, fields):
+    return ' '.join(getattr(obj, field) or '' for field in fields)
+
+
+def filter_ranked(query, model, ids):
+    """把查询限制在搜索结果内，并按搜索结果的顺序排序"""
+    if not ids:
+        return query.filter(false())
+    return query.filter(model.id.in_(ids)).order_by(func.field(model.id, *ids))
+
+
+class SearchEngine:
+    """
+    嵌入式全文搜索（SEARCH_BACKEND = 'embedded'），用于无法调整 MySQL 全文索引配置的部署。
+    每个模型一个倒排索引；已提交的写入先进入内存段，后台线程定期刷盘，段数过多时合并。
+    索引目录只能由一个进程写入：打开索引时对目录下的 .lock 加排他 flock，只有服务进程（start）
+    和重建命令打开索引；其他进程（flask 命令行、其他 worker）不读写索引目录，搜索退回模糊匹配，
+    写入不进入索引。多进程部署请使用 MySQL 全文索引。
+    首次启用、内存段因进程崩溃丢失或在其他进程中修改了数据后，停止服务并执行 flask article rebuild-search-index 重建。
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.indexes = {}
+        self.max_results = 1000
+        self.flush_interval = 30
+        self.merge_factor = 8
+        self.directory = None
+        self._lock_file = None
+        self._stopped = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SEARCH_BACKEND', 'mysql') == 'embedded'
+        if not self.enabled:
+            return
+        self.max_results = app.config.get('SEARCH_MAX_RESULTS', 1000)
+        self.flush_interval = app.config.get('SEARCH_FLUSH_INTERVAL', 30)
+        self.merge_factor = app.config.get('SEARCH_MERGE_FACTOR', 8)
+        self.directory = app.config.get('SEARCH_INDEX_DIR', 'index/search')
+
+    @property
+    def is_open(self):
+        return bool(self.indexes)
+
+    def open(self):
+        """
+        锁定索引目录并打开索引（清理写了一半的段和已合并的输入段）。
+        目录已被其他进程锁定时不打开，返回 False。
+        """
+        if self.is_open:
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, '.lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._lock_file = lock_file
+        indexes = {}
+        for name, _, _ in INDEXED_MODELS.values():
+            index = InvertedIndex(os.path.join(self.directory, name))
+            index.open()
+            indexes[name] = index
+        self.indexes = indexes
+        atexit.register(self.stop)
+        return True
+
+    def start(self):
+        """在服务进程中打开索引并启动定期刷盘和合并线程"""
+        if not self.enabled:
+            return
+        if not self.open():
+            self.app.logger.warning(
+                f"Search index {self.directory} is locked by another process, embedded search is unavailable in this process"
+            )
+            return
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def search(self, model, text, owner=None):
+        """
+        :return: 按相关度降序的 [(ID, 得分)]；未启用、本进程未打开索引或查询无法使用索引时返回 None
+        """
+        if not self.is_open:
+            return None
+        terms = query_terms(text)
+        if terms is None:
+            return None
+        return self.indexes[INDEXED_MODELS[model][0]].search(terms, owner, self.max_results)
+
+    def search_ids(self, model, text, owner=None):
+        hits = self.search(model, text, owner)
+        return None if hits is None else [doc_id for doc_id, _ in hits]
+
+    def apply(self, changes):
+        """:param changes: {(索引名, ID): (所有者ID, 文本) 或 None（删除）}"""
+        if not self.is_open:
+            return
+        for (name, doc_id), document in changes.items():
+            if document is None:
+                self.indexes[name].remove(doc_id)
+            else:
+                self.indexes[name].add(doc_id, document[1], document[0])
+
+    def rebuild(self, batch_size=500):
+        """从数据库重新索引全部行，并删除数据库中已不存在的文档"""
+        for model, (name, fields, owner_field) in INDEXED_MODELS.items():
+            index = self.indexes[name]
+            columns = [getattr(model, field) for field in fields]
+            if owner_field:
+                columns.append(getattr(model, owner_field))
+            seen = set()
+            last_id = 0
+            while True:
+                rows = db.session.query(model.id, *columns).filter(
+                    model.id > last_id
+                ).order_by(model.id).limit(batch_size).all()
+                if not rows:
+                    break
+                for row in rows:
+                    owner = getattr(row, owner_field) if owner_field else 0
+                    index.add(row.id, document_text(row, fields), owner or 0)
+                    seen.add(row.id)
+                last_id = rows[-1].id
+                index.flush()
+            index.retain(seen)
+            index.flush()
+            index.merge(1)
+
+    def maintain(self):
+        for index in self.indexes.values():
+            index.flush()
+            index.merge(self.merge_factor)
+
+    def stop(self):
+        self._stopped.set()
+        if not self.is_open:
+            return
+        try:
+            for index in self.indexes.values():
+                index.flush()
+        except Exception as e:
+            self.app.logger.error(f"Search index flush failed: {str(e)}", exc_info=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.maintain()
+            except Exception as e:
+                self.app.logger.error(f"Search index maintenance failed: {str(e)}", exc_info=True)
+
+
+search_engine = SearchEngine()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_search_changes(session, flush_context):
+    """记录本事务中索引字段有变化的行，提交后才更新索引，回滚则丢弃"""
+    if not search_engine.is_open:
+        return
+    changes = session.info.setdefault('pending_search_changes', {})
+    for obj in session.deleted:
+        spec = INDEXED_MODELS.get(type(obj))
+        if spec:
+            changes[(spec[0], obj.id)] = None
+    for obj in list(session.new) + list(session.dirty):
+        spec = INDEXED_MODELS.get(type(obj))
+        if spec is None:
+            continue
+        name, fields, owner_field = spec
+        watched = list(fields) + [owner_field] if owner_field else list(fields)
+        if hasattr(obj, 'deleted_at'):
+            watched.append('deleted_at')
+        state = inspect(obj)
+        if not any(state.attrs[field].history.has_changes() for field in watched):
+            continue
+        if getattr(obj, 'deleted_at', None) is not None:
+            changes[(name, obj.id)] = None
+        else:
+            owner = getattr(obj, owner_field) if owner_field else 0
+            changes[(name, obj.id)] = (owner or 0, document_text(obj, fields))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed_search_changes(session):
+    changes = session.info.pop('pending_search_changes', None)
+    if changes:
+        search_engine.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_search_changes(session):
+    session.info.pop('pending_search_changes', None)
@@ -1,11 +1,54 @@
 from datetime import datetime as dt
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import JSON
+from sqlalchemy import JSON, event, select
+from sqlalchemy.orm import Session, with_loader_criteria
 from flask_login import UserMixin # type: ignore
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+
+class SoftDeleteMixin:
+    """
+    软删除：删除只写 deleted_at，ORM 查询自动过滤已删除的行，
+    物理删除由后台压缩任务（compactor.py）在低峰期分批完成。
+    需要读取已删除行时使用 execution_options(include_deleted=True)。
+    删除清单版本只标记清单本身，其决策按所属清单的删除标记一并隐藏。
+    """
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    def soft_delete(self):
+        self.deleted_at = dt.utcnow()
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _filter_soft_deleted(execute_state):
+    # 只需加在顶层查询上，关系懒加载会沿用同一条件
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get('include_deleted', False)
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(SoftDeleteMixin, lambda cls: cls.deleted_at.is_(None), include_aliases=True),
+            with_loader_criteria(
+                ChecklistDecision,
+                lambda cls: cls.checklist_id.in_(select(Checklist.id).where(Checklist.deleted_at.is_(None))),
+                include_aliases=True
+            )
+        )
+
+def allocated_id(table_name):
+    """
+    主键默认值：经 hi/lo 分配器（question_graph.HiLoIdAllocator）取号。
+    批量插入预先领取号段，未指定 id 的插入也必须从分配器取号，不能使用自增值，否则可能落入已领取的号段。
+    """
+    def default():
+        from question_graph import allocate_id  # question_graph 依赖本模块，使用时再导入
+        return allocate_id(table_name)
+    return default
+
 class AdminUser(db.Model, UserMixin):
     __tablename__ = 'admin_user'
 
@@ -131,6 +174,9 @@ class GroupMembers(db.Model):
     group_id = db.Column(db.Integer, db.ForeignKey('decision_group.id'), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     role = db.Column(db.String(20), nullable=False)  # 'inviter' 或 'invitee'
+    __table_args__ = (
+        db.Index('ix_group_members_user_role', 'user_id', 'role', 'group_id'),  # 查询被邀请的决策
+    )
 
 
 # 定义BalancedDecision模型
@@ -146,7 +192,7 @@ class BalancedDecision(db.Model):
     result = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=dt.utcnow)
 
-class Article(db.Model):
+class Article(SoftDeleteMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(255), nullable=False)
@@ -154,9 +200,13 @@ class Article(db.Model):
     author = db.Column(db.String(255), nullable=False)
     tags = db.Column(db.String(255), nullable=True)
     keywords = db.Column(db.String(255), nullable=True)
+    summary = db.Column(db.String(255), nullable=True)  # 正文摘要，列表和选择器不读取正文
     reference_count = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=dt.utcnow)
     updated_at = db.Column(db.DateTime, default=dt.utcnow, onupdate=dt.utcnow)
+    __table_args__ = (
+        db.Index('ft_article_search', 'title', 'keywords', 'content', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
 
 class PlatformArticle(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -165,11 +215,21 @@ class PlatformArticle(db.Model):
     author = db.Column(db.String(255), nullable=False)
     tags = db.Column(db.String(255), nullable=True)
     keywords = db.Column(db.String(255), nullable=True)
+    summary = db.Column(db.String(255), nullable=True)  # 正文摘要，列表和选择器不读取正文
     reference_count = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=dt.utcnow)
     updated_at = db.Column(db.DateTime, default=dt.utcnow, onupdate=dt.utcnow)
+    __table_args__ = (
+        db.Index('ft_platform_article_search', 'title', 'keywords', 'content', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
+    )
+
+class ReferenceCountFlush(db.Model):
+    """已写回数据库的引用计数日志段，用于崩溃恢复时去重"""
+    __tablename__ = 'reference_count_flush'
+    segment = db.Column(db.String(64), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=dt.utcnow)
 
-class TodoItem(db.Model):
+class TodoItem(SoftDeleteMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     name = db.Column(db.String(255), nullable=False)
@@ -182,7 +242,7 @@ class TodoItem(db.Model):
     created_at = db.Column(db.DateTime, default=dt.utcnow)
     updated_at = db.Column(db.DateTime, default=dt.utcnow, onupdate=dt.utcnow)
 
-class Checklist(db.Model):
+class Checklist(SoftDeleteMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     version = db.Column(db.Integer, nullable=False, default=1)
@@ -193,6 +253,7 @@ class Checklist(db.Model):
     is_clone = db.Column(db.Boolean, nullable=True)
     platform_checklist_id = db.Column(db.Integer, db.ForeignKey('platform_checklist.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=dt.utcnow)
+    updated_at = db.Column(db.DateTime, default=dt.utcnow, onupdate=dt.utcnow)  # 问题内容变化时也会刷新
     share_status = db.Column(db.Enum('pending', 'review', 'approved', 'rejected', 
                                   name='checklist_share_status'),
                            default='pending', nullable=False)
@@ -226,7 +287,7 @@ class PlatformChecklistQuestion(db.Model):
 
 
 class ChecklistQuestion(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, default=allocated_id('checklist_question'))
     checklist_id = db.Column(db.Integer, db.ForeignKey('checklist.id'), nullable=False)
     type = db.Column(db.String(20), default='text')  # 'text' or 'choice'
     question = db.Column(db.String(255), nullable=False)
@@ -234,12 +295,28 @@ class ChecklistQuestion(db.Model):
     options = db.Column(db.JSON)  # 存储选项列表
     follow_up_questions = db.Column(db.JSON)  # 存储选项关联 { "0": 5 }
     parent_id = db.Column(db.Integer, db.ForeignKey('checklist_question.id'))  # 父问题ID
+    content_hash = db.Column(db.String(64), index=True)  # 问题内容摘要，相同内容的问题在版本间共享
     # 关系
     checklist = db.relationship('Checklist', backref=db.backref('questions', lazy=True))
     parent = db.relationship('ChecklistQuestion', remote_side=[id], backref='children')
 
+class ChecklistVersionQuestion(db.Model):
+    """清单版本 manifest：版本包含哪些问题行，以及问题在该版本中的结构"""
+    __tablename__ = 'checklist_version_question'
+    checklist_id = db.Column(db.Integer, db.ForeignKey('checklist.id'), primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('checklist_question.id'), primary_key=True, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)  # 版本内排序
+    parent_id = db.Column(db.Integer, nullable=True)  # 版本内父问题ID
+    follow_up_questions = db.Column(db.JSON)  # 版本内选项关联 { "0": [5] }
+
+class IdSequence(db.Model):
+    """hi/lo 主键号段表，name 为目标表名"""
+    __tablename__ = 'id_sequence'
+    name = db.Column(db.String(64), primary_key=True)
+    next_val = db.Column(db.BigInteger, nullable=False)  # 下一个可领取的号段起点
+
 class ChecklistAnswer(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, default=allocated_id('checklist_answer'))
     checklist_decision_id = db.Column(db.Integer, db.ForeignKey('checklist_decision.id'), nullable=False)
     question_id = db.Column(db.Integer, db.ForeignKey('checklist_question.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # 记录回答用户
@@ -247,7 +324,7 @@ class ChecklistAnswer(db.Model):
     referenced_platform_articles = db.Column(db.String(255), nullable=True) 
     answer = db.Column(db.Text, nullable=False)
 
-class ChecklistDecision(db.Model):
+class ChecklistDecision(SoftDeleteMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     checklist_id = db.Column(db.Integer, db.ForeignKey('checklist.id'), nullable=False)
     user_id = db.Column(db.Integer,db.ForeignKey('user.id'), nullable=False)
@@ -256,6 +333,9 @@ class ChecklistDecision(db.Model):
     final_decision = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=dt.utcnow)
     user = db.relationship('User', backref='checklist_decisions')
+    __table_args__ = (
+        db.Index('ix_checklist_decision_user_created', 'user_id', 'created_at', 'id'),  # 决策列表键集分页
+    )
 
 
 
@@ -268,6 +348,90 @@ class Review(db.Model):
     referenced_platform_articles = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=dt.utcnow)
 
+class DecisionAnswerTally(db.Model):
+    """决策回答计票：选择题按答案取值计数，其他题型 answer_key 为空串，只统计回答数"""
+    __tablename__ = 'decision_answer_tally'
+    decision_id = db.Column(db.Integer, db.ForeignKey('checklist_decision.id'), primary_key=True)
+    question_id = db.Column(db.Integer, primary_key=True)
+    answer_key = db.Column(db.String(191), primary_key=True, default='')
+    vote_count = db.Column(db.Integer, nullable=False, default=0)
+
+class DecisionRespondent(db.Model):
+    """已提交回答的成员"""
+    __tablename__ = 'decision_respondent'
+    decision_id = db.Column(db.Integer, db.ForeignKey('checklist_decision.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    answered_at = db.Column(db.DateTime, default=dt.utcnow)
+
+class ChecklistStats(db.Model):
+    """清单版本统计，随决策写入增量维护"""
+    __tablename__ = 'checklist_stats'
+    checklist_id = db.Column(db.Integer, db.ForeignKey('checklist.id'), primary_key=True)
+    decision_count = db.Column(db.Integer, nullable=False, default=0)
+    last_activity_at = db.Column(db.DateTime)
+
+class DecisionStats(db.Model):
+    """决策统计，随回答、复盘写入增量维护"""
+    __tablename__ = 'decision_stats'
+    decision_id = db.Column(db.Integer, db.ForeignKey('checklist_decision.id'), primary_key=True)
+    answer_count = db.Column(db.Integer, nullable=False, default=0)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    last_activity_at = db.Column(db.DateTime)
+
+class UserDecisionStats(db.Model):
+    """用户决策统计（仪表盘），只计入未删除的决策"""
+    __tablename__ = 'user_decision_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    decision_count = db.Column(db.Integer, nullable=False, default=0)
+    answer_count = db.Column(db.Integer, nullable=False, default=0)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    last_activity_at = db.Column(db.DateTime)
+
+class ArticleReference(db.Model):
+    """回答、复盘引用文章的关系表，替代逗号分隔的 referenced_articles 字段"""
+    __tablename__ = 'article_reference'
+    id = db.Column(db.Integer, primary_key=True)
+    decision_id = db.Column(db.Integer, db.ForeignKey('checklist_decision.id'), nullable=False, index=True)
+    source_type = db.Column(db.Enum('answer', 'review', name='article_reference_source'), nullable=False)
+    source_id = db.Column(db.Integer, nullable=False)  # ChecklistAnswer.id 或 Review.id
+    article_type = db.Column(db.Enum('article', 'platform_article', name='article_reference_type'), nullable=False)
+    article_id = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('source_type', 'source_id', 'article_type', 'article_id', name='uq_article_reference'),
+        db.Index('ix_article_reference_article', 'article_type', 'article_id', 'decision_id'),  # 查询引用某文章的决策
+    )
+
+class ArticleTag(db.Model):
+    """文章标签索引表：tags 字段拆分后的标签，用于按标签过滤和统计"""
+    __tablename__ = 'article_tag'
+    article_type = db.Column(db.Enum('article', 'platform_article', name='article_tag_type'), primary_key=True)
+    article_id = db.Column(db.Integer, primary_key=True)
+    tag = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, default=0)  # 文章所有者，平台文章为 0
+    __table_args__ = (
+        db.Index('ix_article_tag_owner', 'article_type', 'user_id', 'tag', 'article_id'),  # 按标签过滤和统计
+    )
+
+class StoredObject(db.Model):
+    """通过预签名 URL 直传到 MinIO 的对象：签发时为 pending，完成回调校验后为 ready"""
+    __tablename__ = 'stored_object'
+    id = db.Column(db.String(32), primary_key=True)  # 上传凭证，随机生成
+    user_id = db.Column(db.Integer, nullable=True)  # 上传用户，未登录上传为空
+    business_type = db.Column(db.String(20), nullable=False)
+    staging_name = db.Column(db.String(255), nullable=False)  # 预签名 POST 表单限定的暂存路径
+    object_name = db.Column(db.String(255), nullable=False, unique=True)  # 校验通过后的正式路径
+    original_filename = db.Column(db.String(255), nullable=False)
+    declared_size = db.Column(db.Integer, nullable=False)  # 签发时声明的大小，完成时实际大小不能超过
+    size = db.Column(db.Integer, nullable=True)
+    etag = db.Column(db.String(64), nullable=True)
+    status = db.Column(db.Enum('pending', 'ready', name='stored_object_status'), nullable=False, default='pending')
+    created_at = db.Column(db.DateTime, default=dt.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)  # 预签名上传表单的过期时间
+    completed_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (
+        db.Index('ix_stored_object_pending', 'status', 'expires_at'),  # 清理过期未完成的上传
+    )
+
 class Feedback(db.Model):
     __tablename__ = 'feedback'
     id = db.Column(db.Integer, primary_key=True)
@@ -1,5 +1,8 @@
+import hashlib
+import re
+from datetime import timezone
 from functools import wraps
-from flask import jsonify
+from flask import Response, jsonify, make_response, request
 from shared_models import TodoItem
 from flask_login import current_user
 
@@ -18,3 +21,143 @@ def check_todo_permission(func):
             return jsonify({'error': 'You are not allowed to access this Todo'}), 403
         return func(*args, **kwargs, todo=todo)  # 传递 todo 对象以避免重复查询
     return decorated_function
+
+# 结构字符、引号和反斜杠，每个字节只匹配一次（单字符类没有回溯）
+_JSON_SPECIAL = re.compile(rb'["\\\[\]{},]')
+
+
+def read_limited_body(stream, max_bytes):
+    """最多读取 max_bytes 字节的请求体，超出时返回 None（兼容没有 Content-Length 的分块请求）"""
+    chunks = []
+    size = 0
+    while True:
+        chunk = stream.read(min(65536, max_bytes + 1 - size))
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+
+
+def check_json_structure(body, max_depth=None, max_array_length=None):
+    """
+    在解析前单遍扫描 JSON 结构：嵌套深度和每个数组的元素个数，不构造任何对象。
+    记录是否在字符串内和转义状态，字符串中的结构字符不计入；扫描时间与请求体长度成线性关系。
+    :return: 超出限制时返回错误信息，否则返回 None
+    """
+    stack = []  # 每层: [是否数组, 已出现的元素分隔符数]
+    in_string = False
+    escaped_until = 0  # 反斜杠转义的下一个字节的位置之后
+    for match in _JSON_SPECIAL.finditer(body):
+        position = match.start()
+        if position < escaped_until:
+            continue
+        token = match.group()
+        if in_string:
+            if token == b'\\':
+                escaped_until = position + 2
+            elif token == b'"':
+                in_string = False
+            continue
+        if token == b'"':
+            in_string = True
+        elif token in (b'[', b'{'):
+            stack.append([token == b'[', 0])
+            if max_depth is not None and len(stack) > max_depth:
+                return f'JSON nesting exceeds {max_depth} levels'
+        elif token in (b']', b'}'):
+            if stack:
+                stack.pop()
+        elif token == b',' and stack and stack[-1][0]:
+            stack[-1][1] += 1
+            if max_array_length is not None and stack[-1][1] + 1 > max_array_length:
+                return f'JSON array exceeds {max_array_length} items'
+    return None
+
+
+def json_limits(max_bytes, max_depth=None, max_array_length=None):
+    """
+    在 request.get_json() 解析之前限制请求体：
+    Content-Length 超限直接拒绝（413）；否则最多读取 max_bytes 字节，扫描嵌套深度和数组长度（超限返回 400），
+    全部通过后才交给视图函数解析，超限的请求不会占用解析的 CPU 和内存。
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            if request.content_length is not None and request.content_length > max_bytes:
+                return jsonify({'error': f'Request body too large (max {max_bytes} bytes)'}), 413
+            body = read_limited_body(request.stream, max_bytes)
+            if body is None:
+                return jsonify({'error': f'Request body too large (max {max_bytes} bytes)'}), 413
+            if error := check_json_structure(body, max_depth, max_array_length):
+                return jsonify({'error': error}), 400
+            # 已读取的请求体交给 werkzeug 缓存，视图中的 request.get_json() 直接解析它
+            request._cached_data = body
+            return func(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _stamp_etag(version):
+    """版本标识加上请求路径（含查询参数）和当前用户，不同分页、搜索条件和用户的 ETag 互不相同"""
+    user_id = current_user.get_id() if current_user.is_authenticated else ''
+    seed = f"{request.full_path}|{user_id}|{version!r}"
+    return hashlib.sha1(seed.encode('utf-8')).hexdigest()
+
+
+def _http_time(value):
+    """数据库中的 UTC 时间转为 HTTP 日期（精确到秒）"""
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def _not_modified(etag, last_modified):
+    # 有 If-None-Match 时忽略 If-Modified-Since（RFC 9110）
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def _add_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # 客户端可以缓存，但每次使用前必须重新验证
+    response.cache_control.no_cache = True
+    response.cache_control.private = current_user.is_authenticated
+    return response
+
+
+def conditional_get(stamp=None):
+    """
+    条件 GET：为响应生成弱 ETag 和 Last-Modified，If-None-Match / If-Modified-Since 匹配时返回 304。
+    stamp(**view_args) 只查询版本列，返回 (版本标识, 最后修改时间) 或 None（资源不存在，交给视图处理），
+    最后修改时间必须随删除等所有变化前进，做不到时（如列表的 MAX(updated_at)）返回 None，只发送 ETag；
+    在执行视图的主查询和序列化之前判断；没有 stamp 时对视图生成的响应体计算哈希作为 ETag。
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            etag = last_modified = None
+            if stamp is not None:
+                version = stamp(**kwargs)
+                if version is not None:
+                    etag = _stamp_etag(version[0])
+                    last_modified = _http_time(version[1])
+                    if _not_modified(etag, last_modified):
+                        return _add_validators(Response(status=304), etag, last_modified)
+
+            response = make_response(func(*args, **kwargs))
+            if response.status_code not in (200, 206) or (etag is None and response.is_streamed):
+                return response
+            if etag is None:
+                etag = hashlib.sha1(response.get_data()).hexdigest()
+                if _not_modified(etag, None):
+                    return _add_validators(Response(status=304), etag, None)
+            return _add_validators(response, etag, last_modified)
+        return decorated_function
+    return decorator